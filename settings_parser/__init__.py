@@ -14,4 +14,5 @@ from settings_parser.util import SettingsFileError, SettingsFileWarning
 from settings_parser.util import SettingsExtraValueWarning
 
 __all__ = ["Settings", "Value", "DictValue", 'Kind',
-           'SettingsValueError', 'SettingsExtraValueWarning']
\ No newline at end of file
+           'SettingsValueError', 'SettingsExtraValueWarning',
+           'SettingsFileError', 'SettingsFileWarning']
\ No newline at end of file
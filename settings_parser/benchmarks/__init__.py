@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of settings_parser.
+
+Run the suite with: python -m settings_parser.benchmarks --output results.json
+(or settings_parser_benchmarks if installed), see suite.py.
+The memory used by the schemas: python -m settings_parser.benchmarks.memory
+The file format backends: python -m settings_parser.benchmarks.formats
+Large YAML files: python -m settings_parser.benchmarks.large_yaml --megabytes 200
+"""
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""
+Run the benchmark suite: python -m settings_parser.benchmarks --help
+"""
+from settings_parser.benchmarks.suite import main
+
+main()
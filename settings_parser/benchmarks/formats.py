@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Time and peak memory of loading the same document with each file format.
+
+Run with: python -m settings_parser.benchmarks.formats --output results.json
+"""
+import sys
+import json
+import argparse
+import warnings
+from typing import Dict, List, Any, Optional
+
+from settings_parser.settings import Loader, _formats
+from settings_parser.benchmarks.suite import _measure, _environment, dump_yaml
+
+DEFAULT_SIZES = [100, 1000, 10000]
+
+
+def document(size: int) -> Dict[str, Any]:
+    '''A document with size people and a matrix with size rows.'''
+    return {'version': 1,
+            'people': {'person{}'.format(num): {'age': num % 100, 'city': 'city'}
+                       for num in range(size)},
+            'matrix': [[num, num + 1, num + 2] for num in range(size)]}
+
+def _toml_value(value: Any) -> str:
+    '''Return the value as TOML, dictionaries are inline tables.'''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return json.dumps(value)
+    if isinstance(value, list):
+        return '[' + ', '.join(_toml_value(item) for item in value) + ']'
+    return '{' + ', '.join('{} = {}'.format(key, _toml_value(item))
+                           for key, item in value.items()) + '}'
+
+def dump(data: Dict[str, Any], file_format: str) -> str:
+    '''Return the data as text in the format.'''
+    if file_format == 'json':
+        return json.dumps(data)
+    if file_format == 'toml':
+        return ''.join('{} = {}\n'.format(key, _toml_value(value)) for key, value in data.items())
+    return dump_yaml(data)
+
+def run(sizes: Optional[List[int]] = None, repeat: int = 3) -> Dict[str, Any]:
+    '''Load the document of each size with all the formats that can be loaded here,
+        return the results and information about the environment.'''
+    results = []  # type: List[Dict[str, Any]]
+    for size in sizes or DEFAULT_SIZES:
+        data = document(size)
+        for file_format in sorted(_formats):
+            text = dump(data, file_format)
+            loader = Loader()
+            function = lambda: loader.load_settings_stream(text, file_format)  # noqa: E731
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    seconds, peak_memory = _measure(function, repeat)
+            except Exception as exc:  # pylint: disable=W0703
+                # the backend is not installed
+                print('{} skipped: {}'.format(file_format, exc), file=sys.stderr)
+                continue
+            results.append({'case': 'document', 'operation': file_format, 'size': size,
+                            'bytes': len(text.encode('utf-8')),
+                            'seconds': seconds, 'peak_memory': peak_memory})
+    environment = _environment()
+    environment['results'] = results
+    return environment
+
+def main(argv: Optional[List[str]] = None) -> None:
+    '''Run the benchmark and write the results as JSON.'''
+    parser = argparse.ArgumentParser(prog='python -m settings_parser.benchmarks.formats',
+                                     description='Compare the file format backends.')
+    parser.add_argument('-o', '--output', help='JSON file with the results, default: stdout')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='number of people and matrix rows in the document')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='the best time of this number of runs is reported')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.repeat)
+    for result in results['results']:
+        print('{operation:>5} {size:>7}: {seconds:.4f} s, {peak_memory:>11} bytes'.format(
+            **result), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'wt') as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Parse time and peak memory (RSS) of loading a large YAML file of numeric tables
+with the pure Python parser and with libyaml, composing the nodes as ruamel.yaml does
+or constructing the objects from the events (see yaml_events).
+Each load runs in a new process, so the peak RSS of each one is measured separately.
+
+Run with: python -m settings_parser.benchmarks.large_yaml --megabytes 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict, List, Any, Optional
+
+from settings_parser.settings import Loader, _open_settings_file
+from settings_parser.benchmarks.suite import _environment
+from settings_parser.util import temp_filename
+
+# how each file is loaded: (pure Python parser, constructed from the events)
+# compose is the way ruamel.yaml loads a document, building all the nodes first
+LOADERS = {'pure-compose': (True, False),
+           'pure-events': (True, True),
+           'libyaml-compose': (False, False),
+           'libyaml-events': (False, True)}
+
+ROW_LENGTH = 10
+
+# run in a new process to load each file
+_MODULE = 'settings_parser.benchmarks.large_yaml'
+
+
+def write_tables(file: Any, megabytes: float) -> None:
+    '''Write tables of floats to the open text file until it has the given size.'''
+    size = int(megabytes * 1024**2)
+    written = 0
+    table = 0
+    while written < size:
+        lines = ['table{}:\n'.format(table)]
+        for num in range(1000):
+            row = ', '.join(str(num * 0.5 + col) for col in range(ROW_LENGTH))
+            lines.append('- [{}]\n'.format(row))
+        text = ''.join(lines)
+        file.write(text)
+        written += len(text)
+        table += 1
+
+def max_rss() -> int:
+    '''Return the peak resident memory of this process in bytes, or -1 if it's not known.'''
+    try:
+        import resource
+    except ImportError:  # pragma: no cover
+        return -1
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes in Linux, bytes in macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def load(filename: str, loader_name: str) -> Dict[str, Any]:
+    '''Load the file with the loader and return the time and peak RSS.'''
+    from settings_parser import yaml_events
+    pure, events = LOADERS[loader_name]
+    loader = Loader(pure)
+    start_rss = max_rss()
+    start = time.perf_counter()
+    with _open_settings_file(filename) as file:
+        if events:
+            yaml_events.load(file, loader._yaml)
+        else:
+            loader.load_settings_stream(file, 'yaml', name=filename)
+    return {'seconds': time.perf_counter() - start,
+            'start_rss': start_rss, 'peak_rss': max_rss()}
+
+def run(megabytes: float, loaders: Optional[List[str]] = None) -> Dict[str, Any]:
+    '''Load a file of the size in megabytes with each loader (all by default) in a new process,
+        return the results and information about the environment.'''
+    results = []  # type: List[Dict[str, Any]]
+    with temp_filename('') as filename:
+        with open(filename, 'wt') as file:
+            write_tables(file, megabytes)
+        file_size = os.path.getsize(filename)
+        for loader_name in loaders or sorted(LOADERS):
+            output = subprocess.check_output([sys.executable, '-m', _MODULE,
+                                              '--load', filename, loader_name])
+            result = json.loads(output.decode())
+            result.update({'case': 'large_yaml', 'operation': loader_name, 'size': file_size})
+            results.append(result)
+    environment = _environment()
+    environment['results'] = results
+    return environment
+
+def main(argv: Optional[List[str]] = None) -> None:
+    '''Run the benchmark and write the results as JSON.'''
+    parser = argparse.ArgumentParser(prog='python -m settings_parser.benchmarks.large_yaml',
+                                     description='Load a large YAML file with each loader.')
+    parser.add_argument('-o', '--output', help='JSON file with the results, default: stdout')
+    parser.add_argument('-m', '--megabytes', type=float, default=200,
+                        help='size of the YAML file')
+    parser.add_argument('-l', '--loaders', nargs='+', choices=sorted(LOADERS),
+                        help='loaders to run, default: all')
+    parser.add_argument('--load', nargs=2, metavar=('FILENAME', 'LOADER'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.load:
+        json.dump(load(*args.load), sys.stdout)
+        return
+
+    results = run(args.megabytes, args.loaders)
+    for result in results['results']:
+        print('{operation:>15} {size:>11} bytes: {seconds:.3f} s, '
+              'peak RSS {peak_rss:>11} bytes'.format(**result), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'wt') as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+if __name__ == '__main__':
+    main()
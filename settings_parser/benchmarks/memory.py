@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Memory used by the schema nodes: Values, NamedValues and DictValues.
+
+Run with: python -m settings_parser.benchmarks.memory [number of nodes]
+"""
+import sys
+import tracemalloc
+from typing import Dict, List, Tuple, Callable, Any
+
+from settings_parser import Value, DictValue
+
+
+def _channel_values(num_nodes: int) -> Dict[str, Value]:
+    '''Schema with a Value for each channel, as generated per-channel definitions.'''
+    return {'channel{}'.format(num): Value(List[float], val_min=0)
+            for num in range(num_nodes)}
+
+def _allocated(function: Callable[[], Any]) -> Tuple[int, Any]:
+    '''Return the bytes allocated by function that are still in use, and its result.'''
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return after - before, result
+
+def run(num_nodes: int = 10000) -> Dict[str, float]:
+    '''Return the bytes per node of the Values, the DictValue built with them,
+        and the compiled validators of the DictValue.'''
+    keys = ['channel{}'.format(num) for num in range(num_nodes)]
+    values_bytes, values = _allocated(lambda: _channel_values(num_nodes))
+    dict_value_bytes, dict_value = _allocated(lambda: DictValue(values))
+    config = {key: [1.0] for key in keys}
+    # only the validators compiled on first use are kept, not the validated dictionary
+    plan_bytes, _ = _allocated(lambda: dict_value.validate(config) and None)
+    return {'Value': values_bytes / num_nodes,
+            'DictValue': dict_value_bytes / num_nodes,
+            'validators': plan_bytes / num_nodes}
+
+def main() -> None:
+    '''Print the bytes per node.'''
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for name, node_bytes in run(num_nodes).items():
+        print('{}: {:.0f} bytes per node'.format(name, node_bytes))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite: time and peak memory of validating representative schemas at growing sizes.
+
+Run with: python -m settings_parser.benchmarks --output results.json
+"""
+import os
+import sys
+import time
+import json
+import platform
+import tracemalloc
+import warnings
+import argparse
+from functools import partial
+from typing import Dict, List, Tuple, Union, Callable, Any, NamedTuple, Optional
+
+import ruamel.yaml as yaml
+
+from settings_parser import Settings, Value, DictValue, VERSION
+from settings_parser import parallel
+from settings_parser.settings import Loader
+from settings_parser.util import temp_filename
+
+# sizes used by default, the number of settings or elements of each case
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# a schema shape: it returns the Values, a configuration of the given size
+# and the key of the setting validated with Value.validate
+Case = NamedTuple('Case', [('name', str),
+                           ('build', Callable[[int], Tuple[Dict, Dict, str]])])
+Case.__doc__ = '''A schema shape of the benchmark suite.'''
+
+
+def flat_scalars(size: int) -> Tuple[Dict, Dict, str]:
+    '''size settings of simple types.'''
+    types = [int, float, str, bool]
+    values = {'key{}'.format(num): types[num % len(types)]
+              for num in range(size)}  # type: Dict[str, Any]
+    config = {'key{}'.format(num): types[num % len(types)](num) for num in range(size)}
+    values['key0'] = Value(int, val_min=0)
+    return values, config, 'key0'
+
+def nested_dictvalue(size: int, depth: int = 10) -> Tuple[Dict, Dict, str]:
+    '''DictValues nested depth levels, with size settings in total.'''
+    width = max(size // depth, 1)
+    values = {}  # type: Dict[str, Any]
+    config = {}  # type: Dict[str, Any]
+    for level in range(depth):
+        level_values = {'key{}'.format(num): int for num in range(width)}  # type: Dict[str, Any]
+        level_config = {'key{}'.format(num): num for num in range(width)}  # type: Dict[str, Any]
+        if level:
+            level_values['child'] = DictValue(values)
+            level_config['child'] = config
+        values, config = level_values, level_config
+    values['child'] = Value(values.pop('child'))
+    return values, config, 'child'
+
+def list_of_lists(size: int, row_length: int = 10) -> Tuple[Dict, Dict, str]:
+    '''A List[List[int]] with size rows of row_length ints.'''
+    values = {'matrix': Value(List[List[int]], val_min=0, len_max=[None, row_length])}
+    config = {'matrix': [list(range(row_length)) for _ in range(size)]}
+    return values, config, 'matrix'
+
+def people(size: int) -> Tuple[Dict, Dict, str]:
+    '''A Dict[str, DictValue] with size people, as in settings_config.py'''
+    person = DictValue({'age': int, 'city': str})
+    values = {'people': Value(Dict[str, person])}  # type: ignore
+    config = {'people': {'person{}'.format(num): {'age': num % 100, 'city': 'city'}
+                         for num in range(size)}}
+    return values, config, 'people'
+
+def wide_union(size: int) -> Tuple[Dict, Dict, str]:
+    '''A list of size elements validated with a Union of many types.'''
+    union = Union[List[int], Dict[str, int], Tuple[int, int], bool, float, int, str]
+    values = {'items': Value(List[union])}
+    samples = [[1, 2], {'a': 1}, 1.5, 3, 'text', True]
+    config = {'items': [samples[num % len(samples)] for num in range(size)]}
+    return values, config, 'items'
+
+CASES = [Case('flat_scalars', flat_scalars),
+         Case('nested_dictvalue', nested_dictvalue),
+         Case('list_of_lists', list_of_lists),
+         Case('people', people),
+         Case('wide_union', wide_union)]
+
+
+def _measure(function: Callable[[], Any], repeat: int) -> Tuple[float, int]:
+    '''Return the best time of repeat calls to function, and the peak memory of one more call.
+        The memory is measured separately because tracing slows down the function.'''
+    best_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best_time = min(best_time, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best_time, peak_memory
+
+def dump_yaml(data: Any) -> str:
+    '''Return the data as YAML text in block style.'''
+    from io import StringIO
+    dumper = yaml.YAML(typ='safe')
+    dumper.default_flow_style = False
+    stream = StringIO()
+    dumper.dump(data, stream)
+    return stream.getvalue()
+
+def run_case(case: Case, size: int, repeat: int = 3) -> List[Dict[str, Any]]:
+    '''Return the results of Settings.validate, Loader.load_settings_file and Value.validate
+        for the case with the given size.'''
+    values, config, value_key = case.build(size)
+    value = values[value_key]
+    config_text = dump_yaml(config)
+
+    results = []
+    with temp_filename(config_text) as filename:
+        settings = Settings(values)
+        operations = [('Settings.validate', lambda: settings.validate(filename)),
+                      ('Loader.load_settings_file', lambda: Loader().load_settings_file(filename)),
+                      ('Value.validate', lambda: value.validate(config[value_key]))]
+        for operation, function in operations:
+            seconds, peak_memory = _measure(function, repeat)
+            results.append({'case': case.name, 'operation': operation, 'size': size,
+                            'seconds': seconds, 'peak_memory': peak_memory})
+    return results
+
+def run_parallel(size: int, workers: int = 2, repeat: int = 3) -> List[Dict[str, Any]]:
+    '''Return the results of Settings.validate_dict for the people case with the given size
+        serially and in a pool of workers threads and processes, even below
+        parallel.MIN_PARALLEL_SIZE. The pools are reused, as in Settings.'''
+    values, config, _ = people(size)
+    operations = [('Settings.validate_dict', {}),
+                  ('Settings.validate_dict (threads)', {'workers': workers, 'threads': True}),
+                  ('Settings.validate_dict (processes)', {'workers': workers})
+                 ]  # type: List[Tuple[str, Dict[str, Any]]]
+    results = []
+    old_min_size = parallel.MIN_PARALLEL_SIZE
+    parallel.MIN_PARALLEL_SIZE = 0
+    try:
+        for operation, options in operations:
+            settings = Settings(values, **options)
+            seconds, peak_memory = _measure(partial(settings.validate_dict, config), repeat)
+            results.append({'case': 'people', 'operation': operation, 'size': size,
+                            'seconds': seconds, 'peak_memory': peak_memory})
+    finally:
+        parallel.MIN_PARALLEL_SIZE = old_min_size
+    return results
+
+def run(sizes: Optional[List[int]] = None, cases: Optional[List[str]] = None,
+        repeat: int = 3, workers: int = 0) -> Dict[str, Any]:
+    '''Run the benchmarks of the cases (all by default) with the sizes,
+        and run_parallel with that many workers if it's not 0,
+        return the results and information about the environment.'''
+    sizes = sizes or DEFAULT_SIZES
+    results = []  # type: List[Dict[str, Any]]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for case in CASES:
+            if cases and case.name not in cases:
+                continue
+            for size in sizes:
+                results.extend(run_case(case, size, repeat))
+        if workers:
+            for size in sizes:
+                results.extend(run_parallel(size, workers, repeat))
+    environment = _environment()
+    environment['results'] = results
+    return environment
+
+def _environment() -> Dict[str, Any]:
+    '''Return the versions, platform and time of the benchmarks.'''
+    return {'settings_parser': VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def main(argv: Optional[List[str]] = None) -> None:
+    '''Run the benchmarks and write the results as JSON.'''
+    parser = argparse.ArgumentParser(prog='python -m settings_parser.benchmarks',
+                                     description='Benchmarks of settings_parser.')
+    parser.add_argument('-o', '--output', help='JSON file with the results, default: stdout')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='sizes of the configurations')
+    parser.add_argument('-c', '--cases', nargs='+', choices=[case.name for case in CASES],
+                        help='cases to run, default: all')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='the best time of this number of runs is reported')
+    parser.add_argument('-p', '--parallel', type=int, default=0, metavar='WORKERS',
+                        help='also validate in parallel with this many workers')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.cases, args.repeat, args.parallel)
+    for result in results['results']:
+        print('{case:>16} {operation:>25} {size:>7}: {seconds:.4f} s, '
+              '{peak_memory:>11} bytes'.format(**result), file=sys.stderr)
+    if args.output:
+        with open(args.output, 'wt') as file:
+            json.dump(results, file, indent=2)
+        print('Results written to {}.'.format(os.path.abspath(args.output)), file=sys.stderr)
+    else:
+        json.dump(results, sys.stdout, indent=2)
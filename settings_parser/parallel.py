@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Validate the sections of the settings in parallel, see Settings(..., workers=N).
+
+Each section is a task, large mappings and lists are split into tasks of CHUNK_SIZE entries.
+The tasks run in a pool of processes or threads, then the results are put together
+in the order of the Values: the settings, the warnings and the first error
+are the same as validating one section after the other.
+Configurations with less than MIN_PARALLEL_SIZE entries are validated serially,
+starting the tasks costs more than it saves. The pools are kept and reused,
+until shutdown is called or the interpreter exits.
+
+This module is imported only when validating in parallel.
+"""
+import atexit
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, List, Tuple, Any, AbstractSet, Optional, Union, Generator, cast
+
+from settings_parser.util import record_warnings, warn, _diagnostics
+from settings_parser.value import DictValue, Value, _MappingNode, _SequenceNode
+
+# mappings and lists with more entries than this are validated in chunks of this size
+CHUNK_SIZE = 5000
+# configurations with less entries (counting the items of the sections) are validated serially,
+# the pools only pay off with a few chunks for each worker, see run_parallel in benchmarks/suite.py
+MIN_PARALLEL_SIZE = 4*CHUNK_SIZE
+# number of pools kept for later calls, the least recently used are closed
+MAX_POOLS = 4
+
+# a task: the index of the NamedValue in the DictValue, the kind of task
+# ('section', 'entries' or 'elements') and the value, entries or elements to validate
+Task = Tuple[int, str, Any]
+# the result of a task: the validated value, the error and the warnings (category, message)
+TaskResult = Tuple[Any, Optional[Exception], List[Tuple[type, str]]]
+
+
+def tasks(dict_value: DictValue, config_dict: Dict,
+          keys: Optional[AbstractSet] = None) -> List[Task]:
+    '''Return the tasks to validate the sections of config_dict (only keys if given),
+        in the order of the Values.'''
+    task_list = []  # type: List[Task]
+    for index, val in enumerate(dict_value.values_list):
+        if keys is not None and val.key not in keys:
+            continue
+        # skip optional values that aren't present, as DictValue.validate does
+        if val.kind is not Value.mandatory and (val.key not in config_dict or
+                                                config_dict[val.key] is None):
+            continue
+        value = config_dict[val.key]
+        plan = val.plan
+        if isinstance(plan, _MappingNode) and isinstance(value, dict) and len(value) > CHUNK_SIZE:
+            entries = list(value.items())
+            task_list.extend((index, 'entries', entries[start:start + CHUNK_SIZE])
+                             for start in range(0, len(entries), CHUNK_SIZE))
+        elif (isinstance(plan, _SequenceNode) and plan.streams() and
+              isinstance(value, list) and len(value) > CHUNK_SIZE):
+            task_list.extend((index, 'elements', value[start:start + CHUNK_SIZE])
+                             for start in range(0, len(value), CHUNK_SIZE))
+        else:
+            task_list.append((index, 'section', value))
+    return task_list
+
+# method of the validator that validates each kind of task
+_TASK_METHODS = {'section': 'validate', 'entries': 'validate_entries',
+                 'elements': 'validate_elements'}
+
+def validate_task(dict_value: DictValue, task: Task) -> TaskResult:
+    '''Validate the task in a worker, return the validated value, the error and the warnings.'''
+    index, kind, value = task
+    named_value = dict_value.values_list[index]
+    validate = getattr(named_value.plan, _TASK_METHODS[kind])
+    old_logging = _diagnostics.logging
+    # like in the calling thread, only the outermost log_exceptions_warnings logs
+    _diagnostics.logging = True
+    try:
+        with record_warnings() as warn_list:
+            try:
+                result = named_value._validate_section(validate, value)
+                error = None
+            except Exception as exc:  # pylint: disable=W0703
+                result, error = None, exc
+    finally:
+        _diagnostics.logging = old_logging
+    return result, error, [(warning.category, str(warning.message)) for warning in warn_list]
+
+def merge(dict_value: DictValue, task_list: List[Task], results: List[TaskResult]) -> Dict:
+    '''Return the validated dictionary with the results of the tasks.
+        The warnings are issued again in order, until the first error, which is raised.'''
+    values_list = dict_value.values_list
+    parsed_dict = {}  # type: Dict
+    for number, ((index, kind, _), (result, error, warning_list)) in enumerate(zip(task_list,
+                                                                                   results)):
+        for category, message in warning_list:
+            warn(message, category)
+        if error is not None:
+            raise error
+        named_value = values_list[index]
+        if kind == 'section':
+            parsed_dict[named_value.key] = result
+            continue
+        if kind == 'entries':
+            parsed_dict.setdefault(named_value.key, {}).update(result)
+        else:
+            parsed_dict.setdefault(named_value.key, []).extend(result)
+        # last chunk of the section
+        if number + 1 == len(task_list) or task_list[number + 1][0] != index:
+            plan = cast(Union[_MappingNode, _SequenceNode], named_value.plan)
+            parsed_dict[named_value.key] = named_value._validate_section(
+                plan.finish, parsed_dict[named_value.key])
+    return parsed_dict
+
+def validate(dict_value: DictValue, config_dict: Dict, keys: Optional[AbstractSet] = None,
+             workers: Optional[int] = None, threads: bool = False) -> Dict:
+    '''Validate the sections of config_dict (only keys if given) in a pool of workers
+        processes, or threads if threads is True. Return the validated dictionary.
+        The Values must be picklable to use processes, they are sent to each one only once.
+        The pool is kept for the next calls with the same Values, see _shared_pool.
+        Small configurations (see MIN_PARALLEL_SIZE) and the ones validated inside
+        a daemon process (ie: a validate_many worker) are validated serially.'''
+    task_list = tasks(dict_value, config_dict, keys)
+    if (len(task_list) < 2 or size(task_list) < MIN_PARALLEL_SIZE or
+            multiprocessing.current_process().daemon):
+        results = [validate_task(dict_value, task) for task in task_list]
+    elif threads:
+        with _shared_pool(dict_value, workers, threads) as pool:
+            results = pool.map(partial(validate_task, dict_value), task_list, chunksize=1)
+    else:
+        with _shared_pool(dict_value, workers, threads) as pool:
+            results = pool.map(_validate_worker_task, task_list, chunksize=1)
+    return merge(dict_value, task_list, results)
+
+def size(task_list: List[Task]) -> int:
+    '''Return the number of entries of the tasks: the items of mappings and lists,
+        1 for other values.'''
+    return sum(len(value) if isinstance(value, (dict, list)) else 1 for _, _, value in task_list)
+
+
+class _SharedPool():
+    '''A pool kept between calls to validate, the Values of its processes
+        and how many calls are using it.'''
+    __slots__ = ['pool', 'dict_value', 'users', 'kept']
+
+    def __init__(self, pool: Any, dict_value: DictValue) -> None:
+        self.pool = pool
+        # the Values also keep their id from being reused while the pool is kept
+        self.dict_value = dict_value
+        self.users = 0
+        self.kept = True
+
+
+# pools kept for later calls by the number of workers, threads and the id of the Values
+_pools = OrderedDict()  # type: OrderedDict[Tuple, _SharedPool]
+_pools_lock = threading.Lock()
+
+def _new_pool(dict_value: DictValue, workers: Optional[int], threads: bool) -> Any:
+    '''Return a new pool of workers threads or processes with the Values.'''
+    if threads:
+        return ThreadPool(workers)
+    return multiprocessing.Pool(workers, initializer=_init_worker, initargs=(dict_value,))
+
+@contextmanager
+def _shared_pool(dict_value: DictValue, workers: Optional[int],
+                 threads: bool) -> Generator[Any, None, None]:
+    '''Return a pool of workers threads or processes, reused by later calls with the same
+        arguments. The processes have the Values, so they are reused only if they are frozen,
+        otherwise the pool is used only once. Only MAX_POOLS pools are kept.'''
+    if not threads and not dict_value._frozen:
+        with _new_pool(dict_value, workers, threads) as pool:
+            yield pool
+        return
+    key = (workers, True) if threads else (workers, False, id(dict_value))
+    with _pools_lock:
+        shared = _pools.get(key)
+        if shared is None:
+            shared = _SharedPool(_new_pool(dict_value, workers, threads), dict_value)
+            _pools[key] = shared
+        _pools.move_to_end(key)
+        shared.users += 1
+        unused = []
+        while len(_pools) > MAX_POOLS:
+            _, old_shared = _pools.popitem(last=False)
+            old_shared.kept = False
+            if not old_shared.users:
+                unused.append(old_shared.pool)
+    for pool in unused:
+        pool.terminate()
+    try:
+        yield shared.pool
+    finally:
+        with _pools_lock:
+            shared.users -= 1
+            unused_pool = not shared.kept and not shared.users
+        if unused_pool:
+            shared.pool.terminate()
+
+def shutdown() -> None:
+    '''Close the pools kept for later calls, the ones in use are closed when they finish.
+        It's called when the interpreter exits.'''
+    with _pools_lock:
+        unused = []
+        for shared in _pools.values():
+            shared.kept = False
+            if not shared.users:
+                unused.append(shared.pool)
+        _pools.clear()
+    for pool in unused:
+        pool.terminate()
+
+atexit.register(shutdown)
+
+
+# Values used by the worker processes
+_worker_dict_value = None  # type: Optional[DictValue]
+
+def _init_worker(dict_value: DictValue) -> None:
+    '''Store the Values in the worker, they are sent only once.'''
+    global _worker_dict_value  # pylint: disable=W0603
+    _worker_dict_value = dict_value
+
+def _validate_worker_task(task: Task) -> TaskResult:
+    '''Validate the task in a worker process, see validate_task.'''
+    return validate_task(cast(DictValue, _worker_dict_value), task)
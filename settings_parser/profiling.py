@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Time spent parsing and validating each setting.
+
+Use profile() as a context manager, or Settings(..., profile=True).
+Nothing is recorded, and there's no overhead, outside of it.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Any, Callable, Generator, NamedTuple, Hashable, Optional, cast
+
+
+ProfileEntry = NamedTuple('ProfileEntry', [('path', str),
+                                           ('seconds', float),
+                                           ('calls', int),
+                                           ('nodes', int),
+                                           ('elements', int)])
+ProfileEntry.__doc__ = '''Validation of a setting: its dotted path, the total wall time
+    (including nested settings), the number of times it was validated,
+    the number of nodes of its compiled validator and the number of elements validated.'''
+
+
+class Profile():
+    '''Time spent parsing each file and validating each setting, see profile().
+        Nested settings have a dotted path, ie: section.subsection.'''
+
+    def __init__(self) -> None:
+        # path: [seconds, calls, nodes, elements]
+        self._entries = {}  # type: dict
+        # name of the file: seconds
+        self.parse_times = {}  # type: dict
+        self._lock = threading.Lock()
+
+    def add(self, path: str, seconds: float, nodes: int, elements: int) -> None:
+        '''Add a validation of the setting with this path.'''
+        with self._lock:
+            entry = self._entries.setdefault(path, [0.0, 0, nodes, 0])
+            entry[0] += seconds
+            entry[1] += 1
+            entry[3] += elements
+
+    def add_parse(self, name: str, seconds: float) -> None:
+        '''Add the time spent parsing the file.'''
+        with self._lock:
+            self.parse_times[name] = self.parse_times.get(name, 0.0) + seconds
+
+    def report(self) -> List[ProfileEntry]:
+        '''Return the validated settings, slowest first.'''
+        with self._lock:
+            entries = [ProfileEntry(path, *entry) for path, entry in self._entries.items()]
+        return sorted(entries, key=lambda entry: (-entry.seconds, entry.path))
+
+    @property
+    def parse_seconds(self) -> float:
+        '''Total time spent parsing files.'''
+        return sum(self.parse_times.values())
+
+    def __str__(self) -> str:
+        lines = ['{:>10} {:>6} {:>6} {:>9}  {}'.format('seconds', 'calls', 'nodes',
+                                                       'elements', 'setting')]
+        lines.extend('{:10.6f} {:6d} {:6d} {:9d}  {}'.format(entry.seconds, entry.calls,
+                                                             entry.nodes, entry.elements,
+                                                             entry.path or '(all settings)')
+                     for entry in self.report())
+        lines.extend('{:10.6f} {:>6} {:>6} {:>9}  parsing {}'.format(seconds, '', '', '', name)
+                     for name, seconds in sorted(self.parse_times.items()))
+        return '\n'.join(lines)
+
+    def __repr__(self) -> str:
+        return '{}({} settings, {} files)'.format(self.__class__.__name__,
+                                                  len(self._entries), len(self.parse_times))
+
+
+class _ProfileState(threading.local):
+    '''The active profile and the path of the setting being validated in this thread.'''
+    profile = None  # type: Optional[Profile]
+    path = ''
+
+
+_state = _ProfileState()
+
+def active_profile() -> Optional[Profile]:
+    '''Return the Profile active in this thread, or None.'''
+    return _state.profile
+
+@contextmanager
+def profile(current_profile: Optional[Profile] = None) -> Generator[Profile, None, None]:
+    '''Record the time spent parsing and validating in this thread in a Profile,
+        a new one if not given, and return it. Outside of it nothing is recorded.'''
+    current_profile = current_profile or Profile()
+    old_profile, old_path = _state.profile, _state.path
+    _state.profile, _state.path = current_profile, ''
+    try:
+        yield current_profile
+    finally:
+        _state.profile, _state.path = old_profile, old_path
+
+def is_nested() -> bool:
+    '''Return True if a setting is being validated and recorded in this thread.'''
+    return bool(_state.path)
+
+def measure_validation(name: Hashable, nodes: Callable[[], int],
+                       validate: Callable[[Any], Any], value: Any) -> Any:
+    '''Validate the value of the setting with that name and record it in the active profile.
+        If the name is None, it's recorded with the path of the setting being validated,
+        or '' for all settings. nodes returns the number of nodes of the validator.'''
+    current_profile = cast(Profile, _state.profile)
+    old_path = _state.path
+    if name is None:
+        path = old_path
+    else:
+        path = '{}.{}'.format(old_path, name) if old_path else str(name)
+    _state.path = path
+    start = time.perf_counter()
+    try:
+        validated_value = validate(value)
+    finally:
+        seconds = time.perf_counter() - start
+        _state.path = old_path
+    current_profile.add(path, seconds, nodes(), count_elements(validated_value))
+    return validated_value
+
+def count_elements(value: Any) -> int:
+    '''Return the number of scalar elements in the (nested) value.'''
+    if isinstance(value, dict):
+        return sum(count_elements(item) for item in value.values())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(count_elements(item) for item in value)
+    size = getattr(value, 'size', None)  # numpy arrays
+    return size if isinstance(size, int) else 1
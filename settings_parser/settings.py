@@ -6,41 +6,96 @@ Created on Fri Oct 14 13:33:57 2016
 """
 # pylint: disable=E1101
 
-#import sys
+import sys
 import logging
-#from collections import OrderedDict
-# nice debug printing of settings
-import pprint
-import copy
-import warnings
-from typing import Dict, Union, IO, Any, Callable
+from collections import OrderedDict
+import os
+import time
+import threading
+from contextlib import contextmanager
+from operator import itemgetter
+from functools import partial
+from typing import Dict, Union, IO, Any, Generator, Set, AbstractSet, Callable, cast
+from typing import Iterable, Iterator, List, Tuple, NamedTuple, Optional, Type, TYPE_CHECKING
 
-import ruamel.yaml as yaml
+# ruamel.yaml, pprint, multiprocessing, pickle, tempfile and hashlib are imported
+# only when needed because they take a long time to import.
 
 from settings_parser.util import log_exceptions_warnings, SettingsFileError, SettingsFileWarning
-from settings_parser.util import SettingsValueError
-from settings_parser.value import Value, DictValue
+from settings_parser.util import SettingsValueError, warn, record_warnings
+from settings_parser.value import Value, DictValue, NamedValue  # pylint: disable=W0611
+from settings_parser import profiling
 
 
 class Settings(dict):
     '''Contains the user settings and a method to validate settings files.'''
 
-    def __init__(self, values_dict: Dict) -> None:  # pylint: disable=W0231
+    def __init__(self, values_dict: Union[Dict, DictValue],  # pylint: disable=W0231
+                 keep_config: str = 'text', cache_dir: Optional[str] = None,
+                 profile: bool = False, lazy: bool = False,
+                 stream_lists: bool = False, workers: Optional[int] = None, threads: bool = False,
+                 reload: bool = False) -> None:
+        '''values_dict has the Values of the settings. It can also be a DictValue.
+            A frozen DictValue (see DictValue.freeze) is shared, it's never copied:
+            create it once, eg: DictValue(values).freeze(), and give it to every Settings.
+            Other Values are copied and the copy is frozen, the caller's aren't changed.
+            keep_config controls what is stored of the original configuration:
+            'text' (all of it), 'hash' (its SHA-256) or 'none'.
+            With 'none' the file isn't read into memory before it's parsed.
+            If cache_dir is given, the validated settings are stored there and
+            validating the same configuration with the same Values again loads them directly.
+            The Values are identified by their parameters and the code of their types
+            and functions. cache_dir must be trusted, only writable by the user:
+            the cache files are loaded with pickle, which can run any code they contain.
+            If profile is True, the time spent parsing and validating each setting
+            is recorded, see profile_report.
+            If lazy is True, validating a file checks that the needed sections are present
+            and that there are no extra or exclusive ones, but the value of each section
+            is validated the first time it's accessed. See force_all.
+            With cache_dir everything is validated, to store it.
+            If stream_lists is True, the sections that are lists in YAML files
+            are validated item by item while the file is parsed, so the list of loaded items
+            is never built. Errors in those lists are found before the missing sections.
+            It's not used if lazy is True.
+            If workers is more than 1, the sections are validated in a pool of that many
+            processes (threads if threads is True), large mappings and lists in chunks.
+            The settings, warnings and errors are the same, and in the same order,
+            as validating them one after the other. Processes need picklable Values.
+            The pools are reused until parallel.shutdown or the exit, and small configurations
+            are validated serially, see parallel.MIN_PARALLEL_SIZE.
+            It's not used while profiling or to validate the sections accessed if lazy.
+            If reload is True, the loaded configuration is kept too, so reload
+            validates only the sections that changed. Otherwise it validates all of them.'''
         super(Settings, self).__init__({})
 
-        val_copy = copy.deepcopy(values_dict)
-        self._dict_value = DictValue(val_copy)
+        if keep_config not in ('text', 'hash', 'none'):
+            msg = 'keep_config must be "text", "hash" or "none", not "{}".'.format(keep_config)
+            raise SettingsValueError(msg)
+        self._keep_config = keep_config
 
-        namedvalue_list = self._dict_value.values_list
-        self._needed_values = set(namedvalue.key for namedvalue in namedvalue_list
-                                 if namedvalue.kind is Value.mandatory)
-        self._optional_values = set(namedvalue.key for namedvalue in namedvalue_list
-                                   if namedvalue.kind is Value.optional)
-        self._exclusive_values = set(namedvalue.key for namedvalue in namedvalue_list
-                                    if namedvalue.kind is Value.exclusive)
-        self._optional_values = self._optional_values | self._exclusive_values
+        self._dict_value = _frozen_values(values_dict)
 
-        self._config_file = None  # type: str
+        self._cache_dir = cache_dir
+
+        self._profile = profile
+        self._last_profile = None  # type: Optional[profiling.Profile]
+
+        # keys of the sections not validated yet and the loaded dictionary with their values
+        self._lazy = lazy
+        self._pending = set()  # type: Set
+        self._lazy_config = None  # type: Optional[Dict]
+        self._stream_lists = stream_lists
+        self._workers = workers
+        self._threads = threads
+        # sections accessed from many threads are validated only once
+        self._lock = threading.Lock()
+
+        # last validated file and its loaded dictionary (only if reload), used by reload
+        self._reload = reload
+        self._filename = None  # type: Optional[str]
+        self._file_dict = None  # type: Optional[Dict]
+
+        self._config_file = None  # type: Optional[str]
 
     def __repr__(self) -> str:
         '''Representation of a settings instance.'''
@@ -49,6 +104,8 @@ class Settings(dict):
             _dict_value = _dict_value[:-1]
             return '{}({})'.format(self.__class__.__name__, _dict_value)
         else:
+            # nice debug printing of settings
+            import pprint
             return pprint.pformat(self.settings)
 
     def __eq__(self, other: object) -> bool:
@@ -64,50 +121,14 @@ class Settings(dict):
             return NotImplemented
         return not self.__eq__(other)
 
-#    def __getstate__(self):
-#        '''For pickle'''
-#        d = self.__dict__.copy()
-#        d['val_type'] = repr(d['val_type'])
-#        return d
-#
-#    def __setstate__(self, d):
-#        '''For pickle'''
-#        print(d)
-#        d['val_type'] = eval(d['val_type'])
-#        self.__dict__ = d
-
-    @staticmethod
-    def _get_property(key: str) -> Callable:
-        '''Returns functions to get dictionary items. Used to create properties.'''
-        def _get_prop(self: 'Settings') -> Any:
-            '''Property to get values'''
+    def __getattr__(self, key: str) -> Any:
+        '''All items in the dictionary are accesible via dot notation.
+            This is only called if key isn't a normal attribute.'''
+        try:
             return self[key]
-        return _get_prop
-
-    @staticmethod
-    def _set_property(key: str) -> Callable:
-        '''Returns functions to set dictionary items. Used to create properties.'''
-        def _set_prop(self: 'Settings', value: Any) -> None:
-            '''Property to set values'''
-            self[key] = value
-        return _set_prop
-
-    @staticmethod
-    def _del_property(key: str) -> Callable:
-        '''Returns functions to delete dictionary items. Used to create properties.'''
-        def _del_prop(self: 'Settings') -> None:
-            '''Property to delete values: delete from dictionary and the property.'''
-            del self[key]
-            delattr(self.__class__, key)
-        return _del_prop
-
-    def __setitem__(self, key: str, value: Any) -> None:
-        '''All items added to the dictionary are accesible via dot notation'''
-        dict.__setitem__(self, key, value)
-        setattr(self.__class__, str(key), property(fget=self._get_property(key),
-                                              fset=self._set_property(key),
-                                              fdel=self._del_property(key),
-                                              doc=str(key)))
+        except KeyError:
+            raise AttributeError("'{}' object has no attribute or setting '{}'".format(
+                self.__class__.__name__, key)) from None
 
     def __setattr__(self, key: str, value: Any) -> None:
         '''Set attributes as items in the dictionary, accesible with dot notation'''
@@ -117,19 +138,95 @@ class Settings(dict):
         # known attributes set at __init__ are handled normally
         elif key in self.__dict__:
             dict.__setattr__(self, key, value)
-        # own dictionary key (it's a property already)
-        elif key in self:
-            getattr(self.__class__, key).fset(self, value)
-        # add unkown attributes to the dictionary
+        # add dictionary items and unkown attributes to the dictionary
+        else:
+            self[key] = value
+
+    def __delattr__(self, key: str) -> None:
+        '''Delete items in the dictionary with dot notation'''
+        if key in self.__dict__:
+            dict.__delattr__(self, key)
         else:
-            self.__setitem__(key, value)
+            try:
+                del self[key]
+            except KeyError:
+                raise AttributeError(key) from None
+
+    def __dir__(self) -> List[str]:
+        '''Include the settings in the attributes, for autocompletion.'''
+        return list(super(Settings, self).__dir__()) + [str(key) for key in self]
+
+    def _add_properties(self) -> None:
+        '''Change the class to a subclass with a fast property for each setting in the Values.
+            Other items are found by __getattr__.'''
+        base_class = getattr(type(self), '_base_class', type(self))
+        keys = tuple(namedvalue.key for namedvalue in self._dict_value.values_list)
+        dict.__setattr__(self, '__class__', _settings_class(base_class, keys,
+                                                            bool(self._pending)))
+
+    def _remove_properties(self) -> None:
+        '''Go back to the original class, the properties could refer to removed items.
+            If there are sections not validated yet, the class still validates them.'''
+        base_class = getattr(type(self), '_base_class', None)
+        if base_class is not None:
+            if self._pending:
+                base_class = _settings_class(base_class, (), True)
+            dict.__setattr__(self, '__class__', base_class)
+
+    def __delitem__(self, key: Any) -> None:
+        self._remove_properties()
+        dict.__delitem__(self, key)
+
+    def pop(self, *args: Any) -> Any:
+        self._remove_properties()
+        return dict.pop(self, *args)
+
+    def popitem(self) -> Tuple:
+        self._remove_properties()
+        return dict.popitem(self)
+
+    def clear(self) -> None:
+        self._remove_properties()
+        dict.clear(self)
+
+    def __reduce__(self) -> Tuple:
+        '''Pickle and copy the settings, the Values and the attributes.
+            The original class is pickled, the subclass with the properties
+            is created again when unpickled.'''
+        state = dict(self.__dict__)
+        # it's only useful in this process
+        state['_last_profile'] = None
+        del state['_lock']
+        return (_restore_settings,
+                (getattr(type(self), '_base_class', type(self)), dict(self), state))
+
+    @contextmanager
+    def _profiling(self, add_to_last: bool = False) -> Generator:
+        '''Record the validation in a new Profile (or the last one if add_to_last)
+            if profiling is enabled, unless there's already one active.'''
+        if not self._profile or profiling.active_profile() is not None:
+            yield
+            return
+        with profiling.profile(self._last_profile if add_to_last else None) as current_profile:
+            try:
+                yield
+            finally:
+                self._last_profile = current_profile
+
+    def profile_report(self) -> Optional[profiling.Profile]:
+        '''Return the Profile of the last validation, with the time spent validating
+            each setting (sorted in Profile.report(), slowest first) and parsing the file,
+            None if nothing was validated yet.
+            Settings must be created with profile=True.'''
+        if not self._profile:
+            raise SettingsValueError('Profiling is not enabled, use Settings(..., profile=True).')
+        return self._last_profile
 
     @staticmethod
     def load_from_dict(d: Dict) -> 'Settings':
         '''Load the dictionary d as settings.'''
         settings = Settings({})
-        for key, value in d.items():
-            settings[key] = value
+        settings.update(d)
         settings._config_file = ''
         return settings
 
@@ -138,151 +235,1040 @@ class Settings(dict):
         '''Returns a dictionary with the settings'''
         return {key: value for key, value in self.items()}
 
-    @log_exceptions_warnings
-    def _validate_all_values(self, file_dict: Dict) -> Dict:
+    def _validate_all_values(self, file_dict: Dict, keys: Optional[AbstractSet] = None,
+                             streamed: Optional[Dict] = None) -> Dict:
         '''Validates the settings in the config_dict
-            using the settings list.'''
+            using the settings list.
+            If keys is given, only those settings are validated.
+            streamed has the sections already validated while parsing, see _streams.'''
 #        pprint.pprint(file_cte)
+        self._check_sections(file_dict)
+        # unless the file was loaded again without them
+        streamed = {key: value for key, value in (streamed or {}).items()
+                    if file_dict.get(key) is value}
+        values_list = self._dict_value.values_list
+        if streamed:
+            keys = {val.key for val in values_list
+                    if val.key not in streamed and (keys is None or val.key in keys)}
+        if self._workers and self._workers > 1 and profiling.active_profile() is None:
+            from settings_parser import parallel
+            self._dict_value._check_extra_and_exclusive(file_dict)
+            parsed_dict = parallel.validate(self._dict_value, file_dict, keys,
+                                            self._workers, self._threads)
+        else:
+            parsed_dict = dict(self._dict_value.validate(file_dict, keys=keys))
+        if streamed:
+            parsed_dict.update(streamed)
+            parsed_dict = {val.key: parsed_dict[val.key] for val in values_list
+                           if val.key in parsed_dict}
+
+#        pprint.pprint(parsed_dict)
+        return parsed_dict
+
+    def _streams(self, streamed: Dict) -> Optional[Dict]:
+        '''Return the functions that validate the list sections while a YAML file is parsed
+            if stream_lists is True, see yaml_events.load.
+            The validated values are stored in streamed.'''
+        if not self._stream_lists or self._lazy:
+            return None
+
+        def validate_items(named_value: NamedValue, items: Iterator) -> Any:
+            streamed[named_value.key] = named_value.validate_items(items)
+            return streamed[named_value.key]
+
+        return {named_value.key: partial(validate_items, named_value)
+                for named_value in self._dict_value.values_list if named_value.streams()}
+
+    def _check_all_values(self, file_dict: Dict, keys: Optional[AbstractSet] = None) -> Dict:
+        '''Check the sections of the config_dict as _validate_all_values does, but return
+            the loaded values of the sections to validate instead of validating them.'''
+        self._check_sections(file_dict)
+        self._dict_value._check_extra_and_exclusive(file_dict)
+        return {val.key: file_dict[val.key] for val in self._dict_value.values_list
+                if (keys is None or val.key in keys) and val.key in file_dict and
+                (val.kind is Value.mandatory or file_dict[val.key] is not None)}
+
+    def _check_sections(self, file_dict: Dict) -> None:
+        '''Check that the needed sections are present, warn if there are unknown ones.'''
         present_values = set(file_dict.keys())
+        needed_values = self._dict_value._needed_values
+        optional_values = self._dict_value._optional_values
 
         # if present values don't include all needed values
-        if not present_values.issuperset(self._needed_values):
+        if not present_values.issuperset(needed_values):
             raise SettingsFileError('Sections that are needed but not present in the file: ' +
-                                    str(self._needed_values - present_values) +
+                                    str(set(needed_values - present_values)) +
                                     '. Those sections must be present!')
 
-        set_extra = present_values - self._needed_values
+        set_extra = present_values - needed_values
         # if there are extra values and they aren't optional
-        if set_extra and not set_extra.issubset(self._optional_values):
-            warnings.warn('WARNING! The following values are not recognized:: ' +
-                          str(set_extra - self._optional_values) +
-                          '. Those values or sections should not be present', SettingsFileWarning)
+        if set_extra and not set_extra.issubset(optional_values):
+            warn('WARNING! The following values are not recognized:: ' +
+                 str(set_extra - optional_values) +
+                 '. Those values or sections should not be present', SettingsFileWarning)
 
-        parsed_dict = dict(self._dict_value.validate(file_dict))
+    def _set_pending(self, keys: AbstractSet, file_dict: Optional[Dict] = None) -> None:
+        '''The sections with the keys are validated from file_dict when they are accessed.'''
+        self._pending = set(keys)
+        self._lazy_config = file_dict if keys else None
 
-#        pprint.pprint(parsed_dict)
-        return parsed_dict
+    @log_exceptions_warnings
+    def _validate_pending(self, keys: Iterable) -> None:
+        '''Validate the sections with the keys that were not validated yet.'''
+        with self._lock:
+            keys = self._pending.intersection(keys)
+            if not keys:
+                return
+            with self._profiling(add_to_last=True):
+                settings_dict = self._dict_value._validate_values(cast(Dict, self._lazy_config),
+                                                                  keys)
+            dict.update(self, settings_dict)
+            self._set_pending(self._pending - keys, self._lazy_config)
+            if not self._pending:
+                # back to the faster class
+                self._add_properties()
+
+    def force_all(self) -> None:
+        '''Validate now all the sections not accessed yet (if lazy=True),
+            raising the first error.'''
+        self._validate_pending(list(self._pending))
+
+    def _store_config(self, config_text: str) -> None:
+        '''Store the original configuration text, or its hash, according to keep_config.'''
+        if self._keep_config == 'text':
+            self._config_file = config_text
+        elif self._keep_config == 'hash':
+            import hashlib
+            self._config_file = hashlib.sha256(config_text.encode('utf-8')).hexdigest()
+        else:
+            self._config_file = ''
+
+    def _cache_filename(self, config_text: str, file_format: str) -> str:
+        '''Return the cache file name for the configuration text in the file format
+            validated with these Values.'''
+        import hashlib
+        from settings_parser import VERSION
+        # the fingerprint of the frozen Values is found only once
+        fingerprint = VERSION + self._dict_value.fingerprint()
+        schema_hash = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+        config_hash = hashlib.sha256((file_format + '\n' + config_text).encode('utf-8')).hexdigest()
+        return os.path.join(cast(str, self._cache_dir),
+                            '{}_{}.pickle'.format(schema_hash[:32], config_hash[:32]))
+
+    @staticmethod
+    def _load_cache(cache_filename: str) -> Optional[Dict]:
+        '''Return the cached validated settings, or None if there aren't any.
+            The file is unpickled, it must come from a trusted cache_dir.'''
+        import pickle
+        try:
+            with open(cache_filename, 'rb') as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:  # pylint: disable=W0703
+            # corrupt or incompatible cache file, validate again
+            logger = logging.getLogger(__name__)
+            logger.debug('Ignoring cache file %s: %s', cache_filename, exc)
+            return None
+
+    @staticmethod
+    def _save_cache(cache_filename: str, cached: Dict) -> None:
+        '''Save the validated settings to the cache file.
+            Settings that cannot be pickled are not cached.'''
+        import pickle
+        import tempfile
+        directory = os.path.dirname(cache_filename)
+        temp_filename = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # write to a temporary file so other processes never read a partial file
+            with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as file:
+                temp_filename = file.name
+                pickle.dump(cached, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_filename, cache_filename)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as exc:
+            logger = logging.getLogger(__name__)
+            logger.debug('The settings could not be cached: %s', exc)
+            if temp_filename is not None and os.path.exists(temp_filename):
+                os.unlink(temp_filename)
+
+    def _load_cached(self, cache_filename: str) -> bool:
+        '''Load the settings from the cache file, return False if there are none.'''
+        cached = self._load_cache(cache_filename)
+        if cached is None:
+            return False
+        # warnings found while validating the configuration
+        for category, message in cached['warnings']:
+            warn(message, category)
+        self.update(cached['settings'])
+        self._set_pending(set())
+        self._add_properties()
+        logger = logging.getLogger(__name__)
+        logger.info('Settings loaded from cache (%s)!', cache_filename)
+        return True
+
+    def _validate_loaded(self, file_cte: Dict, cache_filename: Optional[str] = None,
+                         streamed: Optional[Dict] = None) -> None:
+        '''Validate the loaded dictionary and store the settings.
+            If cache_filename is given, store the validated settings there.
+            streamed has the sections already validated while parsing.'''
+        logger = logging.getLogger(__name__)
+
+        # validate all values in the configuration file
+        lazy = self._lazy and cache_filename is None
+        if lazy:
+            settings_dict = self._check_all_values(file_cte)
+        elif cache_filename is None:
+            settings_dict = self._validate_all_values(file_cte, streamed=streamed)
+        else:
+            with record_warnings() as warn_list:
+                settings_dict = self._validate_all_values(file_cte, streamed=streamed)
+            cached_warnings = [(warning.category, str(warning.message)) for warning in warn_list]
+            for category, message in cached_warnings:
+                warn(message, category)
+            self._save_cache(cache_filename, {'settings': settings_dict,
+                                              'warnings': cached_warnings})
+
+        # access settings directly as Setting.setting
+        self.update(settings_dict)
+        self._set_pending(settings_dict.keys() if lazy else set(), file_cte)
+        self._add_properties()
+
+        # the original configuration is needed to know what changes in reload
+        # (the streamed lists weren't kept)
+        self._file_dict = file_cte if self._reload and not streamed else None
+
+        # log read and validated settings
+        # use pretty print, only if it's logged because it's slow for large settings
+        if logger.isEnabledFor(logging.DEBUG):
+            import pprint
+            logger.debug('Settings dump:')
+            logger.debug('File dict (config_cte):')
+            logger.debug(pprint.pformat(file_cte))
+            logger.debug('Validated dict (cte):')
+            logger.debug(repr(self))
+        logger.info('Settings loaded!')
+
+    def _validate_stream(self, stream: Union[IO, str], name: str,
+                         loader: Optional['Loader'] = None) -> None:
+        '''Load and validate the settings in the stream or string.
+            The stream is read only once.'''
+        loader = loader or Loader()
+        cache_filename = None
+        streamed = {}  # type: Dict
+        if self._keep_config == 'none' and self._cache_dir is None and not isinstance(stream, str):
+            # load the stream into config_cte dictionary.
+            # the loader checks that there are no errors
+            file_cte = loader.load_settings_stream(stream, name=name,
+                                                   streams=self._streams(streamed))
+            config_text = ''
+        else:
+            config_text = stream if isinstance(stream, str) else stream.read()
+            if self._cache_dir is not None:
+                cache_filename = self._cache_filename(config_text, _file_format(None, name))
+                if self._load_cached(cache_filename):
+                    self._store_config(config_text)
+                    return
+            file_cte = loader.load_settings_stream(config_text, name=name,
+                                                   streams=self._streams(streamed))
+
+        # store original configuration file
+        self._store_config(config_text)
+
+        self._validate_loaded(file_cte, cache_filename, streamed)
 
     @log_exceptions_warnings
-    def validate(self, filename: str) -> None:
+    def validate(self, filename: str, loader: Optional['Loader'] = None) -> None:
         ''' Load filename and extract the settings for the simulations
             If mandatory values are missing, errors are logged
             and exceptions are raised
             Warnings are logged if extra settings are found
+            A Loader instance can be given to reuse it for many files.
         '''
         logger = logging.getLogger(__name__)
         logger.info('Reading settings file (%s)...', filename)
 
-        # load file into config_cte dictionary.
-        # the function checks that the file exists and that there are no errors
-        file_cte = Loader().load_settings_file(filename)
+        self._file_dict = None
+        with self._profiling():
+            if self._keep_config == 'none' and self._cache_dir is None:
+                # nothing is kept, the loader parses the file as it reads it
+                streamed = {}  # type: Dict
+                file_cte = (loader or Loader()).load_settings_file(
+                    filename, streams=self._streams(streamed))
+                self._store_config('')
+                self._validate_loaded(file_cte, streamed=streamed)
+            else:
+                with _open_settings_file(filename) as file:
+                    self._validate_stream(file, filename, loader)
+        self._filename = filename
 
-        # store original configuration file
+    async def avalidate(self, filename: str, loader: Optional['Loader'] = None,
+                        executor: Any = None) -> None:
+        '''Asynchronous version of validate for asyncio applications.
+            The file is read, loaded and validated in the executor
+            (by default the event loop's default executor), the event loop is never blocked.
+            With a ProcessPoolExecutor the Settings and the loader must be picklable.
+            The warnings are issued again here, in the caller's thread.
+            If the task is cancelled these settings don't change; if the validation was
+            already running in the executor it finishes, but its result is discarded.'''
+        validated, warning_list = await _validate_in_executor(self._empty_copy(), filename,
+                                                              loader, executor)
+        for category, message in warning_list:
+            warn(message, category)
+        self._take_validated(validated)
+
+    def _empty_copy(self) -> 'Settings':
+        '''Return new Settings with the same Values and options, but without any settings.'''
+        state = dict(self.__dict__, _last_profile=None, _pending=set(), _lazy_config=None,
+                     _filename=None, _file_dict=None, _config_file=None)
+        del state['_lock']
+        return _restore_settings(getattr(type(self), '_base_class', type(self)), {}, state)
+
+    def _take_validated(self, settings: 'Settings') -> None:
+        '''Replace the settings and the state of the last validation with those of settings.'''
+        for name in ('_pending', '_lazy_config', '_filename', '_file_dict',
+                     '_config_file', '_last_profile'):
+            dict.__setattr__(self, name, getattr(settings, name))
+        dict.clear(self)
+        dict.update(self, settings)
+        self._add_properties()
+
+    @log_exceptions_warnings
+    def _validate_file(self, filename: str) -> Dict:
+        '''Load and validate filename, return the validated dictionary.
+            The Settings instance is not changed.'''
+        file_dict = Loader().load_settings_file(filename)
+        return self._validate_all_values(file_dict)
+
+    def validate_many(self, filenames: Iterable[str], workers: Optional[int] = None,
+                      threads: bool = False) -> List['ValidationResult']:
+        '''Validate many files with these Values using a pool of worker processes
+            (or threads if threads is True). workers is the size of the pool,
+            by default the number of CPUs.
+            Return a ValidationResult for each file, in the same order, with new Settings
+            with these Values. A file that fails doesn't stop the rest,
+            its result has the exception as the error and settings is None.
+            The warnings of each file are in its result, and they are issued again here.
+            The Values are sent to each worker process only once.
+        '''
+        filenames = list(filenames)
+        if workers == 1:
+            results = [_validate_many_file_with(self, filename) for filename in filenames]
+        elif threads:
+            from multiprocessing.pool import ThreadPool
+            with ThreadPool(workers) as pool:
+                results = pool.map(partial(_validate_many_file_with, self), filenames)
+        else:
+            import multiprocessing
+            with multiprocessing.Pool(workers, initializer=_init_validate_many,
+                                      initargs=(self,)) as pool:
+                results = pool.map(_validate_many_file, filenames)
+        validation_results = []
+        for filename, settings_dict, error, warning_list in results:
+            for category, message in warning_list:
+                warn(message, category)
+            settings = None if settings_dict is None else self._validated_copy(settings_dict)
+            validation_results.append(ValidationResult(filename, settings, error, warning_list))
+        return validation_results
+
+    def _validated_copy(self, settings_dict: Dict) -> 'Settings':
+        '''Return new Settings with the same Values and options and the validated settings.'''
+        settings = self._empty_copy()
+        dict.update(settings, settings_dict)
+        settings._config_file = ''
+        settings._add_properties()
+        return settings
+
+    def iter_validate(self, stream: Union[IO, str], loader: Optional['Loader'] = None,
+                      file_format: Optional[str] = None) -> Iterator['DocumentResult']:
+        '''Validate each document of a multi-document file-like object or string
+            (documents separated by --- in YAML) one at a time, with these Values.
+            Yield a DocumentResult for each one with its index, the new Settings
+            and the error. A document that fails doesn't stop the rest, but an error
+            loading the stream is the last result. Only one document is in memory at a time.
+            Null documents (empty, or after a trailing ---) are skipped,
+            the index is still the position of each document in the stream.
+            The instance itself doesn't change.'''
+        name = getattr(stream, 'name', '<stream>')
+        return self._iter_validate(stream, name, loader or Loader(), file_format)
+
+    def iter_validate_file(self, filename: str, loader: Optional['Loader'] = None,
+                           file_format: Optional[str] = None) -> Iterator['DocumentResult']:
+        '''Validate each document in the file one at a time, see iter_validate.
+            By default the format is found from the file extension, YAML if it's not known.'''
+        loader = loader or Loader()
+        file_format = _file_format(file_format, filename)
+        try:
+            with _open_settings_file(filename) as file:
+                yield from self._iter_validate(file, filename, loader, file_format)
+        except SettingsFileError as exc:
+            # the file cannot be read
+            logging.getLogger(__name__).error(exc.args[0])
+            yield DocumentResult(0, None, exc)
+
+    def _iter_validate(self, stream: Union[IO, str], name: str, loader: 'Loader',
+                       file_format: Optional[str] = None) -> Iterator['DocumentResult']:
+        '''Validate each document of the stream, see iter_validate.'''
+        logger = logging.getLogger(__name__)
+        logger.info('Reading settings documents (%s)...', name)
+        documents = loader.iter_settings_stream(stream, file_format, name=name)
+        index = 0
+        while True:
+            try:
+                config_dict = next(documents)
+            except StopIteration:
+                return
+            except Exception as exc:  # pylint: disable=W0703
+                logger.error(exc.args[0])
+                yield DocumentResult(index, None, exc)
+                return
+            if config_dict is None:  # empty document
+                index += 1
+                continue
+            settings = self._empty_copy()
+            try:
+                if not isinstance(config_dict, Dict) or not config_dict:
+                    msg = 'The settings document {} is empty or otherwise invalid ({})!'
+                    raise SettingsFileError(msg.format(index, name))
+                settings.validate_dict(config_dict)
+            except Exception as exc:  # pylint: disable=W0703
+                yield DocumentResult(index, None, exc)
+            else:
+                yield DocumentResult(index, settings, None)
+            index += 1
+
+    async def avalidate_many(self, filenames: Iterable[str], executor: Any = None,
+                             limit: Optional[int] = None) -> List['ValidationResult']:
+        '''Validate many files concurrently with avalidate, at most limit at once
+            (all of them by default). Return a ValidationResult for each file, in the same order.
+            A file that fails doesn't stop the rest,
+            its result has the exception as the error and settings is None.
+            The warnings of each file are in its result, and they are issued again here.
+            Cancelling the task cancels the files not validated yet.'''
+        import asyncio
+        semaphore = asyncio.Semaphore(limit) if limit else None
+
+        async def validate(filename: str) -> ValidationResult:
+            # the new Settings are validated in the executor, as in avalidate
+            settings = self._empty_copy()
+            try:
+                if semaphore is None:
+                    settings, warning_list = await _validate_in_executor(settings, filename,
+                                                                         None, executor)
+                else:
+                    async with semaphore:
+                        settings, warning_list = await _validate_in_executor(settings, filename,
+                                                                             None, executor)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pylint: disable=W0703
+                return ValidationResult(filename, None, exc, [])
+            for category, message in warning_list:
+                warn(message, category)
+            return ValidationResult(filename, settings, None, warning_list)
+
+        return list(await asyncio.gather(*[validate(filename) for filename in filenames]))
+
+    @log_exceptions_warnings
+    def reload(self, filename: Optional[str] = None, loader: Optional['Loader'] = None) -> Set:
+        '''Load the last validated file again (or filename) and validate only the sections
+            that changed. The other settings keep their validated values.
+            Return the keys of the sections that were added, changed or removed.
+            If nothing is known about the previous configuration (the Settings were created
+            without reload=True, or it was loaded from the cache) everything is validated.
+        '''
+        filename = filename or self._filename
+        if filename is None:
+            raise SettingsFileError('There is no settings file to reload.')
+        old_file_dict = self._file_dict
+        if old_file_dict is None:
+            self.validate(filename, loader)
+            return set(self.keys())
+
+        logger = logging.getLogger(__name__)
+        logger.info('Reloading settings file (%s)...', filename)
+        with self._profiling():
+            with _open_settings_file(filename) as file:
+                config_text = file.read()
+            file_cte = (loader or Loader()).load_settings_stream(config_text, name=filename)
+
+            changed = set(key for key, value in file_cte.items()
+                          if key not in old_file_dict or
+                          not _same_value(old_file_dict[key], value))
+            changed |= set(old_file_dict) - set(file_cte)
+            if self._lazy:
+                settings_dict = self._check_all_values(file_cte, keys=changed)
+            else:
+                settings_dict = self._validate_all_values(file_cte, keys=changed)
+
+        for key in changed:
+            if key in settings_dict:
+                self[key] = settings_dict[key]
+            elif key in self:
+                # removed, or optional and now empty
+                del self[key]
+        if self._lazy:
+            self._set_pending(self._pending | settings_dict.keys(), file_cte)
+        self._add_properties()
+        self._store_config(config_text)
+        self._file_dict = file_cte
+        self._filename = filename
+        logger.info('Settings reloaded, changed sections: %s.', changed or 'none')
+        return changed
+
+    @log_exceptions_warnings
+    def validate_stream(self, stream: IO, loader: Optional['Loader'] = None) -> None:
+        '''Load and validate the settings from a file-like object, see validate.'''
+        name = getattr(stream, 'name', '<stream>')
+        logger = logging.getLogger(__name__)
+        logger.info('Reading settings stream (%s)...', name)
+
+        with self._profiling():
+            self._validate_stream(stream, name, loader)
+
+    @log_exceptions_warnings
+    def validate_string(self, text: str, loader: Optional['Loader'] = None) -> None:
+        '''Load and validate the settings from a string, see validate.'''
+        logger = logging.getLogger(__name__)
+        logger.info('Reading settings string...')
+
+        with self._profiling():
+            self._validate_stream(text, '<string>', loader)
+
+    @log_exceptions_warnings
+    def validate_dict(self, config_dict: Dict) -> None:
+        '''Validate an already loaded dictionary of settings, see validate.'''
+        if not isinstance(config_dict, Dict):
+            msg = 'The settings to validate ({}) are not a dictionary!'.format(config_dict)
+            raise SettingsValueError(msg)
+        self._store_config('')
+
+        with self._profiling():
+            self._validate_loaded(config_dict)
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    # the methods are mixed into subclasses of Settings
+    _LazyBase = Settings
+else:
+    _LazyBase = object
+
+class _LazySettings(_LazyBase):
+    '''Methods of the Settings with sections not validated yet, see Settings(lazy=True).
+        The loaded values of those sections are in the dictionary,
+        every way of reading them validates them first.
+        Validating the last section changes the class, so the methods of the base class
+        are called explicitly instead of with super().'''
+    __slots__ = ()
+    if TYPE_CHECKING:  # pragma: no cover
+        _base_class = Settings  # type: Type[Settings]
+
+    def __getitem__(self, key: Any) -> Any:
+        if key in self._pending:
+            self._validate_pending([key])
+        return dict.__getitem__(self, key)
+
+    def __iter__(self) -> Any:
+        # dict(settings) and {**settings} use __getitem__ if __iter__ is overridden
+        return dict.__iter__(self)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
+    def items(self) -> Any:
+        self.force_all()
+        return dict.items(self)
+
+    def values(self) -> Any:
+        self.force_all()
+        return dict.values(self)
+
+    def copy(self) -> Dict:
+        self.force_all()
+        return dict.copy(self)
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def pop(self, key: Any, *default: Any) -> Any:
+        if key in self._pending:
+            self._validate_pending([key])
+        return self._base_class.pop(self, key, *default)
+
+    def popitem(self) -> Tuple:
+        self.force_all()
+        return self._base_class.popitem(self)
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self._pending.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key: Any) -> None:
+        self._pending.discard(key)
+        self._base_class.__delitem__(self, key)
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        other = dict(*args, **kwargs)
+        self._pending.difference_update(other)
+        dict.update(self, other)
+
+    def clear(self) -> None:
+        self._pending.clear()
+        self._base_class.clear(self)
+
+    def __reduce__(self) -> Tuple:
+        self.force_all()
+        return self._base_class.__reduce__(self)
+
+
+# subclasses of Settings with properties for the keys of some Values, by the base class,
+# the keys and lazy. The least recently used are removed, the instances keep their class
+_SETTINGS_CLASSES_SIZE = 64
+_settings_classes = OrderedDict()  # type: OrderedDict[Tuple[type, Tuple, bool], type]
+_settings_classes_lock = threading.Lock()
+
+def _item_property(key: str) -> property:
+    '''Return a property that gets the item with the key, AttributeError if it's not present.'''
+    get_item = itemgetter(key)
+
+    def getter(settings: Dict) -> Any:
+        try:
+            return get_item(settings)
+        except KeyError:
+            raise AttributeError(key) from None
+    return property(getter, doc=key)
+
+def _settings_class(base_class: type, keys: Tuple, lazy: bool = False) -> type:
+    '''Return a subclass of base_class with a property to get each of the keys,
+        the keys of the Values, present or not.
+        The properties are faster than __getattr__, and the subclass is created only once.
+        If lazy, the sections not validated yet are validated when accessed.'''
+    with _settings_classes_lock:
+        settings_class = _settings_classes.get((base_class, keys, lazy))
+        if settings_class is not None:
+            _settings_classes.move_to_end((base_class, keys, lazy))
+            return settings_class
+    namespace = {key: _item_property(key)
+                 for key in keys
+                 if isinstance(key, str) and key.isidentifier() and
+                 not key.startswith('_') and
+                 not hasattr(base_class, key)}  # type: Dict[str, Any]
+    namespace['__slots__'] = ()
+    namespace['_base_class'] = base_class
+    namespace['__module__'] = base_class.__module__
+    namespace['__qualname__'] = base_class.__qualname__
+    bases = (_LazySettings, base_class) if lazy else (base_class,)
+    settings_class = type(base_class.__name__, bases, namespace)
+    with _settings_classes_lock:
+        settings_class = _settings_classes.setdefault((base_class, keys, lazy), settings_class)
+        _settings_classes.move_to_end((base_class, keys, lazy))
+        if len(_settings_classes) > _SETTINGS_CLASSES_SIZE:
+            _settings_classes.popitem(last=False)
+    return settings_class
+
+
+def _frozen_values(values: Union[Dict, DictValue]) -> DictValue:
+    '''Return a frozen DictValue with the Values. A frozen DictValue is returned as it is,
+        otherwise the Values are copied and the copy is frozen, the caller's aren't changed.'''
+    if isinstance(values, DictValue) and values._frozen:
+        return values
+    import copy
+    values_copy = copy.deepcopy(values)
+    dict_value = values_copy if isinstance(values_copy, DictValue) else DictValue(values_copy)
+    return dict_value.freeze()
+
+
+def _restore_settings(settings_class: Type[Settings], settings_dict: Dict,
+                      state: Dict) -> Settings:
+    '''Return the unpickled Settings, see Settings.__reduce__.'''
+    settings = settings_class.__new__(settings_class)
+    dict.update(settings, settings_dict)
+    state['_lock'] = threading.Lock()
+    settings.__dict__.update(state)
+    if settings._config_file is not None:
+        settings._add_properties()
+    return settings
+
+
+ValidationResult = NamedTuple('ValidationResult', [('filename', str),
+                                                   ('settings', Optional[Settings]),
+                                                   ('error', Optional[Exception]),
+                                                   ('warnings', List[Tuple[type, str]])])
+ValidationResult.__doc__ = '''The result of validating a file with Settings.validate_many,
+    warnings has the category and message of each warning.'''
+
+DocumentResult = NamedTuple('DocumentResult', [('index', int),
+                                               ('settings', Optional[Settings]),
+                                               ('error', Optional[Exception])])
+DocumentResult.__doc__ = '''The result of validating a document with Settings.iter_validate.'''
+
+# the file name, validated dictionary, error and warnings of a validate_many file
+_ManyResult = Tuple[str, Optional[Dict], Optional[Exception], List[Tuple[type, str]]]
+# Settings used by the validate_many worker processes
+_validate_many_settings = None  # type: Optional[Settings]
+
+def _init_validate_many(settings: Settings) -> None:
+    '''Store the Settings in the worker process, they are sent only once.'''
+    global _validate_many_settings  # pylint: disable=W0603
+    _validate_many_settings = settings
+
+def _validate_many_file(filename: str) -> _ManyResult:
+    '''Validate a file in a validate_many worker process, see _validate_many_file_with.'''
+    return _validate_many_file_with(cast(Settings, _validate_many_settings), filename)
+
+def _validate_many_file_with(settings: Settings, filename: str) -> _ManyResult:
+    '''Validate a file with the settings in a validate_many worker,
+        return the validated dictionary or the error, and the warnings.'''
+    with record_warnings() as warn_list:
+        try:
+            settings_dict, error = settings._validate_file(filename), None
+        except Exception as exc:  # pylint: disable=W0703
+            settings_dict, error = None, exc
+    return filename, settings_dict, error, [(warning.category, str(warning.message))
+                                            for warning in warn_list]
+
+async def _validate_in_executor(settings: Settings, filename: str,
+                                loader: Optional['Loader'] = None, executor: Any = None
+                                ) -> Tuple[Settings, List[Tuple[type, str]]]:
+    '''Validate the file with the settings in the executor without blocking the event loop,
+        return the validated Settings and the warnings.'''
+    import asyncio
+    # get_running_loop is new in Python 3.7, get_event_loop is the same inside a coroutine
+    loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+    return await loop.run_in_executor(executor, _validate_async_file, settings, filename, loader)
+
+def _validate_async_file(settings: Settings, filename: str, loader: Optional['Loader'] = None
+                         ) -> Tuple[Settings, List[Tuple[type, str]]]:
+    '''Validate the file in an avalidate executor, return the Settings and the warnings.'''
+    with record_warnings() as warn_list:
+        settings.validate(filename, loader)
+    return settings, [(warning.category, str(warning.message)) for warning in warn_list]
+
+
+def _same_value(value1: Any, value2: Any) -> bool:
+    '''Return True if both loaded values are the same, including their types (1 is not True).'''
+    if type(value1) is not type(value2):  # pylint: disable=C0123
+        return False
+    if isinstance(value1, dict):
+        return (value1.keys() == value2.keys() and
+                all(_same_value(value1[key], value2[key]) for key in value1))
+    if isinstance(value1, (list, tuple)):
+        return (len(value1) == len(value2) and
+                all(_same_value(item1, item2) for item1, item2 in zip(value1, value2)))
+    return value1 == value2
+
+
+@contextmanager
+def _open_settings_file(filename: Union[str, bytes]) -> Generator:
+    '''Open the text file for reading, raise SettingsFileError if it cannot be read.'''
+    try:
         with open(filename, 'rt') as file:
-            self._config_file = file.read()
+            yield file
+    except OSError as err:
+        raise SettingsFileError('Error reading file ({})! '.format(filename) +
+                                str(err.args)) from err
 
-        # validate all values in the configuration file
-        settings_dict = self._validate_all_values(file_cte)
 
-        # access settings directly as Setting.setting
-        for key, value in settings_dict.items():
-            self[key] = value
+def _no_duplicates_constructor(loader: Any, node: Any,
+                               deep: bool = False) -> Dict:
+    '''Construct a mapping in a single pass, raise SettingsValueError if there's a duplicate key.
+        Keys from merged mappings (<<) can be overridden, as in YAML.'''
+    own_pairs = len([key_node for key_node, _ in node.value
+                     if key_node.tag != 'tag:yaml.org,2002:merge'])
+    loader.flatten_mapping(node)
+    # the merged pairs come first
+    merged_pairs = len(node.value) - own_pairs
 
-        # log read and validated settings
-        # use pretty print
-        logger.debug('Settings dump:')
-        logger.debug('File dict (config_cte):')
-        logger.debug(pprint.pformat(file_cte))
-        logger.debug('Validated dict (cte):')
-        logger.debug(repr(self))
-        logger.info('Settings loaded!')
+    mapping = {}  # type: Dict
+    own_keys = set()
+    for index, (key_node, value_node) in enumerate(node.value):
+        key = loader.construct_object(key_node, deep=deep)
+        if index >= merged_pairs:
+            if key in own_keys:
+                msg = "Duplicate label {}!".format(key)
+                raise SettingsValueError(msg)
+            own_keys.add(key)
+        mapping[key] = loader.construct_object(value_node, deep=deep)
+    return mapping
+
+
+# ruamel.yaml constructor class that doesn't allow duplicate keys, see _no_duplicate_constructor
+_no_duplicate_constructor_class = None  # type: Optional[type]
+
+def _no_duplicate_constructor() -> type:
+    '''Return a subclass of ruamel.yaml's SafeConstructor that raises SettingsValueError
+        for duplicate keys. The subclass is created only once.'''
+    global _no_duplicate_constructor_class
+    if _no_duplicate_constructor_class is None:
+        from ruamel.yaml.constructor import SafeConstructor
+        from ruamel.yaml.resolver import BaseResolver
+
+        class NoDuplicateConstructor(SafeConstructor):
+            '''Construct the yaml documents, raise SettingsValueError for duplicate keys.'''
+            pass
+        NoDuplicateConstructor.add_constructor(BaseResolver.DEFAULT_MAPPING_TAG,
+                                               _no_duplicates_constructor)
+        _no_duplicate_constructor_class = NoDuplicateConstructor
+    return _no_duplicate_constructor_class
+
+def _new_yaml(pure: bool = False) -> Any:
+    '''Return a new ruamel.yaml YAML instance that loads with the safe constructors and raises
+        SettingsValueError for duplicate keys. It uses libyaml if ruamel.yaml was built with it,
+        unless pure is True. Each instance loads only one stream at a time.'''
+    from ruamel.yaml import YAML
+    yaml = YAML(typ='safe', pure=pure)
+    yaml.Constructor = _no_duplicate_constructor()
+    return yaml
 
 
 class Loader():
-    '''Load a settings file'''
+    '''Load a settings file.
+        The same instance can be used to load any number of files.'''
 
-    def __init__(self) -> None:
-        '''Init variables'''
+    def __init__(self, pure: bool = False) -> None:
+        '''Init variables. YAML files are parsed with libyaml if ruamel.yaml was built with it,
+            unless pure is True, then the pure Python parser is used.'''
         self.file_dict = {}  # type: Dict
+        self.pure = pure
+
+    def _yaml(self) -> Any:
+        '''Return a new ruamel.yaml YAML instance to load a YAML stream, see _new_yaml.
+            A new one is used for each stream, so the Loader can be used from many threads.'''
+        return _new_yaml(self.pure)
 
     @log_exceptions_warnings
-    def load_settings_file(self, filename: Union[str, bytes], file_format: str = 'yaml') -> Dict:
-        '''Loads a settings file with the given format (only YAML supported at this time).
-            If the file doesn't exist ir it's empty, raise SettingsFileError.'''
-        if file_format.lower() == 'yaml':
-            self.file_dict = self._load_yaml_file(filename)
-        else:
-            raise NotImplementedError
+    def load_settings_file(self, filename: Union[str, bytes], file_format: Optional[str] = None,
+                           streams: Optional[Dict] = None) -> Dict:
+        '''Loads a settings file with the given format: 'yaml', 'json', 'toml'
+            or any other registered with register_format.
+            By default the format is found from the file extension, YAML if it's not known.
+            If the file doesn't exist ir it's empty, raise SettingsFileError.
+            streams is only used by YAML files, see yaml_events.load.'''
+        file_format = _file_format(file_format, str(filename))
+        with _open_settings_file(filename) as file:
+            return self.load_settings_stream(file, file_format, name=str(filename),
+                                             streams=streams)
+
+    @log_exceptions_warnings
+    def load_settings_stream(self, stream: Union[IO, str], file_format: Optional[str] = None,
+                             name: str = '<stream>',
+                             streams: Optional[Dict] = None) -> Dict:
+        '''Loads the settings from a file-like object or a string with the given format,
+            see load_settings_file. By default the format is found from the extension of name.
+            If it's empty or invalid, raise SettingsFileError.'''
+        file_format = _file_format(file_format, name)
+        load = _formats[file_format]
+        if streams and file_format == 'yaml':
+            load = partial(Loader._load_yaml_stream, streams=streams)
+
+        current_profile = profiling.active_profile()
+        start = time.perf_counter()
+        try:
+            file_dict = load(self, stream, name)
+        finally:
+            if current_profile is not None:
+                current_profile.add_parse(name, time.perf_counter() - start)
+        self.file_dict = dict(file_dict) if isinstance(file_dict, Dict) else {}
 
         if not self.file_dict:
-            msg = 'The settings file is empty or otherwise invalid ({})!'.format(filename)
+            msg = 'The settings file is empty or otherwise invalid ({})!'.format(name)
             raise SettingsFileError(msg)
 
         return self.file_dict
 
-    @log_exceptions_warnings
-    def _load_yaml_file(self, filename: str) -> Dict:
-        '''Open a yaml filename and loads it into a dictionary
-            SettingsFileError exceptions are raised if the file doesn't exist or is invalid.
+    def _load_yaml_stream(self, stream: Union[IO, str], filename: str,
+                          streams: Optional[Dict] = None) -> Dict:
+        '''Load a yaml stream or string into a dictionary
+            SettingsFileError exceptions are raised if it is invalid.
+            The lists in streams are constructed from the parser events, see yaml_events.load.
         '''
+        import ruamel.yaml as yaml
         file_dict = {}  # type: Dict
         try:
-            with open(filename) as file:
-                file_dict = self._no_duplicate_load(file, yaml.SafeLoader)
-        except OSError as err:
-            raise SettingsFileError('Error reading file ({})! '.format(filename) +
-                                    str(err.args)) from err
+            if streams:
+                from settings_parser import yaml_events
+                file_dict = yaml_events.load(stream, self._yaml, streams)
+            else:
+                file_dict = self._yaml().load(stream)
         except yaml.YAMLError as exc:
-            msg = 'Error while parsing the config file: {}! '.format(filename)
-            if hasattr(exc, 'problem_mark'):
-                msg += str(exc.problem_mark).strip()
-                if exc.context is not None:
-                    msg += str(exc.problem).strip() + ' ' + str(exc.context).strip()
-                else:
-                    msg += str(exc.problem).strip()
-                msg += 'Please correct data and retry.'
-            else:  # pragma: no cover
-                msg += 'Something went wrong while parsing the config file ({}):'.format(filename)
-                msg += str(exc)
-            raise SettingsFileError(msg) from exc
+            raise _yaml_error(exc, filename) from exc
+        # libyaml rejects a key without text (ie: ':'), the pure Python parser loads it as None
+        if isinstance(file_dict, Dict) and None in file_dict:
+            msg = 'Error while parsing the config file: {}! Empty key. '.format(filename)
+            raise SettingsFileError(msg + 'Please correct data and retry.')
 
         return file_dict
 
-    @staticmethod
-    def _no_duplicate_load(stream: IO, Loader: yaml.BaseLoader = yaml.Loader) -> Dict:
-        '''Load data and raise SettingsValueError if there's a duplicate key.'''
+    def iter_settings_stream(self, stream: Union[IO, str], file_format: Optional[str] = None,
+                             name: str = '<stream>') -> Iterator[Any]:
+        '''Yield the documents in a file-like object or a string one at a time, as loaded.
+            YAML streams can have many documents separated by ---, other formats have only one.
+            Only the document being yielded is kept in memory.
+            Raise SettingsFileError if the stream is invalid,
+            the documents before the error are yielded.'''
+        file_format = _file_format(file_format, name)
+        if file_format != 'yaml':
+            yield _formats[file_format](self, stream, name)
+            return
+        import ruamel.yaml as yaml
+        try:
+            # it composes and constructs one document at a time
+            yield from self._yaml().load_all(stream)
+        except yaml.YAMLError as exc:
+            raise _yaml_error(exc, name) from exc
 
-        class NoDuplicateLoader(Loader):  # type: ignore
-            '''Load the yaml file use an OderedDict'''
-            pass
+    def _load_json_stream(self, stream: Union[IO, str], filename: str) -> Dict:
+        '''Load a json stream or string into a dictionary with the C parser.
+            SettingsFileError exceptions are raised if it is invalid.'''
+        import json
+        try:
+            if isinstance(stream, str):
+                return json.loads(stream, object_pairs_hook=_no_duplicates_dict)
+            return json.load(stream, object_pairs_hook=_no_duplicates_dict)
+        except ValueError as exc:  # JSONDecodeError
+            msg = 'Error while parsing the config file: {}! {}. Please correct data and retry.'
+            raise SettingsFileError(msg.format(filename, exc)) from exc
+
+    def _load_toml_stream(self, stream: Union[IO, str], filename: str) -> Dict:
+        '''Load a toml stream or string into a dictionary with tomllib (or tomli).
+            SettingsFileError exceptions are raised if it is invalid,
+            and SettingsValueError if a key or table is defined twice.'''
+        if sys.version_info >= (3, 11):
+            import tomllib
+        else:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                msg = 'TOML files ({}) need Python 3.11 or the tomli package.'.format(filename)
+                raise SettingsFileError(msg) from None
+        text = stream if isinstance(stream, str) else stream.read()
+        try:
+            return tomllib.loads(text)
+        except tomllib.TOMLDecodeError as exc:
+            key = _toml_duplicate_key(tomllib, text, exc)
+            if key is not None:
+                raise SettingsValueError("Duplicate label {}!".format(key)) from exc
+            msg = 'Error while parsing the config file: {}! {}. Please correct data and retry.'
+            raise SettingsFileError(msg.format(filename, exc)) from exc
 
-        def no_duplicates_constructor(loader: yaml.BaseLoader, node: yaml.Node,
-                                      deep: bool = False) -> Dict:
-            """Check for duplicate keys."""
-            mapping = {}  # type: Dict
-            for key_node, value_node in node.value:
-                key = loader.construct_object(key_node, deep=deep)
-                if key in mapping:
-                    msg = "Duplicate label {}!".format(key)
-                    raise SettingsValueError(msg)
-                value = loader.construct_object(value_node, deep=deep)
-                mapping[key] = value
-
-            # Load the yaml file use an OderedDict
-            loader.flatten_mapping(node)
-            return dict(loader.construct_pairs(node))
-
-        NoDuplicateLoader.add_constructor(
-            yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
-            no_duplicates_constructor)
-
-        res = yaml.load(stream, NoDuplicateLoader)
+    @staticmethod
+    def _no_duplicate_load(stream: IO, pure: bool = False) -> Dict:
+        '''Load data and raise SettingsValueError if there's a duplicate key.
+            The pure Python parser is used if pure is True, see _new_yaml.'''
+        res = _new_yaml(pure).load(stream)
         if not isinstance(res, Dict):
             return {}
         else:
             return dict(res)
 
 
+def _yaml_error(exc: Exception, filename: str) -> SettingsFileError:
+    '''Return the SettingsFileError for the ruamel.yaml error found parsing the file.'''
+    msg = 'Error while parsing the config file: {}! '.format(filename)
+    if hasattr(exc, 'problem_mark'):
+        msg += str(exc.problem_mark).strip()
+        if exc.context is not None:
+            msg += str(exc.problem).strip() + ' ' + str(exc.context).strip()
+        else:
+            msg += str(exc.problem).strip()
+        msg += 'Please correct data and retry.'
+    else:  # pragma: no cover
+        msg += 'Something went wrong while parsing the config file ({}):'.format(filename)
+        msg += str(exc)
+    return SettingsFileError(msg)
+
+def _no_duplicates_dict(pairs: List[Tuple[Any, Any]]) -> Dict:
+    '''Return the dictionary with the key, value pairs, raise SettingsValueError
+        if there's a duplicate key.'''
+    mapping = {}  # type: Dict
+    for key, value in pairs:
+        if key in mapping:
+            raise SettingsValueError("Duplicate label {}!".format(key))
+        mapping[key] = value
+    return mapping
+
+
+# errors of tomllib (and tomli) for keys and tables defined twice, and their position
+_TOML_DUPLICATE = (r"Can ?not overwrite a value|Can ?not declare .* twice|"
+                   r"Duplicate inline table key '(.*)'")
+_TOML_POSITION = r"\(at line (\d+), column \d+\)|\(at end of document\)"
+
+def _toml_duplicate_key(tomllib: Any, text: str, exc: Exception) -> Optional[str]:
+    '''Return the key defined twice that raised the TOML error, None if it's another error.
+        Only the key of inline tables is in the error, the others are found in the statement
+        that ends in the line of the error: the lines above it are added until they load.'''
+    import re
+    match = re.match(_TOML_DUPLICATE, str(exc))
+    if match is None:
+        return None
+    if match.group(1) is not None:
+        return match.group(1)
+    position = re.search(_TOML_POSITION, str(exc))
+    if position is None:  # pragma: no cover
+        return None
+    lines = text.split('\n')
+    last = int(position.group(1)) if position.group(1) is not None else len(lines)
+    for first in range(last - 1, -1, -1):
+        try:
+            tomllib.loads('\n'.join(lines[first:last]))
+        except tomllib.TOMLDecodeError:
+            continue
+        line = lines[first].strip()
+        if line.startswith('['):  # table header
+            return _toml_key(tomllib.loads(line))
+        # the key ends in the first '=' that leaves a valid key before it, it can be quoted
+        for equal in (index for index, char in enumerate(line) if char == '='):
+            try:
+                return _toml_key(tomllib.loads(line[:equal] + '= 0'))
+            except tomllib.TOMLDecodeError:
+                pass
+        return None
+    return None
+
+def _toml_key(table: Dict) -> str:
+    '''Return the dotted key of the only item in the nested tables.'''
+    keys = []
+    while isinstance(table, Dict) and len(table) == 1:
+        key, table = next(iter(table.items()))
+        keys.append(key)
+    return '.'.join(keys)
+
+
+def _file_format(file_format: Optional[str], name: str) -> str:
+    '''Return the registered format, by default from the extension of the file name.
+        Raise NotImplementedError if it's not known.'''
+    if file_format is None:
+        return _format_extensions.get(os.path.splitext(name)[1].lower(), 'yaml')
+    if file_format.lower() not in _formats:
+        msg = 'Unknown settings file format "{}", the formats are: {}.'
+        raise NotImplementedError(msg.format(file_format, ', '.join(sorted(_formats))))
+    return file_format.lower()
+
+
+# function that loads each format from a stream or string, see register_format
+_formats = {}  # type: Dict[str, Callable[[Loader, Union[IO, str], str], Any]]
+# format of each file extension
+_format_extensions = {}  # type: Dict[str, str]
+
+def register_format(file_format: str, load: Callable[[Loader, Union[IO, str], str], Any],
+                    extensions: Iterable[str] = ()) -> None:
+    '''Register a settings file format, files with the extensions (ie: '.json')
+        are loaded with this format by default.
+        load(loader, stream, name) is called with the Loader, a file-like object or string
+        and the name of the file. It must return the settings dictionary,
+        raise SettingsFileError if it's invalid and SettingsValueError for duplicate keys.'''
+    _formats[file_format.lower()] = load
+    for extension in extensions:
+        _format_extensions[extension.lower()] = file_format.lower()
+
+register_format('yaml', Loader._load_yaml_stream, ['.yaml', '.yml'])
+register_format('json', Loader._load_json_stream, ['.json'])
+register_format('toml', Loader._load_toml_stream, ['.toml'])
+
+
 #if __name__ == "__main__":
 #    import settings_parser.settings_config as settings_config
 #    settings = Settings(settings_config.settings)
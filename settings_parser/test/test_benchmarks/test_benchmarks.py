@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Test that the benchmarks run.
+"""
+import json
+import os
+import pytest
+
+from settings_parser.benchmarks import suite, memory
+
+
+@pytest.mark.parametrize('case', suite.CASES, ids=lambda case: case.name)
+def test_case(case):
+    '''Each case validates its configuration.'''
+    results = suite.run_case(case, 10, repeat=1)
+    assert [result['operation'] for result in results] == ['Settings.validate',
+                                                           'Loader.load_settings_file',
+                                                           'Value.validate']
+    for result in results:
+        assert result['case'] == case.name
+        assert result['size'] == 10
+        assert result['seconds'] >= 0
+        assert result['peak_memory'] > 0
+
+def test_main(tmpdir):
+    '''The results are written as JSON.'''
+    output = os.path.join(str(tmpdir), 'results.json')
+    suite.main(['--sizes', '5', '--cases', 'people', 'wide_union', '--repeat', '1',
+                '--output', output])
+    with open(output) as file:
+        results = json.load(file)
+    assert results['settings_parser']
+    assert [(result['case'], result['size']) for result in results['results']] == \
+        [('people', 5)]*3 + [('wide_union', 5)]*3
+
+def test_parallel():
+    '''The people case is validated serially, with threads and with processes.'''
+    results = suite.run_parallel(10, repeat=1)
+    assert [result['operation'] for result in results] == [
+        'Settings.validate_dict', 'Settings.validate_dict (threads)',
+        'Settings.validate_dict (processes)']
+    assert all(result['seconds'] >= 0 for result in results)
+
+def test_memory():
+    '''The bytes per schema node are positive.'''
+    assert all(node_bytes > 0 for node_bytes in memory.run(100).values())
+
+def test_formats():
+    '''The same document is loaded with each format.'''
+    from settings_parser.benchmarks import formats
+    results = formats.run([5], repeat=1)['results']
+    assert {'json', 'yaml'} <= set(result['operation'] for result in results)
+    for file_format in ['json', 'yaml', 'toml']:
+        assert formats.dump(formats.document(5), file_format)
+
+def test_large_yaml():
+    '''Each loader runs in a new process.'''
+    from settings_parser.benchmarks import large_yaml
+    results = large_yaml.run(0.01, ['libyaml-compose', 'libyaml-events'])['results']
+    assert [result['operation'] for result in results] == ['libyaml-compose', 'libyaml-events']
+    for result in results:
+        assert result['seconds'] > 0
+        assert result['peak_rss'] >= result['start_rss']
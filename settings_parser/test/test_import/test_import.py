@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Test that importing settings_parser is fast.
+"""
+import os
+import sys
+import json
+import subprocess
+
+import settings_parser
+
+# maximum number of modules imported by settings_parser (including itself)
+# and maximum import time in seconds, the time is generous to avoid flaky tests
+MODULE_BUDGET = 40
+TIME_BUDGET = 1.0
+# modules that are only imported when a file is loaded
+LAZY_MODULES = ['ruamel.yaml', 'pprint', 'multiprocessing', 'pickle', 'tempfile', 'hashlib',
+                'settings_parser.yaml_events', 'asyncio',
+                'settings_parser.parallel']
+
+CODE = '''
+import sys, time, json
+before = set(sys.modules)
+start = time.perf_counter()
+import settings_parser
+from settings_parser import Settings, Value, DictValue
+elapsed = time.perf_counter() - start
+print(json.dumps({'modules': sorted(set(sys.modules) - before), 'time': elapsed}))
+'''
+
+def _import_in_new_process(code: str) -> dict:
+    '''Run the code in a new interpreter, return what it prints as JSON.'''
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(settings_parser.__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([package_dir, env.get('PYTHONPATH', '')])
+    output = subprocess.check_output([sys.executable, '-c', code], env=env)
+    return json.loads(output.decode('utf-8'))
+
+def test_import_budget():
+    '''Importing settings_parser doesn't import the YAML backend or other slow modules.'''
+    result = _import_in_new_process(CODE)
+    modules = result['modules']
+    for module in LAZY_MODULES:
+        assert module not in modules
+    assert len(modules) <= MODULE_BUDGET, modules
+    assert result['time'] < TIME_BUDGET
+
+def test_validate_dict_without_yaml():
+    '''Validating a dictionary doesn't need ruamel.yaml.'''
+    code = '''
+import sys, json
+from settings_parser import Settings, Value
+settings = Settings({'number': Value(int, val_max=5)})
+settings.validate_dict({'number': 3})
+assert settings.number == 3
+print(json.dumps({'yaml': 'ruamel.yaml' in sys.modules}))
+'''
+    assert not _import_in_new_process(code)['yaml']
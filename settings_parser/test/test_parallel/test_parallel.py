@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Test that validating in parallel gives the same settings, warnings and errors.
+"""
+import os
+import sys
+import subprocess
+import warnings
+from typing import Dict, List
+
+import pytest
+
+from settings_parser import parallel
+from settings_parser.settings import Settings, Value, DictValue
+from settings_parser.util import SettingsValueError, SettingsExtraValueWarning
+
+
+@pytest.fixture(autouse=True)
+def chunk_size(monkeypatch):
+    '''Small chunks, so small mappings and lists are split,
+        and small configurations are validated in parallel.'''
+    monkeypatch.setattr(parallel, 'CHUNK_SIZE', 10)
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_SIZE', 0)
+
+def values():
+    '''Values with a large mapping, a large list and small sections.'''
+    return {'version': Value(int, val_max=1),
+            'people': Value(Dict[str, DictValue({'age': int, 'city': str})], len_min=50),
+            'numbers': Value(List[int], val_max=100),
+            'names': Value(List[str], len_max=3),
+            'table': Value(List[List[float]])}
+
+def config():
+    '''A configuration for values().'''
+    return {'version': 1,
+            'people': {'person{}'.format(num): {'age': num, 'city': 'city'} for num in range(95)},
+            'numbers': list(range(45)),
+            'names': ['a', 'b'],
+            'table': [[1, 2], [3, 4]]}
+
+def _outcome(settings, config_dict):
+    '''Return the settings or the error and the warnings of validating the configuration.'''
+    with warnings.catch_warnings(record=True) as warn_list:
+        warnings.simplefilter('always')
+        try:
+            settings.validate_dict(config_dict)
+            result = (dict(settings), list(settings), list(settings.get('people', {})))
+        except SettingsValueError as exc:
+            result = (type(exc), str(exc))
+    return result, [(warning.category, str(warning.message)) for warning in warn_list]
+
+@pytest.mark.parametrize('threads', [True, False], ids=['threads', 'processes'])
+def test_same_as_serial(threads):
+    '''The results, errors and warnings are the same and in the same order.'''
+    wrong_person = config()
+    wrong_person['people']['person57']['age'] = 'a'
+    wrong_person['numbers'][30] = 'a'
+    extra = config()
+    extra['people']['person23']['extra'] = 1
+    extra['people']['person83']['another'] = 1
+    short = config()
+    short['people'] = {'person{}'.format(num): {'age': num, 'city': 'city'} for num in range(15)}
+    long_list = config()
+    long_list['names'] = ['a']*25
+    wrong_number = config()
+    wrong_number['numbers'][44] = 101
+    wrong_number['names'] = 'a'
+
+    for config_dict in [config(), wrong_person, extra, short, long_list, wrong_number]:
+        serial = _outcome(Settings(values()), config_dict)
+        in_parallel = _outcome(Settings(values(), workers=3, threads=threads), config_dict)
+        assert in_parallel == serial
+
+def test_tasks():
+    '''Large mappings and lists are split into chunks, in the order of the Values.'''
+    dict_value = DictValue(values())
+    config_dict = config()
+    task_list = parallel.tasks(dict_value, config_dict)
+    kinds = [(dict_value.values_list[index].key, kind) for index, kind, _ in task_list]
+    assert kinds == ([('version', 'section')] + [('people', 'entries')]*10 +
+                     [('numbers', 'elements')]*5 + [('names', 'section'), ('table', 'section')])
+    assert [len(value) for _, kind, value in task_list if kind == 'entries'] == [10]*9 + [5]
+
+    assert len(parallel.tasks(dict_value, config_dict, keys={'names', 'version'})) == 2
+
+def test_errors_in_order():
+    '''The first error in the order of the sections is raised.'''
+    config_dict = config()
+    config_dict['people']['person5']['extra'] = 1
+    config_dict['people']['person90']['age'] = 'a'
+    config_dict['version'] = 2
+    sett = Settings(values(), workers=2, threads=True)
+    with pytest.warns(None) as record:
+        with pytest.raises(SettingsValueError) as excinfo:
+            sett.validate_dict(config_dict)
+    assert excinfo.match('Error validating section "version"')
+    assert excinfo.type == SettingsValueError
+    assert not [warning for warning in record
+                if issubclass(warning.category, SettingsExtraValueWarning)]
+
+    config_dict['version'] = 1
+    with pytest.raises(SettingsValueError) as excinfo:
+        sett.validate_dict(config_dict)
+    assert excinfo.match('Error validating section "people"')
+    assert excinfo.type == SettingsValueError
+
+    config_dict['people']['person90']['age'] = 90
+    with pytest.warns(SettingsExtraValueWarning) as record:
+        sett.validate_dict(config_dict)
+    assert len([warning for warning in record
+                if issubclass(warning.category, SettingsExtraValueWarning)]) == 1
+
+def test_small_config_serial(monkeypatch, mocker):
+    '''Configurations smaller than MIN_PARALLEL_SIZE don't use a pool.'''
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_SIZE', 1000)
+    new_pool = mocker.spy(parallel, '_new_pool')
+    sett = Settings(values(), workers=2, threads=True)
+    assert parallel.size(parallel.tasks(sett._dict_value, config())) < 1000
+    sett.validate_dict(config())
+    assert new_pool.call_count == 0
+    assert _outcome(sett, config()) == _outcome(Settings(values()), config())
+
+@pytest.mark.parametrize('threads', [True, False], ids=['threads', 'processes'])
+def test_pools_reused(monkeypatch, mocker, threads):
+    '''The pools are reused by the Settings with the same frozen Values,
+        only the last MAX_POOLS are kept.'''
+    monkeypatch.setattr(parallel, '_pools', parallel.OrderedDict())
+    monkeypatch.setattr(parallel, 'MAX_POOLS', 1)
+    new_pool = mocker.spy(parallel, '_new_pool')
+    schema = DictValue(values()).freeze()
+    for _ in range(3):
+        Settings(schema, workers=2, threads=threads).validate_dict(config())
+    assert new_pool.call_count == 1
+    old_shared, = parallel._pools.values()
+
+    # another pool replaces it, the old one is closed
+    Settings(schema, workers=3, threads=threads).validate_dict(config())
+    assert new_pool.call_count == 2
+    assert len(parallel._pools) == 1
+    assert not old_shared.kept
+    with pytest.raises(ValueError):
+        old_shared.pool.map(len, [[]])
+    for shared in parallel._pools.values():
+        shared.pool.terminate()
+
+@pytest.mark.parametrize('threads', [True, False], ids=['threads', 'processes'])
+def test_shutdown(monkeypatch, threads):
+    '''shutdown closes the kept pools, the ones in use when they finish.'''
+    monkeypatch.setattr(parallel, '_pools', parallel.OrderedDict())
+    schema = DictValue(values()).freeze()
+    Settings(schema, workers=2, threads=threads).validate_dict(config())
+    shared, = parallel._pools.values()
+    with parallel._shared_pool(schema, 3, threads) as pool:
+        parallel.shutdown()
+        assert not parallel._pools
+        with pytest.raises(ValueError):
+            shared.pool.map(len, [[]])
+        # the pool in use works until it's done
+        assert pool.map(len, [[]]) == [0]
+    with pytest.raises(ValueError):
+        pool.map(len, [[]])
+    # new pools are kept again
+    Settings(schema, workers=2, threads=threads).validate_dict(config())
+    assert len(parallel._pools) == 1
+    parallel.shutdown()
+
+def test_shutdown_at_exit():
+    '''The pools are closed when the interpreter exits, without errors.'''
+    code = '''if True:
+        from settings_parser import parallel
+        from settings_parser.settings import Settings, Value, DictValue
+        parallel.MIN_PARALLEL_SIZE = 0
+        schema = DictValue({'a': Value(int), 'b': Value(int)}).freeze()
+        Settings(schema, workers=2).validate_dict({'a': 1, 'b': 2})
+        Settings(schema, workers=2, threads=True).validate_dict({'a': 1, 'b': 2})
+        pools = [shared.pool for shared in parallel._pools.values()]
+        import atexit
+        atexit._run_exitfuncs()
+        assert not parallel._pools
+        for pool in pools:
+            try:
+                pool.map(len, [[]])
+            except ValueError:  # closed
+                continue
+            raise AssertionError('The pool is still running.')
+        '''
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(parallel.__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([package_dir, env.get('PYTHONPATH', '')])
+    process = subprocess.run([sys.executable, '-c', code], env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert process.returncode == 0
+    assert process.stderr == b''
+
+def test_unfrozen_values_processes(mocker):
+    '''Pools of processes with Values that aren't frozen are used only once.'''
+    terminate = mocker.spy(parallel.multiprocessing.pool.Pool, 'terminate')
+    sett = Settings(values())
+    sett.validate_dict(config())
+    assert parallel.validate(DictValue(values()), config(), workers=2) == dict(sett)
+    assert terminate.call_count == 1
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Test the profiling of the validation.
+"""
+from typing import Dict, List
+import pytest
+
+from settings_parser import Settings, Value, DictValue
+from settings_parser import profiling
+from settings_parser.util import SettingsValueError
+
+CONFIG = '''version: 1
+people: {carmen: {age: 28, city: ghent}, pedro: {age: 28, city: utrecht}}
+matrix: [[1, 2], [3, 4], [5, 6]]
+'''
+
+@pytest.fixture(scope='function')
+def settings_dict():
+    return {'version': Value(int, val_min=1, val_max=1),
+            'people': Value(Dict[str, DictValue({'age': int, 'city': str})]),
+            'matrix': Value(List[List[int]])}
+
+
+def test_profile_report(settings_dict):
+    '''The time of each setting and of parsing the configuration is recorded.'''
+    sett = Settings(settings_dict, profile=True)
+    sett.validate_string(CONFIG)
+    profile = sett.profile_report()
+    entries = {entry.path: entry for entry in profile.report()}
+    assert set(entries) == {'', 'version', 'people', 'people.age', 'people.city', 'matrix'}
+    # the validation of all settings is the slowest
+    assert profile.report()[0].path == ''
+    assert [entry.seconds for entry in profile.report()] == \
+        sorted((entry.seconds for entry in profile.report()), reverse=True)
+
+    assert entries['people.age'].calls == 2
+    assert entries['matrix'].nodes == 3
+    assert entries['matrix'].elements == 6
+    assert entries[''].elements == 1 + 4 + 6
+    assert list(profile.parse_times) == ['<string>']
+    assert profile.parse_seconds > 0
+    assert 'people.city' in str(profile)
+
+    # a new profile for each validation
+    sett.validate_dict({'version': 1, 'people': {}, 'matrix': []})
+    assert sett.profile_report() is not profile
+    assert sett.profile_report().parse_seconds == 0
+
+def test_disabled(settings_dict):
+    '''Without profiling nothing is recorded.'''
+    sett = Settings(settings_dict)
+    sett.validate_string(CONFIG)
+    assert profiling.active_profile() is None
+    with pytest.raises(SettingsValueError) as excinfo:
+        sett.profile_report()
+    assert excinfo.match('Profiling is not enabled')
+    assert excinfo.type == SettingsValueError
+
+def test_profile_context_manager(settings_dict):
+    '''Everything validated in the context manager is recorded in the same Profile.'''
+    with profiling.profile() as profile:
+        Value(List[int], name='numbers').validate([1, 2, 3])
+        DictValue(settings_dict).validate({'version': 1, 'people': {}, 'matrix': [[1]]})
+        Settings(settings_dict).validate_string(CONFIG)
+    assert profiling.active_profile() is None
+    entries = {entry.path: entry for entry in profile.report()}
+    assert entries['numbers'].elements == 3
+    assert entries['version'].calls == 2
+    assert entries[''].calls == 2
+
+    # failed validations are not recorded
+    with profiling.profile() as profile:
+        with pytest.raises(SettingsValueError):
+            Value(int, name='number').validate('a')
+    assert profile.report() == []
@@ -7,15 +7,25 @@ Created on Sat Oct 22 00:10:24 2016
 
 import pytest
 import os
+import sys
 import datetime
 
+import ruamel.yaml as yaml
+from ruamel.yaml.parser import Parser
+
 import settings_parser.settings as settings
 from settings_parser.settings import Value, DictValue, Dict
+from settings_parser.value import NamedValue
 from settings_parser.util import SettingsFileError, SettingsExtraValueWarning, SettingsValueError
+from settings_parser.util import SettingsFileWarning
 from settings_parser.util import temp_filename
 
 test_folder_path = os.path.dirname(os.path.abspath(__file__))
 
+# the libyaml based loaders are only available if ruamel.yaml was built with it
+requires_libyaml = pytest.mark.skipif(not getattr(yaml, '__with_libyaml__', False),
+                                      reason='ruamel.yaml was built without libyaml')
+
 @pytest.fixture(scope='function')
 def good_settings():
 
@@ -121,6 +131,76 @@ key1: 10
     assert excinfo.match(r"Duplicate label")
     assert excinfo.type == SettingsValueError
 
+def test_duplicate_nested_key(settings_dict):
+    data = '''key1:
+    key2: 5
+    key2: 10
+'''
+    with pytest.raises(SettingsValueError) as excinfo:
+        with temp_filename(data) as filename:
+            settings.Settings(settings_dict).validate(filename)
+    assert excinfo.match(r"Duplicate label key2")
+    assert excinfo.type == SettingsValueError
+
+def test_merge_keys():
+    '''Keys from merged mappings can be overridden, they are not duplicates.'''
+    data = '''base: &base
+    age: 28
+    city: ghent
+person:
+    <<: *base
+    city: utrecht
+'''
+    with temp_filename(data) as filename:
+        file_dict = settings.Loader().load_settings_file(filename)
+    assert file_dict == {'base': {'age': 28, 'city': 'ghent'},
+                         'person': {'age': 28, 'city': 'utrecht'}}
+
+def test_reuse_loader(settings_dict, good_settings):
+    '''The same Loader can load many files.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    loader = settings.Loader()
+    for _ in range(3):
+        sett = settings.Settings(settings_dict)
+        sett.validate(filename, loader=loader)
+        assert sett == good_settings
+
+@requires_libyaml
+@pytest.mark.parametrize('keep_config', ['text', 'none'])
+def test_yaml_loaders_libyaml(settings_dict, good_settings, mocker, keep_config):
+    '''Files are loaded with libyaml if it's available, composing the nodes with ruamel.yaml.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    compose = mocker.spy(yaml.YAML, 'load')
+
+    loader = settings.Loader()
+    assert loader._yaml().Parser is not Parser
+    sett = settings.Settings(settings_dict, keep_config=keep_config)
+    sett.validate(filename, loader=loader)
+    assert sett == good_settings
+    assert compose.call_count == 1
+
+@pytest.mark.parametrize('keep_config', ['text', 'none'])
+def test_yaml_loaders(settings_dict, good_settings, keep_config):
+    '''Files are loaded with the pure Python parser if pure is True,
+        with the same settings.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+
+    loader = settings.Loader(pure=True)
+    assert loader._yaml().Parser is Parser
+    sett = settings.Settings(settings_dict, keep_config=keep_config)
+    sett.validate(filename, loader=loader)
+    assert sett == good_settings
+
+@pytest.mark.parametrize('pure', [False, True])
+def test_yaml_loaders_duplicate_key(pure):
+    '''Both YAML parsers reject duplicate keys.'''
+    loader = settings.Loader(pure)
+    with pytest.raises(SettingsValueError) as excinfo:
+        with temp_filename('a: 1\nb: 2\na: 3\n') as filename:
+            loader.load_settings_file(filename)
+    assert excinfo.match(r"Duplicate label a!")
+    assert excinfo.type == SettingsValueError
+
 
 # test extra value in section lattice
 def test_extra_value(settings_dict):
@@ -162,4 +242,749 @@ def test_load_from_dict(settings_dict, good_settings):
 
     sett_from_d = settings.Settings.load_from_dict(good_settings)
 
-    assert sett_from_d == sett
\ No newline at end of file
+    assert sett_from_d == sett
+
+def test_validate_string_stream_dict(settings_dict, good_settings):
+    '''Validate settings from a string, a stream or a dictionary.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    with open(filename) as file:
+        file_text = file.read()
+
+    sett = settings.Settings(settings_dict)
+    sett.validate_string(file_text)
+    assert sett == good_settings
+    assert sett._config_file == file_text
+
+    sett = settings.Settings(settings_dict)
+    with open(filename) as file:
+        sett.validate_stream(file)
+    assert sett == good_settings
+    assert sett._config_file == file_text
+
+    sett = settings.Settings(settings_dict)
+    sett.validate_dict({'people': good_settings['people'], 'version': 1, 'number': 3,
+                        'date1': [2017, 6, 17], 'date2': {'year': 2017, 'month': 6, 'day': 17}})
+    assert sett == good_settings
+
+    with pytest.raises(SettingsValueError) as excinfo:
+        settings.Settings(settings_dict).validate_dict(['version', 1])
+    assert excinfo.match(r"are not a dictionary")
+    assert excinfo.type == SettingsValueError
+
+    with pytest.raises(SettingsFileError) as excinfo:
+        settings.Settings(settings_dict).validate_string('key: value:')
+    assert excinfo.match(r"Error while parsing the config file")
+    assert excinfo.type == SettingsFileError
+
+def test_keep_config(settings_dict, good_settings):
+    '''The original configuration can be kept, only its hash, or nothing.'''
+    import hashlib
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    with open(filename) as file:
+        file_text = file.read()
+
+    sett = settings.Settings(settings_dict, keep_config='hash')
+    sett.validate(filename)
+    assert sett == good_settings
+    assert sett._config_file == hashlib.sha256(file_text.encode('utf-8')).hexdigest()
+
+    sett = settings.Settings(settings_dict, keep_config='none')
+    sett.validate(filename)
+    assert sett == good_settings
+    assert sett._config_file == ''
+
+    with pytest.raises(SettingsValueError) as excinfo:
+        settings.Settings(settings_dict, keep_config='all')
+    assert excinfo.match(r"keep_config must be")
+    assert excinfo.type == SettingsValueError
+
+def test_cache(settings_dict, good_settings, tmpdir, mocker):
+    '''Validated settings are cached by configuration and Values.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    cache_dir = str(tmpdir.join('cache'))
+
+    sett = settings.Settings(settings_dict, cache_dir=cache_dir)
+    sett.validate(filename)
+    assert sett == good_settings
+    assert len(os.listdir(cache_dir)) == 1
+
+    # the same file and Values are loaded from the cache
+    sett = settings.Settings(settings_dict, cache_dir=cache_dir)
+    spy_load = mocker.spy(settings.Loader, 'load_settings_stream')
+    spy_validate = mocker.spy(settings.Settings, '_validate_all_values')
+    sett.validate(filename)
+    assert sett == good_settings
+    assert sett.people == good_settings['people']
+    assert spy_load.call_count == 0
+    assert spy_validate.call_count == 0
+
+    # different Values aren't
+    settings_dict['number'] = Value(int, val_max=2)
+    with pytest.raises(SettingsValueError) as excinfo:
+        settings.Settings(settings_dict, cache_dir=cache_dir).validate(filename)
+    assert excinfo.match("cannot be larger than 2")
+
+    # and a different file isn't either
+    with open(filename) as file:
+        file_text = file.read().replace('number: 3', 'number: 1')
+    sett = settings.Settings(settings_dict, cache_dir=cache_dir)
+    sett.validate_string(file_text)
+    assert sett.number == 1
+    assert len(os.listdir(cache_dir)) == 2
+
+    # the same text in another format isn't either
+    json_filename = str(tmpdir.join('config.json'))
+    yaml_filename = str(tmpdir.join('config.yaml'))
+    for config_filename in (json_filename, yaml_filename):
+        with open(config_filename, 'wt') as file:
+            file.write('{"number": 1}')
+        settings.Settings({'number': int}, cache_dir=cache_dir).validate(config_filename)
+    assert len(os.listdir(cache_dir)) == 4
+
+def test_cache_warnings(settings_dict, tmpdir):
+    '''Warnings are given also when the settings are loaded from the cache.'''
+    data = 'version: 1\nextra: 3\n'
+    cache_dir = str(tmpdir)
+    for _ in range(2):
+        with pytest.warns(SettingsExtraValueWarning) as record:
+            sett = settings.Settings({'version': settings_dict['version']}, cache_dir=cache_dir)
+            sett.validate_string(data)
+        assert sett == {'version': 1}
+        assert len(record) == 2
+
+def test_reload(settings_dict, good_settings, mocker):
+    '''Reloading a file only validates the sections that changed.'''
+    orig_filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    with open(orig_filename) as file:
+        file_text = file.read()
+
+    settings_dict['optional'] = Value(int, kind=Value.optional)
+    sett = settings.Settings(settings_dict, reload=True)
+    with temp_filename(file_text) as filename:
+        sett.validate(filename)
+        people = sett.people
+        assert sett.reload() == set()
+        assert sett == good_settings
+
+        with open(filename, 'wt') as file:
+            file.write(file_text.replace('number: 3', 'number: 5') + '\noptional: 2\n')
+        spy = mocker.spy(NamedValue, 'validate')
+        assert sett.reload() == {'number', 'optional'}
+        assert sett.number == 5
+        assert sett.optional == 2
+        # unchanged sections are not validated again
+        assert spy.call_count == 2
+        assert sett.people is people
+
+        with open(filename, 'wt') as file:
+            file.write(file_text)
+        assert sett.reload() == {'number', 'optional'}
+        assert sett == good_settings
+        assert 'optional' not in sett
+
+        # errors in the changed sections are still found
+        with open(filename, 'wt') as file:
+            file.write(file_text.replace('version: 1', 'version: 2'))
+        with pytest.raises(SettingsValueError) as excinfo:
+            sett.reload()
+        assert excinfo.match("cannot be larger than 1")
+        assert sett == good_settings
+
+    with pytest.raises(SettingsFileError) as excinfo:
+        settings.Settings(settings_dict).reload()
+    assert excinfo.match("There is no settings file to reload")
+
+    # by default the loaded configuration isn't kept, everything is validated again
+    sett = settings.Settings(settings_dict)
+    sett.validate(orig_filename)
+    assert sett._file_dict is None
+    spy.reset_mock()
+    assert sett.reload() == set(good_settings)
+    validated = [call[0][0].key for call in spy.call_args_list if call[0][0].key in good_settings]
+    assert sorted(validated) == sorted(good_settings)
+    assert sett == good_settings
+
+def test_lazy(settings_dict, good_settings, mocker):
+    '''Lazy Settings validate each section only the first time it's accessed.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    spy = mocker.spy(NamedValue, 'validate')
+    sett = settings.Settings(settings_dict, lazy=True, profile=True)
+    sett.validate(filename)
+    assert spy.call_count == 0
+    assert set(sett) == set(good_settings)
+
+    assert sett.version == 1
+    assert sett['date1'] == datetime.date(2017, 6, 17)
+    assert sett.get('version') == 1
+    assert spy.call_count == 2
+    assert {entry.path for entry in sett.profile_report().report()} == {'version', 'date1'}
+
+    assert dict(sett) == good_settings
+    # each section was validated once
+    validated = [call[0][0].key for call in spy.call_args_list if call[0][0].key in good_settings]
+    assert sorted(validated) == sorted(good_settings)
+    # all sections are validated, the class is the normal one again
+    assert not isinstance(sett, settings._LazySettings)
+    assert sett == good_settings
+
+    sett = settings.Settings(settings_dict, lazy=True)
+    sett.validate(filename)
+    sett.force_all()
+    assert not isinstance(sett, settings._LazySettings)
+    assert sett.settings == good_settings
+
+def test_lazy_errors(settings_dict):
+    '''Missing and extra sections are found when validating, wrong values when accessed.'''
+    data = '''version: 2
+number: 3
+people: {}
+date1: [2017, 6, 17]
+date2: [2017, 6, 17]
+extra: 1
+'''
+    sett = settings.Settings(settings_dict, lazy=True)
+    with pytest.warns(SettingsExtraValueWarning):
+        with temp_filename(data) as filename:
+            sett.validate(filename)
+    assert sett.number == 3
+    with pytest.raises(SettingsValueError) as excinfo:
+        sett.version
+    assert excinfo.match("cannot be larger than 1")
+    assert excinfo.type == SettingsValueError
+    with pytest.raises(SettingsValueError) as excinfo:
+        sett.force_all()
+    assert excinfo.match("cannot be larger than 1")
+    # a new value replaces the section
+    sett.version = 1
+    sett.force_all()
+    assert sett.version == 1
+
+    with pytest.raises(SettingsFileError) as excinfo:
+        with temp_filename(data.replace('number: 3', '')) as filename:
+            settings.Settings(settings_dict, lazy=True).validate(filename)
+    assert excinfo.match("Sections that are needed but not present in the file")
+    assert excinfo.type == SettingsFileError
+
+def test_lazy_reload_pickle(settings_dict, good_settings):
+    '''Changed sections are validated when accessed after reload. Pickling validates all.'''
+    import pickle
+    orig_filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    with open(orig_filename) as file:
+        file_text = file.read()
+    sett = settings.Settings(settings_dict, lazy=True, reload=True)
+    with temp_filename(file_text) as filename:
+        sett.validate(filename)
+        people = sett.people
+        with open(filename, 'wt') as file:
+            file.write(file_text.replace('number: 3', 'number: 5'))
+        assert sett.reload() == {'number'}
+    assert 'number' in sett._pending
+    assert sett.people is people
+
+    good_settings['number'] = 5
+    assert pickle.loads(pickle.dumps(sett)) == good_settings
+    assert not isinstance(sett, settings._LazySettings)
+
+def test_concurrent_validation(settings_dict, good_settings):
+    '''Settings with the same Values are validated in many threads at once,
+        each one gets only its own warnings and errors.'''
+    from concurrent.futures import ThreadPoolExecutor
+    from settings_parser.util import record_warnings
+    values = DictValue(settings_dict)
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    file_dict = settings.Loader().load_settings_file(filename)
+
+    def validate(num):
+        config = dict(file_dict, number=num)
+        kind = num % 3
+        if kind == 1:
+            config['extra{}'.format(num)] = num
+        elif kind == 2:
+            config['version'] = num
+        sett = settings.Settings(values)
+        with record_warnings() as warn_list:
+            try:
+                sett.validate_dict(config)
+            except SettingsValueError as exc:
+                return kind, num, None, str(exc), warn_list
+        return kind, num, dict(sett), None, warn_list
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(validate, range(300)))
+    for kind, num, sett, error, warn_list in results:
+        if kind == 2:
+            assert sett is None
+            assert error == ('Error validating section "version". Details: '
+                             'Value(s) of version ({}) cannot be larger than 1.'.format(num))
+            assert not warn_list
+            continue
+        assert error is None
+        assert sett == dict(good_settings, number=num)
+        if kind == 0:
+            assert not warn_list
+        else:
+            assert [warning.category for warning in warn_list] == [SettingsFileWarning,
+                                                                   SettingsExtraValueWarning]
+            assert all("{{'extra{}'}}".format(num) in str(warning.message)
+                       for warning in warn_list)
+
+def test_lazy_threads(settings_dict, good_settings, mocker):
+    '''Sections of lazy Settings accessed from many threads are validated once.'''
+    from concurrent.futures import ThreadPoolExecutor
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    sett = settings.Settings(settings_dict, lazy=True)
+    sett.validate(filename)
+    spy = mocker.spy(NamedValue, 'validate')
+    keys = sorted(good_settings) * 20
+    with ThreadPoolExecutor(8) as executor:
+        values = list(executor.map(sett.__getitem__, keys))
+    assert values == [good_settings[key] for key in keys]
+    validated = [call[0][0].key for call in spy.call_args_list if call[0][0].key in good_settings]
+    assert sorted(validated) == sorted(good_settings)
+    assert not isinstance(sett, settings._LazySettings)
+
+@pytest.mark.parametrize('workers, threads', [(1, False), (2, False), (2, True)],
+                         ids=['serial', 'processes', 'threads'])
+def test_validate_many(settings_dict, good_settings, workers, threads):
+    '''Validate many files at once, errors don't stop the other files.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    with open(filename) as file:
+        file_text = file.read()
+    sett = settings.Settings(settings_dict)
+    with temp_filename(file_text.replace('version: 1', 'version: 2')) as bad_filename:
+        with temp_filename(file_text.replace('version: 1', 'version: 1\nextra: 1')) as extra:
+            filenames = [filename, bad_filename, extra, 'non_existing_file.txt']
+            with pytest.warns(SettingsExtraValueWarning):
+                results = sett.validate_many(filenames, workers=workers, threads=threads)
+
+    assert [result.filename for result in results] == filenames
+    assert results[0].settings == good_settings
+    assert results[0].error is None
+    assert results[0].settings.version == 1
+    assert not results[0].warnings
+    # the results are Settings with the same Values
+    assert results[0].settings._dict_value is sett._dict_value
+    assert results[2].settings == good_settings
+    assert [category for category, _ in results[2].warnings] == [SettingsFileWarning,
+                                                                 SettingsExtraValueWarning]
+    assert results[1].settings is None
+    assert isinstance(results[1].error, SettingsValueError)
+    assert 'cannot be larger than 1' in str(results[1].error)
+    assert isinstance(results[3].error, SettingsFileError)
+    # the instance itself doesn't change
+    assert sett == {}
+
+@pytest.mark.parametrize('workers, threads', [(1, False), (2, True)], ids=['serial', 'threads'])
+def test_validate_many_concurrent(settings_dict, good_settings, workers, threads):
+    '''Concurrent calls with different Values don't mix them up.'''
+    from concurrent.futures import ThreadPoolExecutor
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    sett = settings.Settings(settings_dict)
+    other_sett = settings.Settings({'a': int})
+    with temp_filename('a: 1') as other_filename:
+
+        def validate(num):
+            if num % 2:
+                return sett.validate_many([filename] * 4, workers=workers, threads=threads)
+            return other_sett.validate_many([other_filename] * 4, workers=workers, threads=threads)
+
+        with ThreadPoolExecutor(4) as executor:
+            all_results = list(executor.map(validate, range(40)))
+    for num, results in enumerate(all_results):
+        assert all(result.error is None for result in results)
+        expected = good_settings if num % 2 else {'a': 1}
+        assert all(result.settings == expected for result in results)
+
+@pytest.mark.parametrize('keep_config', ['none', 'text'])
+def test_stream_lists(keep_config, mocker):
+    '''Lists are validated while the file is parsed, with the same results and errors.'''
+    from typing import List
+    values = {'matrix': Value(List[List[int]], val_max=10),
+              'table': Value(List[List[float]], array=True),
+              'names': Value(List[str]),
+              'number': int}
+    data = '''number: 3
+matrix: [[1, 2], [3, 4]]
+table:
+    - [1, 2.5]
+    - [3, 4]
+names: [a, 2]
+'''
+    sett = settings.Settings(values, keep_config=keep_config, stream_lists=True)
+    validate_items = mocker.spy(NamedValue, 'validate_items')
+    with temp_filename(data) as filename:
+        sett.validate(filename)
+        # the lists were validated while parsing
+        assert validate_items.call_count == 3
+        expected = settings.Settings(values, keep_config=keep_config)
+        expected.validate(filename)
+    assert validate_items.call_count == 3
+    assert list(sett) == list(expected) == ['matrix', 'table', 'names', 'number']
+    assert sett.matrix == expected.matrix == [[1, 2], [3, 4]]
+    assert sett.table.tolist() == expected.table.tolist() == [[1, 2.5], [3, 4]]
+    assert sett.names == ['a', '2']
+    assert sett.number == 3
+
+    with temp_filename(data.replace('[3, 4]]', '[3, 40]]')) as filename:
+        with pytest.raises(SettingsValueError) as excinfo:
+            sett.validate(filename)
+        with pytest.raises(SettingsValueError) as expected_excinfo:
+            expected.validate(filename)
+    assert str(excinfo.value) == str(expected_excinfo.value)
+    assert excinfo.match('Error validating section "matrix".')
+    assert excinfo.type == SettingsValueError
+
+def test_iter_validate(settings_dict, good_settings):
+    '''Each document is validated separately, errors don't stop the rest
+        but an error loading the stream is the last result. Null documents are skipped.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    with open(filename) as file:
+        file_text = file.read()
+    documents = [file_text,
+                 file_text.replace('version: 1', 'version: 2'),
+                 file_text.replace('version: 1', 'version: 1\nextra: 1'),
+                 '',
+                 file_text.replace('number: 3', 'number: 4'),
+                 '[1, 2]',
+                 'a: [1']
+    sett = settings.Settings(settings_dict)
+    with pytest.warns(SettingsExtraValueWarning):
+        results = list(sett.iter_validate('\n---\n'.join(documents)))
+    # the empty document 3 is skipped
+    assert [result.index for result in results] == [0, 1, 2, 4, 5, 6]
+    results_dict = {result.index: result for result in results}
+    assert results_dict[0].settings == good_settings
+    assert results_dict[0].settings.version == 1
+    assert results_dict[0].error is None
+    assert results_dict[1].settings is None
+    assert isinstance(results_dict[1].error, SettingsValueError)
+    assert 'cannot be larger than 1' in str(results_dict[1].error)
+    assert results_dict[2].settings == good_settings
+    assert results_dict[4].settings == dict(good_settings, number=4)
+    assert isinstance(results_dict[5].error, SettingsFileError)
+    assert 'document 5 is empty or otherwise invalid' in str(results_dict[5].error)
+    assert isinstance(results_dict[6].error, SettingsFileError)
+    assert 'Error while parsing the config file' in str(results_dict[6].error)
+    # the instance itself doesn't change
+    assert sett == {}
+
+    # a trailing --- doesn't add a document
+    results = list(sett.iter_validate(file_text + '\n---\n'))
+    assert [(result.index, result.error) for result in results] == [(0, None)]
+    assert results[0].settings == good_settings
+    assert list(sett.iter_validate('')) == []
+
+    with temp_filename('\n---\n'.join(documents[:1] * 3)) as multi_filename:
+        results = list(sett.iter_validate_file(multi_filename))
+    assert [result.settings for result in results] == [good_settings] * 3
+
+    results = list(sett.iter_validate_file('non_existing_file.txt'))
+    assert len(results) == 1
+    assert isinstance(results[0].error, SettingsFileError)
+
+def _run(coroutine):
+    '''Run the coroutine in a new event loop.'''
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+def test_avalidate(settings_dict, good_settings):
+    '''Validate files without blocking the event loop,
+        the warnings are issued in the caller's thread.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    with open(filename) as file:
+        file_text = file.read()
+    sett = settings.Settings(settings_dict, profile=True)
+    _run(sett.avalidate(filename))
+    assert sett == good_settings
+    assert sett.version == 1
+    assert sett._filename == filename
+    assert sett._config_file == file_text
+    assert set(good_settings) <= {entry.path for entry in sett.profile_report().report()}
+
+    with temp_filename(file_text.replace('version: 1', 'version: 1\nextra: 1')) as extra_filename:
+        with pytest.warns(SettingsExtraValueWarning):
+            _run(sett.avalidate(extra_filename))
+    assert sett == good_settings
+
+    with temp_filename(file_text.replace('version: 1', 'version: 2')) as bad_filename:
+        with pytest.raises(SettingsValueError) as excinfo:
+            _run(sett.avalidate(bad_filename))
+    assert excinfo.match("cannot be larger than 1")
+    assert excinfo.type == SettingsValueError
+    # the settings don't change if there's an error
+    assert sett == good_settings
+
+    sett = settings.Settings(settings_dict, lazy=True)
+    _run(sett.avalidate(filename))
+    assert isinstance(sett, settings._LazySettings)
+    assert sett.people == good_settings['people']
+    assert sett == good_settings
+
+def test_avalidate_many(settings_dict, good_settings, mocker):
+    '''Validate many files concurrently, errors don't stop the other files.'''
+    from concurrent.futures import ThreadPoolExecutor
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    with open(filename) as file:
+        file_text = file.read()
+    sett = settings.Settings(settings_dict)
+    empty_copy = mocker.spy(settings.Settings, '_empty_copy')
+    with temp_filename(file_text.replace('version: 1', 'version: 2')) as bad_filename:
+        filenames = [filename, bad_filename, filename, 'non_existing_file.txt'] * 5
+        with ThreadPoolExecutor(4) as executor:
+            results = _run(sett.avalidate_many(filenames, executor=executor, limit=3))
+
+    assert [result.filename for result in results] == filenames
+    for result in results[::4] + results[2::4]:
+        assert result.settings == good_settings
+        assert result.settings.version == 1
+        assert result.error is None
+    assert all(isinstance(result.error, SettingsValueError) for result in results[1::4])
+    assert all(isinstance(result.error, SettingsFileError) for result in results[3::4])
+    # one new Settings for each file
+    assert empty_copy.call_count == len(filenames)
+    # the instance itself doesn't change
+    assert sett == {}
+
+def test_avalidate_cancel(settings_dict, mocker):
+    '''Cancelled validations don't run if they haven't started, the settings don't change.'''
+    import asyncio
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    sett = settings.Settings(settings_dict)
+    spy = mocker.spy(settings.Settings, 'validate')
+    release = threading.Event()
+
+    async def cancel(coroutine):
+        task = asyncio.ensure_future(coroutine)
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with ThreadPoolExecutor(1) as executor:
+        # the only worker is busy
+        executor.submit(release.wait)
+        _run(cancel(sett.avalidate(filename, executor=executor)))
+        _run(cancel(sett.avalidate_many([filename] * 3, executor=executor)))
+        release.set()
+    assert spy.call_count == 0
+    assert sett == {}
+
+def test_attributes(settings_dict, good_settings):
+    '''Settings are attributes of each instance, not of the class.'''
+    import copy
+    import pickle
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    sett = settings.Settings(settings_dict)
+    sett.validate(filename)
+    assert sett.version == 1
+    assert 'version' in dir(sett)
+    assert not hasattr(settings.Settings, 'version')
+    assert not hasattr(settings.Settings({'version': int}), 'version')
+    assert isinstance(sett, settings.Settings)
+
+    del sett.version
+    assert not hasattr(sett, 'version')
+    with pytest.raises(AttributeError):
+        sett.version
+    sett.version = 2
+    assert sett.version == sett['version'] == 2
+
+    assert copy.copy(sett) == sett
+    assert pickle.loads(pickle.dumps(settings.Settings.load_from_dict(good_settings))) == good_settings
+
+    sett_from_d = settings.Settings.load_from_dict({'key{}'.format(num): num for num in range(100)})
+    assert sett_from_d.key50 == 50
+    assert not hasattr(settings.Settings, 'key50')
+
+def test_shared_values(settings_dict, good_settings):
+    '''A frozen DictValue is shared by all Settings created with it.'''
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    dict_value = DictValue(settings_dict).freeze()
+    sett1 = settings.Settings(dict_value)
+    sett2 = settings.Settings(dict_value)
+    assert sett1._dict_value is sett2._dict_value is dict_value
+    sett1.validate(filename)
+    sett2.validate(filename)
+    assert sett1 == sett2 == good_settings
+
+    with pytest.raises(AttributeError) as excinfo:
+        dict_value.values_list[0].val_max = 2
+    assert excinfo.match('the NamedValue is frozen')
+    with pytest.raises(AttributeError) as excinfo:
+        dict_value.kind = DictValue.optional
+    assert excinfo.match('the DictValue is frozen')
+    # the DictValue in the type of people is frozen as well
+    people_dict_value = settings_dict['people'].val_type.__args__[1]
+    with pytest.raises(AttributeError):
+        people_dict_value.kind = DictValue.optional
+    # the Values are referenced, not copied
+    assert dict_value.values_list[0].value is settings_dict['version']
+    with pytest.raises(AttributeError):
+        settings_dict['version'].val_max = 2
+
+def test_copied_values(settings_dict, good_settings):
+    '''The caller's Values aren't frozen, they are copied for each Settings.
+        A frozen DictValue is shared.'''
+    sett1 = settings.Settings(settings_dict)
+    sett2 = settings.Settings(settings_dict)
+    assert sett1._dict_value is not sett2._dict_value
+    assert sett1._dict_value._frozen
+    assert sett1._dict_value.values_list[0].value is not settings_dict['version']
+    dict_value = DictValue(settings_dict)
+    assert settings.Settings(dict_value)._dict_value is not dict_value
+    assert not dict_value._frozen
+    dict_value.freeze()
+    assert settings.Settings(dict_value)._dict_value is dict_value
+
+    # changing the Values changes the new Settings, not the old ones
+    settings_dict = {'version': Value(int, val_min=1, val_max=1)}
+    sett1 = settings.Settings(settings_dict)
+    settings_dict['version'].val_max = 0
+    sett3 = settings.Settings(settings_dict)
+    sett1.validate_dict({'version': 1})
+    assert sett1 == {'version': 1}
+    with pytest.raises(SettingsValueError) as excinfo:
+        sett3.validate_dict({'version': 1})
+    assert excinfo.match('version')
+
+def test_pickle(settings_dict, good_settings):
+    '''Validated Settings can be pickled with their Values.'''
+    import pickle
+    filename = os.path.join(test_folder_path, 'test_standard_config.txt')
+    sett = settings.Settings(settings_dict, profile=True)
+    sett.validate(filename)
+    unpickled_sett = pickle.loads(pickle.dumps(sett))
+    assert unpickled_sett == good_settings
+    assert type(unpickled_sett) is type(sett)
+    assert unpickled_sett.people == good_settings['people']
+    assert unpickled_sett._config_file == sett._config_file
+    assert unpickled_sett.profile_report() is None
+    # the Values can validate again
+    assert unpickled_sett.reload() == set(good_settings)
+    unpickled_sett.validate(filename)
+    assert unpickled_sett == good_settings
+
+    # not validated
+    assert repr(pickle.loads(pickle.dumps(settings.Settings(settings_dict)))) == \
+        repr(settings.Settings(settings_dict))
+
+def test_settings_classes(tmpdir):
+    '''The Settings with the same Values share their class whatever items are present,
+        and only the most recently used classes are kept.'''
+    filename = os.path.join(str(tmpdir), 'config.yml')
+    settings_dict = {'first': Value(int, kind=Value.optional),
+                     'second': Value(int, kind=Value.optional)}
+    classes = set()
+    for text in ['first: 1', 'second: 2', 'first: 1\nsecond: 2']:
+        with open(filename, 'wt') as file:
+            file.write(text)
+        sett = settings.Settings(settings_dict)
+        sett.validate(filename)
+        classes.add(type(sett))
+    assert len(classes) == 1
+    assert sett.first == 1 and sett.second == 2
+    del sett['second']
+    assert not hasattr(sett, 'second')
+    with pytest.raises(AttributeError):
+        sett.second
+
+    for num in range(2*settings._SETTINGS_CLASSES_SIZE):
+        key = 'key_{}'.format(num)
+        settings.Settings({key: Value(int)}).validate_dict({key: 1})
+    assert len(settings._settings_classes) <= settings._SETTINGS_CLASSES_SIZE
+
+GOOD_JSON = '''{"version": 1, "number": 3,
+"people": {"pedro": {"age": 28, "city": "utrecht"}, "carmen": {"age": 28, "city": "ghent"},
+           "maria": {"age": 32, "city": "madrid"}, "teresa": {"age": 34, "city": "madrid"}},
+"date1": [2017, 6, 17], "date2": {"year": 2017, "month": 6, "day": 17}}'''
+
+GOOD_TOML = '''version = 1
+number = 3
+date1 = [2017, 6, 17]
+date2 = {year = 2017, month = 6, day = 17}
+[people]
+pedro = {age = 28, city = "utrecht"}
+carmen = {age = 28, city = "ghent"}
+maria = {age = 32, city = "madrid"}
+teresa = {age = 34, city = "madrid"}
+'''
+
+@pytest.mark.parametrize('extension, text', [('.json', GOOD_JSON), ('.toml', GOOD_TOML),
+                                             ('.yml', GOOD_JSON)])
+def test_formats(settings_dict, good_settings, tmpdir, extension, text):
+    '''The format of the files is found from the extension.'''
+    if extension == '.toml':
+        pytest.importorskip('tomli' if sys.version_info < (3, 11) else 'tomllib')
+    filename = os.path.join(str(tmpdir), 'config' + extension)
+    with open(filename, 'wt') as file:
+        file.write(text)
+    sett = settings.Settings(settings_dict)
+    sett.validate(filename)
+    assert sett == good_settings
+    assert settings.Loader().load_settings_file(filename)['people']['pedro']['age'] == 28
+
+    # any extension with an explicit format
+    other_filename = os.path.join(str(tmpdir), 'config.cfg')
+    with open(other_filename, 'wt') as file:
+        file.write(text)
+    file_format = 'yaml' if extension == '.yml' else extension[1:]
+    assert settings.Loader().load_settings_file(other_filename, file_format) == \
+        settings.Loader().load_settings_file(filename)
+
+@pytest.mark.parametrize('file_format, text', [('json', '{"a": 1, "b": {"c": 1, "c": 2}}'),
+                                               ('yaml', 'a: 1\nb: {c: 1, c: 2}'),
+                                               ('toml', 'a = 1\nb = {c = 1, c = 2}'),
+                                               ('toml', 'a = 1\n[b]\nc = 1\nc = 2'),
+                                               ('toml', 'a = 1\n[c]\nd = 1\n[c]\ne = 2\n')],
+                         ids=['json', 'yaml', 'toml inline', 'toml', 'toml table'])
+def test_format_duplicate_key(file_format, text):
+    '''Duplicate keys are not allowed in any format.'''
+    if file_format == 'toml':
+        pytest.importorskip('tomli' if sys.version_info < (3, 11) else 'tomllib')
+    with pytest.raises(SettingsValueError) as excinfo:
+        settings.Loader().load_settings_stream(text, file_format)
+    assert excinfo.match(r"Duplicate label c")
+    assert excinfo.type == SettingsValueError
+
+@pytest.mark.parametrize('text, key', [('a = 1\n"c = d" = 1\n"c = d" = 2', 'c = d'),
+                                       ('a = 1\nc.d = 1\nc.d = [\n  2,\n  3,\n]\ne = 4\n', 'c.d'),
+                                       ('a = 1\n[c."d=e"]\n[c."d=e"]\n', 'c.d=e')],
+                         ids=['quoted', 'dotted multiline', 'quoted table'])
+def test_toml_duplicate_key(text, key):
+    '''The duplicate TOML key is found in the statement of the error, even if it's quoted.'''
+    pytest.importorskip('tomli' if sys.version_info < (3, 11) else 'tomllib')
+    with pytest.raises(SettingsValueError) as excinfo:
+        settings.Loader().load_settings_stream(text, 'toml')
+    assert str(excinfo.value) == 'Duplicate label {}!'.format(key)
+
+@pytest.mark.parametrize('file_format, text', [('json', '{"a": 1,'), ('json', '[1, 2]'),
+                                               ('toml', 'a = 1\n[b'), ('toml', 'a = ')])
+def test_format_errors(file_format, text):
+    '''Invalid files raise SettingsFileError.'''
+    if file_format == 'toml':
+        pytest.importorskip('tomli' if sys.version_info < (3, 11) else 'tomllib')
+    with pytest.raises(SettingsFileError) as excinfo:
+        settings.Loader().load_settings_stream(text, file_format)
+    assert excinfo.match(r"Error while parsing the config file|empty or otherwise invalid")
+    assert excinfo.type == SettingsFileError
+
+def test_register_format(mocker):
+    '''New formats can be registered.'''
+    with pytest.raises(NotImplementedError) as excinfo:
+        settings.Loader().load_settings_stream('a=1', 'ini')
+    assert excinfo.match('Unknown settings file format "ini"')
+
+    def load_ini(loader, stream, name):
+        text = stream if isinstance(stream, str) else stream.read()
+        return dict(line.split('=') for line in text.splitlines())
+    mocker.patch.dict(settings._formats)
+    mocker.patch.dict(settings._format_extensions)
+    settings.register_format('ini', load_ini, ['.ini'])
+    assert settings.Loader().load_settings_stream('a=1', 'ini') == {'a': '1'}
+    assert settings.Loader().load_settings_stream('a=1', name='config.ini') == {'a': '1'}
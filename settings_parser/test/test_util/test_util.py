@@ -6,9 +6,10 @@ Created on Sun Apr  2 17:03:04 2017
 """
 
 import warnings
+import threading
 import pytest
 
-from settings_parser.util import log_exceptions_warnings
+from settings_parser.util import log_exceptions_warnings, warn, record_warnings
 
 
 def test_log_exceptions_warnings_nothing():
@@ -45,3 +46,65 @@ def test_log_exceptions_warnings_exception(caplog):
     assert len(caplog.records) == 1
     assert caplog.records[0].levelname == 'ERROR'
     assert 'division by zero' in caplog.text
+
+def test_log_exceptions_warnings_nested(caplog):
+    '''Only the outermost decorated function logs exceptions and warnings.'''
+
+    @log_exceptions_warnings
+    def inner(arg):
+        warnings.warn('inner warning')
+        if arg:
+            return 1/0
+    @log_exceptions_warnings
+    def outer(arg):
+        return inner(arg)
+
+    with pytest.warns(UserWarning) as record:
+        outer(False)
+    assert len(record) == 1
+    assert str(record[0].message) == 'inner warning.'
+    assert len(caplog.records) == 1
+    assert caplog.records[0].levelname == 'WARNING'
+    assert 'UserWarning: "inner warning" in test_util.py' in caplog.text
+
+    caplog.clear()
+    with pytest.raises(ZeroDivisionError):
+        outer(True)
+    assert len(caplog.records) == 1
+    assert caplog.records[0].levelname == 'ERROR'
+    assert 'division by zero' in caplog.text
+
+def test_log_exceptions_warnings_repeated(caplog):
+    '''The same warning issued with warnings.warn is logged every time.'''
+
+    @log_exceptions_warnings
+    def raise_warning():
+        warnings.warn('repeated warning')
+    with pytest.warns(UserWarning) as record:
+        raise_warning()
+        raise_warning()
+    assert len(record) == 2
+    assert len(caplog.records) == 2
+    assert all('repeated warning' in log.getMessage() for log in caplog.records)
+
+def test_record_warnings_threads():
+    '''Each thread records only its own warnings.'''
+    barrier = threading.Barrier(8)
+    results = {}
+
+    def record(num):
+        with record_warnings() as warn_list:
+            barrier.wait()
+            for _ in range(100):
+                warn('thread {}'.format(num))
+                warnings.warn('thread {}'.format(num))
+        results[num] = warn_list
+
+    threads = [threading.Thread(target=record, args=(num,)) for num in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for num, warn_list in results.items():
+        assert len(warn_list) == 200
+        assert all(str(warning.message) == 'thread {}'.format(num) for warning in warn_list)
@@ -153,3 +153,14 @@ def test_DictValue_in_Dict():
     assert excinfo.type == SettingsValueError
 
 
+
+def test_pickle():
+    '''DictValues can be pickled, including the nested ones.'''
+    import pickle
+    dict_value = DictValue({'people': Value(Dict[str, DictValue({'age': int, 'city': str})]),
+                            'numbers': {'list': Value(List[int], len_max=2)}}).freeze()
+    unpickled_dict_value = pickle.loads(pickle.dumps(dict_value))
+    assert repr(unpickled_dict_value) == repr(dict_value)
+    assert unpickled_dict_value.fingerprint() == dict_value.fingerprint()
+    d = {'people': {'pedro': {'age': 28, 'city': 'utrecht'}}, 'numbers': {'list': [1, 2]}}
+    assert unpickled_dict_value.validate(d) == d
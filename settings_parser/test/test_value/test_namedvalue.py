@@ -45,4 +45,31 @@ def test_NamedValue(value):
     with pytest.raises(SettingsValueError) as excinfo:
         NamedValue(value, int).validate(value)
     assert excinfo.match('is not a dictionary')
-    assert excinfo.type == SettingsValueError
\ No newline at end of file
+    assert excinfo.type == SettingsValueError
+
+def test_NamedValue_references_Value():
+    '''The NamedValue uses the Value's parameters, they aren't copied.'''
+    import copy
+    value = Value(int, val_max=6)
+    named_value = NamedValue('key', value)
+    assert named_value.value is value
+    assert not hasattr(named_value, '__dict__')
+    assert named_value.validate({'key': 5}) == {'key': 5}
+
+    # changes to the Value are seen by the NamedValue and viceversa
+    value.val_max = 4
+    with pytest.raises(SettingsValueError) as excinfo:
+        named_value.validate({'key': 5})
+    assert excinfo.match(r'Value\(s\) of key \(5\) cannot be larger than 4')
+    assert excinfo.type == SettingsValueError
+    named_value.val_max = 5
+    assert value.val_max == 5
+    assert named_value.validate({'key': 5}) == {'key': 5}
+
+    # Values without length limits share them
+    assert NamedValue('key2', int).len_max is Value(int).len_max
+
+    named_copy = copy.deepcopy(named_value.freeze())
+    assert named_copy.validate({'key': 5}) == {'key': 5}
+    assert named_copy.val_max == 5
+    assert named_copy.value is not value
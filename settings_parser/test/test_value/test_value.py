@@ -418,3 +418,261 @@ def test_dict_with_Value():
     d4 = {'a': 1, 'b': '3', 'c': 56.2}
     assert Value(Dict[str, Value(int)]).validate(d4) == {'a': 1, 'b': 3, 'c': 56}
 
+
+#### COMPILED VALIDATORS
+
+def test_compiled_plan():
+    '''The type tree is compiled once and compiled again if the Value changes.'''
+    value = Value(List[List[int]], val_max=5, len_max=[None, 2])
+    plan = value.plan
+    assert value.validate([[1, 2], [3, 4]]) == [[1, 2], [3, 4]]
+    assert value.plan is plan
+
+    value.val_max = 3
+    assert value.plan is not plan
+    with pytest.raises(SettingsValueError) as excinfo:
+        value.validate([[1, 2], [3, 4]])
+    assert excinfo.match("cannot be larger than 3")
+    assert excinfo.type == SettingsValueError
+
+def test_union_dispatch():
+    '''Union options that can't validate the type of the value are not tried.'''
+    value = Value(Union[List[int], Dict[str, int], float, int])
+    assert value.validate(5) == 5.0
+    assert value.validate([5]) == [5]
+    assert value.validate({'a': 5}) == {'a': 5}
+    float_node, int_node = value.plan.options[2:]
+    assert value.plan.dispatch[int] == [float_node, int_node]
+    list_node, dict_node = value.plan.options[:2]
+    # numbers can't be created from lists, the last option is always tried
+    assert value.plan.dispatch[list] == [list_node, int_node]
+    # dicts are collections too
+    assert value.plan.dispatch[dict] == [list_node, dict_node, int_node]
+    # strings may be numbers
+    assert value.validate('5') == 5.0
+    assert value.plan.dispatch[str] == [float_node, int_node]
+    # and the types that convert to numbers
+    fraction_options = Value(Union[int, str]).plan
+    assert fraction_options.validate(Fraction(5, 2)) == 2
+    assert fraction_options.dispatch[Fraction] == fraction_options.options
+    none_options = Value(Union[int, float, str]).plan
+    assert none_options.validate(None) == 'None'
+    assert none_options.dispatch[type(None)] == none_options.options[2:]
+    # the order of the options is kept
+    assert Value(Union[int, str]).validate('12') == 12
+
+    # the error is the same, because the last option is always tried
+    with pytest.raises(SettingsValueError) as excinfo:
+        Value(Union[int, List[int]]).validate('a')
+    assert excinfo.match("does not have any of the right types")
+    assert excinfo.match(r"because Setting \"a\" \(value: 'a', type: str\) "
+                         r"does not have the right type \(List\[int\]\)")
+
+
+#### ARRAYS
+
+def test_arrays():
+    '''Lists of numbers can be validated with NumPy and returned as arrays.'''
+    np = pytest.importorskip('numpy')
+
+    array = Value(List[float], array=True).validate([1, '2.5', -9.1])
+    assert isinstance(array, np.ndarray)
+    assert array.tolist() == [1.0, 2.5, -9.1]
+    assert Value(List[List[int]], array=True).validate([[1, 2], [3, 4]]).shape == (2, 2)
+    assert Value(List[int], array=True).validate([]).tolist() == []
+    # only lists of numbers are arrays
+    assert Value(List[str], array=True).validate([1, 2]) == ['1', '2']
+    assert Value(Dict[str, List[int]],
+                 array=True).validate({'a': [1, 2]})['a'].tolist() == [1, 2]
+
+    # max, min values and lengths are checked for all values
+    with pytest.raises(SettingsValueError) as excinfo:
+        Value(List[List[int]], val_max=5, array=True).validate([[1, 2], [3, 6]])
+    assert excinfo.match("cannot be larger than 5")
+    assert excinfo.type == SettingsValueError
+
+    with pytest.raises(SettingsValueError) as excinfo:
+        Value(List[List[int]], len_min=[None, 3], array=True).validate([[1, 2], [3, 4]])
+    assert excinfo.match("cannot be smaller than 3")
+    assert excinfo.type == SettingsValueError
+
+    # values NumPy can't convert like the type give the same errors as lists
+    with pytest.raises(SettingsValueError) as excinfo:
+        Value(List[float], array=True).validate([1, None])
+    assert excinfo.match('does not have the right type')
+    assert excinfo.type == SettingsValueError
+
+    with pytest.raises(SettingsValueError) as excinfo:
+        Value(List[List[int]], array=True).validate([[1, 2], 3])
+    assert excinfo.match('does not have the right type')
+    assert excinfo.type == SettingsValueError
+
+    with pytest.raises(SettingsValueError) as excinfo:
+        Value(List[float], array=True).validate([1+1j])
+    assert excinfo.match('does not have the right type')
+    assert excinfo.type == SettingsValueError
+
+    # ragged lists are valid lists, but not arrays
+    with pytest.raises(SettingsValueError) as excinfo:
+        Value(List[List[int]], array=True).validate([[1, 2], [3]])
+    assert excinfo.match('cannot be converted to an array')
+    assert excinfo.type == SettingsValueError
+
+    # valid integers too large for the array
+    for val_type, value in [(List[int], [2**70]), (List[int], [1e20]),
+                            (List[List[int]], [[1, 2**70]])]:
+        with pytest.raises(SettingsValueError) as excinfo:
+            Value(val_type, array=True).validate(value)
+        assert excinfo.match('cannot be converted to an array')
+        assert excinfo.type == SettingsValueError
+
+
+def _outcome(validate, value):
+    '''Return the validated value (as a list if it's an array) or the type and error message.'''
+    try:
+        validated = validate(value)
+    except Exception as exc:  # pylint: disable=W0703
+        return type(exc), str(exc)
+    return type(validated), getattr(validated, 'tolist', lambda: validated)()
+
+ITEMS_CASES = [(List[int], {}, [1, '2', 3.5]),
+               (List[int], {'val_max': 2}, [1, 2, 3]),
+               (List[int], {'len_max': 2}, [1, 2, 3]),
+               (List[int], {}, []),
+               (List[int], {}, [1, 'a']),
+               (Set[int], {}, [1, 2, 1]),
+               (List[List[int]], {'len_min': [None, 2]}, [[1, 2], [3]]),
+               (List[Union[int, str]], {}, [1, 'a', [2]]),
+               (List[float], {'array': True}, [1, '2.5', -9.1]),
+               (List[float], {'array': True}, [1, None]),
+               (List[List[float]], {'array': True}, [[1, 2], [3.5, 4]]),
+               (List[List[float]], {'array': True}, []),
+               (List[List[int]], {'array': True, 'val_max': 5}, [[1, 2], [3, 6]]),
+               (List[List[int]], {'array': True, 'val_max': 5}, [[1, 2], [3, 'a']]),
+               (List[List[int]], {'array': True, 'len_max': [1]}, [[1, 2], [3, 4]]),
+               (List[List[int]], {'array': True, 'len_min': [None, 3]}, [[1, 2], [3, 4]]),
+               (List[List[int]], {'array': True}, [[1, 2], [3]]),
+               (List[List[int]], {'array': True}, [[1, 2], 3]),
+               (List[List[float]], {'array': True}, [[1.5, 2], [3, None], [4, 5]]),
+               (List[List[int]], {'array': True}, [[1, 2], [3, 2**70]]),
+               (List[List[List[int]]], {'array': True}, [[[1, 2]], [[3, 4]]])]
+
+@pytest.mark.parametrize('val_type, kwargs, value', ITEMS_CASES,
+                         ids=['{}-{}'.format(val_type, kwargs)
+                              for val_type, kwargs, _ in ITEMS_CASES])
+def test_validate_items(val_type, kwargs, value):
+    '''Lists validated from an iterator of their items, as they are parsed,
+        are the same as validated at once, with the same errors.'''
+    if kwargs.get('array'):
+        pytest.importorskip('numpy')
+    plan = Value(val_type, **kwargs).plan
+    assert plan.streams()
+    assert _outcome(plan.validate_items, iter(value)) == _outcome(plan.validate, value)
+
+def test_validate_items_not_lists():
+    '''Only lists of one type stream their items.'''
+    assert not Value(int).plan.streams()
+    assert not Value(Tuple[int, str]).plan.streams()
+    assert not Value(Dict[str, int]).plan.streams()
+    assert not Value(Union[List[int], int]).plan.streams()
+
+
+#### PERFORMANCE
+
+def test_no_formatting_on_success():
+    '''Error messages are only formatted if the validation fails.'''
+    formatted = []
+    class Spy(float):
+        '''Float that records when it's converted to a string.'''
+        def __str__(self):
+            formatted.append(self)
+            return float.__repr__(self)
+        __repr__ = __str__
+        def __format__(self, spec):
+            formatted.append(self)
+            return float.__format__(self, spec)
+
+    value = Value(List[List[Spy]], val_max=10, val_min=0, len_max=[100, 3], len_min=[1, 3])
+    data = [[Spy(1), Spy(2), Spy(3)]]*100
+    for _ in range(10):
+        assert value.validate(data) == data
+    assert not formatted
+
+    with pytest.raises(SettingsValueError) as excinfo:
+        value.validate([[Spy(1), Spy(2), Spy(30)]])
+    assert excinfo.match("cannot be larger than 10")
+    assert formatted
+
+@pytest.mark.parametrize('val_type', [int, List[int], Dict[str, List[float]], Tuple[int, ...],
+                                      Tuple[int, str], Tuple[()], Union[int, str],
+                                      Set[int], Callable[[int], str], Callable[..., int]],
+                         ids=str)
+def test_pickle(val_type):
+    '''Values with typing types can be pickled.'''
+    import pickle
+    value = Value(val_type, val_max=5, len_max=3)
+    unpickled_value = pickle.loads(pickle.dumps(value))
+    assert unpickled_value.val_type == val_type
+    assert unpickled_value.fingerprint() == value.fingerprint()
+    assert repr(unpickled_value) == repr(value)
+
+    frozen_value = pickle.loads(pickle.dumps(value.freeze()))
+    with pytest.raises(AttributeError):
+        frozen_value.val_max = 4
+    assert pickle.loads(pickle.dumps(Value(List[int]))).validate([1, 2]) == [1, 2]
+
+# global used by a function in test_fingerprint_functions
+SCALE = 2
+
+def test_fingerprint_functions(monkeypatch):
+    '''Functions that validate differently have different fingerprints:
+        their code, defaults, closure variables and globals are included.'''
+    import functools
+
+    def scaled(k):
+        return Value(int, fun=lambda x: x*k)
+
+    def with_default(k):
+        def fun(x, k=k):
+            return x*k
+        return Value(int, fun=fun)
+
+    def with_global(x):
+        return x*SCALE
+
+    assert scaled(2).fingerprint() == scaled(2).fingerprint()
+    assert scaled(2).fingerprint() != scaled(3).fingerprint()
+    assert with_default(2).fingerprint() != with_default(3).fingerprint()
+    old_fingerprint = Value(int, fun=with_global).fingerprint()
+    monkeypatch.setitem(with_global.__globals__, 'SCALE', 3)
+    assert Value(int, fun=with_global).fingerprint() != old_fingerprint
+    assert (Value(int, fun=functools.partial(pow, 2)).fingerprint() !=
+            Value(int, fun=functools.partial(pow, 3)).fingerprint())
+
+def test_fingerprint_types(monkeypatch):
+    '''Custom types and the helpers functions use through a module
+        are identified by their code, builtin types by their name.'''
+    import types
+
+    class Scaled(float):
+        def __new__(cls, x):
+            return float.__new__(cls, 2*x)
+
+    def other_new(cls, x):
+        return float.__new__(cls, 3*x)
+
+    assert Value(int).fingerprint() == Value(int).fingerprint()
+    assert 'builtins.int,' in Value(int).fingerprint()
+    old_fingerprint = Value(Scaled).fingerprint()
+    assert Value(List[Scaled]).fingerprint() != Value(List[float]).fingerprint()
+    monkeypatch.setattr(Scaled, '__new__', other_new)
+    assert Value(Scaled).fingerprint() != old_fingerprint
+
+    helpers = types.ModuleType('helpers')
+    helpers.check = lambda x: x > 0
+    def fun(x):
+        return helpers.check(x)
+    monkeypatch.setitem(fun.__globals__, 'helpers', helpers)
+    old_fingerprint = Value(int, fun=fun).fingerprint()
+    helpers.check = lambda x: x > 1
+    assert Value(int, fun=fun).fingerprint() != old_fingerprint
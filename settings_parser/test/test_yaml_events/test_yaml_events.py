@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Test that documents constructed from the parser events are the same as with ruamel.yaml.
+"""
+import io
+import math
+from functools import partial
+
+import pytest
+import ruamel.yaml as yaml
+
+from settings_parser import yaml_events
+from settings_parser.settings import _new_yaml
+from settings_parser.util import SettingsValueError
+
+# libyaml is only available if ruamel.yaml was built with it
+LIBYAML = getattr(yaml, '__with_libyaml__', False)
+# functions that return a new YAML instance
+LOADERS = [pytest.param(partial(_new_yaml, pure=True), id='pure'),
+           pytest.param(partial(_new_yaml, pure=False), id='libyaml',
+                        marks=pytest.mark.skipif(not LIBYAML,
+                                                 reason='ruamel.yaml was built without libyaml'))]
+
+DOCUMENTS = {
+    'scalars': '''int: 1
+float: 1.5e3
+numbers: [0, -0, +12, 012, 0x1f, 1_000, 0.5, -.5e-3, 1., -0.0, 1e3, 1_0.5, .NaN]
+sexagesimal: 1:30
+inf: .inf
+bool: true
+none: ~
+date: 2017-06-17
+time: 2001-12-14t21:59:43.10-05:00
+quoted: "1"
+binary: !!binary aGVsbG8=
+explicit: !!str 2
+''',
+    'nested': '''a:
+    b: [1, 2, {c: [3, 4]}]
+    d:
+        - e: 5
+        - [6, [7]]
+1: int key
+''',
+    'anchors': '''a: &a {x: 1}
+b: *a
+c: &c [1, 2]
+d: *c
+e: &e 3
+f: *e
+''',
+    'merge': '''base: &base
+    age: 28
+    city: ghent
+other: &other
+    city: madrid
+    name: maria
+person:
+    <<: *base
+    city: utrecht
+people:
+    <<: [*other, *base]
+nested:
+    <<: {<<: *base, age: 30}
+''',
+    'recursive list': 'a: &a [1, *a]',
+    'recursive mapping': 'a: &a {b: *a}',
+    'set': 'a: !!set {1, 2}',
+    'omap': 'a: !!omap [b: 1, c: 2]',
+    'value key': '=: 1',
+    'reused anchor': 'a: &a [1]\nb: &a [2]\nc: *a',
+    'empty': '',
+    'list': '- 1\n- 2',
+    'duplicate': 'a: 1\nb: 2\na: 3',
+    'undefined alias': 'a: *b',
+    'documents': 'a: 1\n---\nb: 2',
+    'unknown tag': 'a: !!unknown 1',
+    'unhashable key': '[1, 2]: 3',
+    'syntax': 'a: [1, 2',
+}
+
+
+def _outcome(load, text):
+    '''Return the loaded document, or the type and message of the error.'''
+    try:
+        return load(text)
+    except Exception as exc:  # pylint: disable=W0703
+        return type(exc), str(exc)
+
+@pytest.mark.filterwarnings('ignore::ruamel.yaml.error.ReusedAnchorWarning')
+@pytest.mark.parametrize('new_yaml', LOADERS)
+@pytest.mark.parametrize('name', sorted(DOCUMENTS))
+def test_same_as_ruamel(new_yaml, name):
+    '''The documents and errors are the same as with ruamel.yaml.'''
+    text = DOCUMENTS[name]
+    data = _outcome(partial(yaml_events.load, new_yaml=new_yaml), text)
+    expected = _outcome(new_yaml().load, text)
+    if name == 'recursive list':
+        assert data['a'][0] == expected['a'][0] == 1
+        assert data['a'][1] is data['a']
+    elif name == 'scalars':
+        assert math.isinf(data.pop('inf')) and math.isinf(expected.pop('inf'))
+        assert math.isnan(data['numbers'].pop()) and math.isnan(expected['numbers'].pop())
+        assert [type(num) for num in data['numbers']] == [type(num) for num in expected['numbers']]
+        assert math.copysign(1, data['numbers'][9]) == -1  # -0.0
+        assert data == expected
+    else:
+        assert data == expected
+    assert type(data) == type(expected)
+
+@pytest.mark.parametrize('new_yaml', LOADERS)
+def test_events(new_yaml, mocker):
+    '''Documents are constructed without composing the nodes, aliases are the same object.
+        Unsupported documents are loaded again with ruamel.yaml from the start of the stream.'''
+    compose = mocker.spy(yaml.YAML, 'load')
+    data = yaml_events.load(io.StringIO(DOCUMENTS['anchors']), new_yaml)
+    assert compose.call_count == 0
+    assert data['a'] is data['b']
+    assert data['c'] is data['d']
+
+    data = yaml_events.load(io.StringIO(DOCUMENTS['set']), new_yaml)
+    assert compose.call_count == 1
+    assert data == {'a': {1, 2}}
+
+    # documents that start with supported data are loaded again from the start
+    stream = io.StringIO('x: [1]\n' + DOCUMENTS['set'] + '\nb: [2]\n')
+    data = yaml_events.load(stream, new_yaml)
+    assert compose.call_count == 2
+    assert data == {'x': [1], 'a': {1, 2}, 'b': [2]}
+
+@pytest.mark.parametrize('new_yaml', LOADERS)
+def test_streams(new_yaml):
+    '''The items of the lists of the keys in streams are given to the functions
+        as they are constructed.'''
+    calls = []
+
+    def total(items):
+        calls.append(items)
+        return sum(sum(item) if isinstance(item, list) else item for item in items)
+
+    text = '''a: [1, 2, 3]
+b: [[1, 2], [3]]
+c: 4
+d: &d [5]
+e: *d
+f: [6]
+'''
+    streams = {'a': total, 'b': total, 'c': total, 'd': total}
+    data = yaml_events.load(text, new_yaml, streams)
+    assert data == {'a': 6, 'b': 6, 'c': 4, 'd': [5], 'e': [5], 'f': [6]}
+    # only lists without anchors
+    assert len(calls) == 2
+
+    # errors constructing the items are raised as they are
+    with pytest.raises(SettingsValueError) as excinfo:
+        yaml_events.load('a: [1, {b: 1, b: 2}]', new_yaml, {'a': list})
+    assert excinfo.match('Duplicate label b!')
+    assert excinfo.type == SettingsValueError
+
+    # unsupported documents are loaded with ruamel.yaml, the values are the loaded lists
+    data = yaml_events.load('a: [1, 2]\nb: !!set {1}', new_yaml, {'a': total})
+    assert data == {'a': [1, 2], 'b': {1}}
@@ -6,22 +6,23 @@ Created on Wed Nov 23 16:45:32 2016
 """
 
 import sys
-import tempfile
 from contextlib import contextmanager
 import os
 import logging
 import warnings
+import threading
 from functools import wraps
 
-from typing import Generator, Callable, Tuple, Dict, TypeVar
+from typing import Generator, Callable, Tuple, Dict, TypeVar, List, Optional, Union, Type, TextIO
 
 
 # http://stackoverflow.com/a/11892712
 @contextmanager
-def temp_filename(data: str = None, mode: str = 'wt') -> Generator:
+def temp_filename(data: Optional[str] = None, mode: str = 'wt') -> Generator:
     '''Creates a temporary file and writes text data to it. It returns its filename.
         It deletes the file after use in a context manager.
     '''
+    import tempfile
     # file won't be deleted after closing
     temp = tempfile.NamedTemporaryFile(mode=mode, delete=False)
     if data:
@@ -33,30 +34,102 @@ def temp_filename(data: str = None, mode: str = 'wt') -> Generator:
         os.unlink(temp.name)  # delete file
 
 Ret = TypeVar('Ret')
+
+
+class _Diagnostics(threading.local):
+    '''Diagnostics of the validation running in this thread: the list that records
+        the warnings issued with warn and if an outermost log_exceptions_warnings call is running.
+        Each thread has its own, so concurrent validations don't mix them up.'''
+    recorded = None  # type: Optional[List[warnings.WarningMessage]]
+    logging = False
+
+
+_diagnostics = _Diagnostics()
+
+def warn(message: str, category: type = UserWarning, stacklevel: int = 1) -> None:
+    '''Issue a warning as warnings.warn does. If record_warnings is active in this thread
+        (ie: inside a function decorated with log_exceptions_warnings), it's recorded instead.'''
+    recorded = _diagnostics.recorded
+    if recorded is None:
+        warnings.warn(message, category, stacklevel=stacklevel + 1)
+        return
+    frame = sys._getframe(stacklevel)  # pylint: disable=W0212
+    recorded.append(warnings.WarningMessage(category(message), category,
+                                            frame.f_code.co_filename, frame.f_lineno))
+
+# showwarning that was active when _record_showwarning was installed, it handles the warnings
+# issued in threads that aren't recording
+_next_showwarning = warnings.showwarning
+
+def _record_showwarning(message: Union[Warning, str], category: Type[Warning], filename: str,
+                        lineno: int, file: Optional[TextIO] = None,
+                        line: Optional[str] = None) -> None:
+    '''Replacement for warnings.showwarning that records the warnings issued directly
+        with warnings.warn (ie: by custom types or other libraries) if record_warnings
+        is active in the current thread. The warnings of other threads are shown as usual.'''
+    recorded = _diagnostics.recorded
+    if recorded is None:
+        _next_showwarning(message, category, filename, lineno, file, line)
+        return
+    recorded.append(warnings.WarningMessage(message, category, filename, lineno, file, line))
+    # the warning filters only show a warning once per location by default,
+    # forget it so that it's recorded again the next time it's issued
+    filters_mutated = getattr(warnings, '_filters_mutated', None)
+    if filters_mutated is not None:
+        filters_mutated()
+
+@contextmanager
+def record_warnings() -> Generator[List[warnings.WarningMessage], None, None]:
+    '''Record the warnings issued in this thread, and only in this thread,
+        in the list returned. Unlike warnings.catch_warnings, it's thread-safe
+        and it doesn't change the warning filters. The warnings issued with warn are recorded
+        directly, the ones issued with warnings.warn are recorded by a warnings.showwarning hook
+        if the filters let them through.'''
+    global _next_showwarning
+    if warnings.showwarning is not _record_showwarning:
+        # installed again if something else (ie: warnings.catch_warnings) replaced it
+        _next_showwarning = warnings.showwarning
+        warnings.showwarning = _record_showwarning
+    old_recorded = _diagnostics.recorded
+    recorded = []  # type: List[warnings.WarningMessage]
+    _diagnostics.recorded = recorded
+    try:
+        yield recorded
+    finally:
+        _diagnostics.recorded = old_recorded
+
 def log_exceptions_warnings(function: Callable[..., Ret]) -> Callable[..., Ret]:
-    '''Decorator to log exceptions and warnings'''
+    '''Decorator to log exceptions and warnings.
+        Only the outermost decorated function in the call stack logs,
+        the nested ones are called directly.
+        The warnings issued with warn are recorded for this call only, then logged and issued
+        again when it returns, so it's safe to call the function from many threads.
+        Warnings issued directly with warnings.warn (ie: by other libraries) are logged too.'''
     @wraps(function)
     def wrapper(*args: Tuple, **kwargs: Dict) -> Ret:
+        if _diagnostics.logging:
+            return function(*args, **kwargs)
+        _diagnostics.logging = True
         try:
-            with warnings.catch_warnings(record=True) as warn_list:
-                # capture all warnings
-                warnings.simplefilter('always')
+            with record_warnings() as warn_list:
                 ret = function(*args, **kwargs)
         except Exception as exc:
             logger = logging.getLogger(function.__module__)
             logger.error(exc.args[0])
             raise
-        for warn in warn_list or []:
+        finally:
+            _diagnostics.logging = False
+        for warning in warn_list:
             logger = logging.getLogger(function.__module__)
-            log_msg = (warn.category.__name__ + ': "' + str(warn.message) +
-                       '" in ' + os.path.basename(warn.filename) +
-                       ', line: ' + str(warn.lineno) + '.')
+            log_msg = (warning.category.__name__ + ': "' + str(warning.message) +
+                       '" in ' + os.path.basename(warning.filename) +
+                       ', line: ' + str(warning.lineno) + '.')
             logger.warning(log_msg)
-            warn_msg = str(warn.message) + '.'
+            warn_msg = str(warning.message) + '.'
             # re-raise warnings
             # stacklevel=2 makes the warning refer to log_exceptions_warnings‘s caller,
             # rather than to the source of log_exceptions_warnings() itself
-            warnings.warn(warn_msg, warn.category, stacklevel=2)
+            warn(warn_msg, warning.category, stacklevel=2)
         return ret
     return wrapper
 
@@ -80,7 +153,9 @@ def console_logger_level(level: int) -> Generator:  # pragma: no cover
 
 @contextmanager
 def no_logging() -> Generator:
-    '''Temporary disable all logging.'''
+    '''Temporary disable all logging.
+        It changes the logging level of the whole process, all threads are affected.
+        Validation doesn't use it.'''
     logging.disable(logging.CRITICAL)
     yield None
     logging.disable(logging.NOTSET)
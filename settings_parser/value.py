@@ -11,15 +11,18 @@ import sys
 # nice debug printing of settings
 #import pprint
 #import typing
-from typing import Dict, List, Tuple
-from typing import Callable, TypeVar, Hashable, Any
-from typing import Union, Sequence, Iterable, Mapping, Sized, Collection
+from typing import Dict, List, Tuple, Set
+from typing import Callable, TypeVar, Hashable, Any, AbstractSet, Optional, TYPE_CHECKING
+from typing import Union, Sequence, Iterable, Iterator, Mapping, Sized, Collection
 #from functools import wraps
 from enum import Enum
-import warnings
+from types import CodeType, MemberDescriptorType, FunctionType, MethodType, ModuleType
+from types import BuiltinFunctionType
+from operator import attrgetter
 
 from settings_parser.util import SettingsValueError, SettingsTypeError, SettingsExtraValueWarning
-from settings_parser.util import no_logging, log_exceptions_warnings
+from settings_parser.util import log_exceptions_warnings, warn
+from settings_parser import profiling
 
 
 ## example on how to add a type to the typing module, in this case a OrderedDict
@@ -62,6 +65,212 @@ def _clean_type_name(val_type: ValType) -> str:
         type_name = val_type.__name__
     return type_name.replace('__main__.', '')
 
+def _qualified_name(obj: Any) -> str:
+    '''Return the module and qualified name of a type or function.'''
+    if getattr(obj, '__module__', None) == 'typing':
+        return repr(obj)
+    return '{}.{}'.format(getattr(obj, '__module__', ''),
+                          getattr(obj, '__qualname__', repr(obj)))
+
+def _type_fingerprint(val_type: ValType) -> str:
+    '''Return a string that identifies the val_type, including nested Values and DictValues.'''
+    if isinstance(val_type, (Value, DictValue)):
+        return val_type.fingerprint()
+    args = getattr(val_type, '__args__', None)
+    if getattr(val_type, '__module__', None) == 'typing' and args:
+        origin = getattr(val_type, '__origin__', None) or val_type
+        return '{}[{}]'.format(_qualified_name(origin),
+                               ', '.join(_type_fingerprint(arg) for arg in args))
+    if isinstance(val_type, (type, FunctionType)):
+        # custom types and converters, with their code
+        return _object_fingerprint(val_type)
+    return _qualified_name(val_type)
+
+def _function_fingerprint(fun: Optional[Callable], seen: Optional[Set] = None) -> str:
+    '''Return a string that identifies the function, its code and the values it uses:
+        defaults, closure variables and globals. Values whose repr changes in each process
+        (ie: it has a memory address) give a different fingerprint each time.'''
+    if fun is None:
+        return 'None'
+    if isinstance(fun, MethodType):
+        return '{}.{}'.format(_object_fingerprint(fun.__self__, seen),
+                              _function_fingerprint(fun.__func__, seen))
+    if not isinstance(fun, FunctionType):
+        # types and builtins are identified by their name, other callables
+        # (ie: functools.partial) by their repr, with their arguments
+        if isinstance(fun, (type, BuiltinFunctionType)):
+            return _qualified_name(fun)
+        return repr(fun)
+    seen = set() if seen is None else seen
+    if fun in seen:  # recursive functions
+        return _qualified_name(fun)
+    seen.add(fun)
+    code = fun.__code__
+    names = _global_names(code)
+    closure = [_module_helpers(_cell_contents(cell), names) for cell in fun.__closure__ or ()]
+    fun_globals = {name: _module_helpers(fun.__globals__[name], names) for name in sorted(names)
+                   if name in fun.__globals__}
+    used = [fun.__defaults__, fun.__kwdefaults__ and sorted(fun.__kwdefaults__.items()),
+            closure, sorted(fun_globals.items())]
+    import hashlib
+    digest = hashlib.sha256(_code_fingerprint(code) +
+                            _object_fingerprint(used, seen).encode('utf-8')).hexdigest()
+    return '{}:{}'.format(_qualified_name(fun), digest)
+
+def _code_fingerprint(code: CodeType) -> bytes:
+    '''Return the bytecode and constants of the code and its nested functions.'''
+    # the repr of nested code objects contains their memory address
+    consts = [const for const in code.co_consts if not isinstance(const, CodeType)]
+    return code.co_code + repr(consts).encode('utf-8') + b''.join(
+        _code_fingerprint(const) for const in code.co_consts if isinstance(const, CodeType))
+
+def _global_names(code: CodeType) -> Set[str]:
+    '''Return the names the code and its nested functions could use as globals.'''
+    return set(code.co_names).union(*(_global_names(const) for const in code.co_consts
+                                      if isinstance(const, CodeType)))
+
+def _module_helpers(value: Any, names: Set[str]) -> Any:
+    '''Return a module with the code of the functions and classes in names it has
+        (ie: module.helper), other values as they are. The globals the helpers use
+        aren't included, so modules of other libraries aren't walked.'''
+    if not isinstance(value, ModuleType):
+        return value
+    helpers = [value]  # type: List[Any]
+    for name in sorted(names):
+        helper = getattr(value, name, None)
+        if isinstance(helper, FunctionType):
+            import hashlib
+            helpers.append('{}:{}'.format(_qualified_name(helper), hashlib.sha256(
+                _code_fingerprint(helper.__code__)).hexdigest()))
+        elif isinstance(helper, type):
+            helpers.append(helper)
+    return helpers
+
+def _cell_contents(cell: Any) -> Any:
+    '''Return the contents of the closure cell, or a placeholder if it's empty.'''
+    try:
+        return cell.cell_contents
+    except ValueError:  # not assigned yet
+        return '<empty cell>'
+
+def _object_fingerprint(obj: Any, seen: Optional[Set] = None) -> str:
+    '''Return a string that identifies a value used by a function.'''
+    if isinstance(obj, (FunctionType, MethodType)):
+        return _function_fingerprint(obj, seen)
+    if isinstance(obj, ModuleType):
+        return 'module ' + obj.__name__
+    if isinstance(obj, type):
+        return _class_fingerprint(obj, seen)
+    if isinstance(obj, (list, tuple)):
+        return '[{}]'.format(', '.join(_object_fingerprint(item, seen) for item in obj))
+    return repr(obj)
+
+# class attributes that are included in the fingerprint of a class with their repr
+_CLASS_DATA = (int, float, complex, str, bytes, Enum, type(None))
+
+def _class_fingerprint(cls: type, seen: Optional[Set] = None) -> str:
+    '''Return a string that identifies the class, the code of its methods (without the globals
+        they use) and its data attributes, and those of its bases. Builtin and typing classes
+        and classes without methods written in Python are identified by their name.'''
+    seen = set() if seen is None else seen
+    if cls in seen:
+        return _qualified_name(cls)
+    seen.add(cls)
+    code = []  # type: List[bytes]
+    data = []  # type: List[Tuple[str, Any]]
+    for klass in cls.__mro__:
+        if klass.__module__ in ('builtins', 'typing'):
+            continue
+        for name in sorted(vars(klass)):
+            # the function of static and class methods, the accessors of properties
+            attribute = getattr(vars(klass)[name], '__func__', vars(klass)[name])
+            functions = ([attribute.fget, attribute.fset, attribute.fdel]
+                         if isinstance(attribute, property) else [attribute])
+            code.extend(name.encode('utf-8') + _code_fingerprint(function.__code__)
+                        for function in functions if isinstance(function, FunctionType))
+            if isinstance(attribute, _CLASS_DATA) and name != '__doc__':
+                data.append((name, attribute))
+    if not code:
+        return _qualified_name(cls)
+    import hashlib
+    digest = hashlib.sha256(b''.join(code) +
+                            _object_fingerprint(data, seen).encode('utf-8')).hexdigest()
+    return '{}:{}'.format(_qualified_name(cls), digest)
+
+# shared length limits of Values without them, it's never changed
+_NO_LENGTH = (None,)
+
+def _length_list(length: Union[int, List[Optional[int]], None]) -> Sequence:
+    '''Return the length limits as a list, one for each level of the type tree.'''
+    if length is None:
+        return _NO_LENGTH
+    return [length] if not isinstance(length, Sequence) else length
+
+# names of the attributes pickled for each class, see _state_names
+_pickled_attributes = {}  # type: Dict[type, List[str]]
+
+def _state_names(cls: type) -> List[str]:
+    '''Return the names of the attributes in the __slots__ of the class and its bases
+        that are pickled: all except those replaced by properties and the compiled validator.'''
+    if cls not in _pickled_attributes:
+        _pickled_attributes[cls] = [name for klass in reversed(cls.__mro__)
+                                    for name in getattr(klass, '__slots__', [])
+                                    if isinstance(_class_attribute(cls, name),
+                                                  MemberDescriptorType) and name != '_plan']
+    return _pickled_attributes[cls]
+
+def _class_attribute(cls: type, name: str) -> Any:
+    '''Return the attribute of the class (not of its metaclass), ie: the slot descriptor.'''
+    for klass in cls.__mro__:
+        if name in vars(klass):
+            return vars(klass)[name]
+    return None
+
+def _get_state(obj: Any) -> Tuple:
+    '''Return the values of the attributes to pickle, in the order of _state_names.'''
+    return tuple(_picklable_type(getattr(obj, attr)) if attr == 'val_type' else getattr(obj, attr)
+                 for attr in _state_names(type(obj)))
+
+def _set_state(obj: Any, state: Tuple) -> None:
+    '''Set the pickled attributes, even if the object is frozen.'''
+    for attr, value in zip(_state_names(type(obj)), state):
+        object.__setattr__(obj, attr, value)
+
+def _subscript_type(origin: ValType, args: Tuple) -> ValType:
+    '''Return the typing type origin[args], ie: List[int] from List and (int,).'''
+    if origin is Callable and args[0] is not Ellipsis:
+        return origin[list(args[:-1]), args[-1]]
+    if args == ((),):  # Tuple[()]
+        return origin[()]
+    return origin[args]
+
+class _PicklableType():
+    '''Typing types such as List[int] cannot be pickled, they are pickled as their origin
+        and arguments and unpickled as the typing type.'''
+    __slots__ = ['val_type']
+
+    def __init__(self, val_type: ValType) -> None:
+        self.val_type = val_type
+
+    def __reduce__(self) -> Tuple:
+        return _subscript_type, (self.val_type.__origin__,
+                                 tuple(_picklable_type(arg) for arg in self.val_type.__args__))
+
+def _picklable_type(val_type: ValType) -> ValType:
+    '''Return a picklable val_type.'''
+    if (getattr(val_type, '__module__', None) == 'typing' and
+            getattr(val_type, '__origin__', None) is not None and val_type.__args__):
+        return _PicklableType(val_type)
+    return val_type
+
+def _freeze_type(val_type: ValType) -> None:
+    '''Freeze the Values and DictValues in the val_type, including nested ones.'''
+    if isinstance(val_type, (Value, DictValue)):
+        val_type.freeze()
+    elif getattr(val_type, '__module__', None) == 'typing':
+        for arg in getattr(val_type, '__args__', None) or ():
+            _freeze_type(arg)
+
 
 class Value():
     '''A value of a setting. The value has an specific type and optionally max and min values.
@@ -82,21 +291,35 @@ class Value():
         it must return True.
         If expand_args is True, the value passed to validate will be expanded
         with **value if it's a dictionary and with *value otherwise.
-        This allows using types that have several arguments, such as datetimes.'''
+        This allows using types that have several arguments, such as datetimes.
+        If array is True, (nested) lists of ints, floats or complex are converted and checked
+        at once with NumPy, and an ndarray is returned instead of a list.
+        After freeze() the Value cannot be changed and it can be shared.'''
 
     mandatory = Kind.mandatory
     optional = Kind.optional
     exclusive = Kind.exclusive
 
+    __slots__ = ['name', 'val_type', 'val_max', 'val_min', 'kind', 'fun',
+                 'len_max', 'len_min', 'expand_args', 'array', '_plan', '_frozen', '_changes']
+    if TYPE_CHECKING:  # pragma: no cover
+        # set with object.__setattr__, see __setattr__
+        _frozen = False  # type: bool
+        _changes = 0  # type: int
+
     # len_max/min are ints b/c the length of a Sequence is always an int.
     def __init__(self, val_type: ValType, name: str = '',
-                 val_max: T = None, val_min: T = None,
+                 val_max: Optional[T] = None, val_min: Optional[T] = None,
                  kind: Kind = Kind.mandatory,
-                 fun: Callable[[T], bool] = None,
-                 len_max: Union[int, List[int]] = None,
-                 len_min: Union[int, List[int]] = None,
-                 expand_args: bool = False) -> None:
+                 fun: Optional[Callable[[T], bool]] = None,
+                 len_max: Optional[Union[int, List[Optional[int]]]] = None,
+                 len_min: Optional[Union[int, List[Optional[int]]]] = None,
+                 expand_args: bool = False, array: bool = False) -> None:
         '''Val type can be a nested type (List[int], List[List[int]])'''
+        # frozen Values cannot be changed, see freeze
+        object.__setattr__(self, '_frozen', False)
+        # number of changes to the parameters, see NamedValue.plan
+        object.__setattr__(self, '_changes', 0)
 
         self.name = name
         # val_type it's either a simple type, an Iterable or a Union
@@ -110,28 +333,30 @@ class Value():
         self.fun = fun
 
         # convert to list
-        self.len_max = [len_max] if not isinstance(len_max, Sequence) else len_max
-        self.len_min = [len_min] if not isinstance(len_min, Sequence) else len_min
+        self.len_max = _length_list(len_max)
+        self.len_min = _length_list(len_min)
 
         self.expand_args = expand_args
+        self.array = array
+
+        # compiled validator, see plan
+        self._plan = None  # type: Optional[_Node]
+
+    def __getstate__(self) -> Tuple:
+        '''For pickle and copy, the compiled validator is built again when needed.'''
+        return _get_state(self)
 
-#    def __getstate__(self):
-#        '''For pickle'''
-#        d = self.__dict__.copy()
-#        d['val_type'] = repr(d['val_type'])
-#        return d
-#
-#    def __setstate__(self, d):
-#        '''For pickle'''
-#        print(d)
-#        d['val_type'] = eval(d['val_type'])
-#        self.__dict__ = d
+    def __setstate__(self, state: Tuple) -> None:
+        '''For pickle and copy, the attributes are set even if the Value is frozen.'''
+        _set_state(self, state)
+        object.__setattr__(self, '_plan', None)
 
     def __repr__(self) -> str:
         '''Return a representation of Value'''
         optional = ', '.join(attr + '=' + repr(getattr(self, attr))
                              for attr in ['name', 'val_max', 'val_min', 'len_max', 'len_min']
-                             if getattr(self, attr) and getattr(self, attr) != [None])
+                             if getattr(self, attr) and
+                             getattr(self, attr) not in (_NO_LENGTH, [None]))
         optional = '' if not optional else ', ' + optional
         if self.kind is not Kind.mandatory:
             kind = ', kind=' + self.kind.name
@@ -143,25 +368,37 @@ class Value():
         '''Pretend to be a type so typing module doesn't complain'''
         return self.validate(config_dict)
 
+    def fingerprint(self) -> str:
+        '''Return a string that identifies this Value and everything that affects its validation.
+            Values that validate differently have different fingerprints.'''
+        params = ', '.join(repr(param) for param in [self.name, self.val_max, self.val_min,
+                                                     self.kind.name, self.len_max, self.len_min,
+                                                     self.expand_args, self.array])
+        return '{}({}, {}, fun={})'.format(self.__class__.__name__,
+                                           _type_fingerprint(self.val_type), params,
+                                           _function_fingerprint(self.fun))
+
     @staticmethod
     def _print_trace(value: T, val_type: ValType) -> None:  # pragma: no cover
         '''Print the current state of the tree parsing.'''
         type_name = _clean_type_name(val_type)
         print(value, type(value).__name__, type_name)
 
-    @log_exceptions_warnings
     def _check_val_max_min(self, value: T) -> None:
         '''Check that the value is within the max and min values.'''
         # the type: ignore comments are there because it's possible that the user will
         # ask for an unorderable type but also give a max or min values.
         # That would fail, but that's the user's fault.
-        msg1 = 'Value(s) of {} ({}) cannot be '.format(self.name or value, value)
-        msg2 = '{} than {}.'
+        # The messages are only formatted if there's an error
+        msg = 'Value(s) of {} ({}) cannot be {} than {}.'
+        val_max, val_min = self.val_max, self.val_min
         try:
-            if self.val_max is not None and value > self.val_max:  # type: ignore
-                raise SettingsValueError(msg1 + msg2.format('larger', self.val_max))
-            if self.val_min is not None and value < self.val_min:  # type: ignore
-                raise SettingsValueError(msg1 + msg2.format('smaller', self.val_min))
+            if val_max is not None and value > val_max:  # type: ignore
+                raise SettingsValueError(msg.format(self.name or value, value,
+                                                    'larger', val_max))
+            if val_min is not None and value < val_min:  # type: ignore
+                raise SettingsValueError(msg.format(self.name or value, value,
+                                                    'smaller', val_min))
         except TypeError as err:
             msg = ('Value {} of type {}'.format(value,_clean_type_name(type(value))) +
                    ' cannot be compared to ' +
@@ -171,15 +408,16 @@ class Value():
                    '.')
             raise SettingsValueError(msg) from err
 
-    @log_exceptions_warnings
-    def _check_seq_len(self, seq: Sized, len_max: int, len_min: int) -> None:
+    def _check_seq_len(self, seq: Sized, len_max: Optional[int],
+                       len_min: Optional[int]) -> None:
         '''Checks that the sequence has the size given by self.len_max/min.'''
-        msg1 = 'Length of {} ({}) cannot be '.format(self.name or seq, len(seq))
-        msg2 = '{} than {}.'
-        if len_max is not None and len(seq) > len_max:
-            raise SettingsValueError(msg1 + msg2.format('larger', len_max))
-        if len_min is not None and len(seq) < len_min:
-           raise SettingsValueError(msg1 + msg2.format('smaller', len_min))
+        # The messages are only formatted if there's an error
+        msg = 'Length of {} ({}) cannot be {} than {}.'
+        length = len(seq)
+        if len_max is not None and length > len_max:
+            raise SettingsValueError(msg.format(self.name or seq, length, 'larger', len_max))
+        if len_min is not None and length < len_min:
+            raise SettingsValueError(msg.format(self.name or seq, length, 'smaller', len_min))
 
     def _cast_to_type(self, value: T, val_type: ValType) -> Any:
         '''Cast the value to the type, which should be callable.'''
@@ -200,17 +438,15 @@ class Value():
             # no exception, val_type matched the value!
             return parsed_value
 
-    @log_exceptions_warnings
-    def _validate_type_tree(self, value: T, val_type: ValType,
-                            len_max: List = None, len_min: List = None,
-                            key: bool = False) -> Any:
-        '''Makes sure that the sequence/value has recursively the given type, ie:
-            a = [1, 2, 3] has val_type=List, and then val_type=int
-            b = [[1, 2, 3], [4, 5, 6]] has val_type=List, then val_type=List and val_type=int
-            c = 1 has val_type=int.
-            The innermost type has to be a concrete one (eg: int, str, etc) or an Union of
-            concrete types; in this case each type in the Union will be tested in order.
-            Returns the validated sequence/value.
+    def _compile_type_tree(self, val_type: ValType,
+                           len_max: Optional[Sequence] = None,
+                           len_min: Optional[Sequence] = None,
+                           key: bool = False) -> '_Node':
+        '''Compile the type tree of val_type into a tree of nodes that validate values, ie:
+            val_type=List[List[int]] compiles to a _SequenceNode
+            with a _SequenceNode child with an _ConcreteNode child.
+            All the type introspection is done here once, so validating a value
+            only does the work needed for each element.
             len_max/min is a list with the max and min list length at this and lower
             tree levels. The values can be None
         '''
@@ -220,7 +456,6 @@ class Value():
         # ie: List[int].__args__ = (int,)
         # Union types also have and __args__ attribute with the types of the union.
         # Same with Mappings
-#        Value._print_trace(value, val_type)
 
         # length max and min at this tree level
         cur_len_max = None if not len_max else len_max[0]
@@ -228,104 +463,100 @@ class Value():
         rest_len_max = [None] if not len_max or len(len_max) < 1 else len_max[1:]
         rest_len_min = [None] if not len_min or len(len_min) < 1 else len_min[1:]
 
-        # Union type, try parsing each option until one works
+        # Union type, each option is tried in order until one works
         if type(val_type) == type(Union):  # pylint: disable=C0123
-            type_list = val_type.__args__
-            for curr_type in type_list:
-                try:
-                    with no_logging():
-                        parsed_value = self._validate_type_tree(value, curr_type, len_max, len_min)
-                except SettingsValueError as err:
-                    # save exception and traceback for later
-                    last_err = err
-                    tb = sys.exc_info()[2]
-                    continue
-                else:
-                    # some type in the Union matched
-                    return parsed_value
-            # no match, error
-            msg = ('Setting "{!r}" (value: {!r}, type: {}) does not have '
-                   'any of the right types ({})')
-            msg = msg.format(self.name or value, value, type(value).__name__,
-                             ', '.join(_clean_type_name(typ)
-                                       for typ in val_type.__args__))
-            raise SettingsValueError(msg + ', because ' + str(last_err)).with_traceback(tb)
+            options = [self._compile_type_tree(curr_type, len_max, len_min)
+                       for curr_type in val_type.__args__]
+            return _UnionNode(self, val_type, options)
 
         # generic mappings such as Dicts: validate both the keys and the values
+        # __args__ has the two types for the keys and values
         elif hasattr(val_type, '__extra__') and issubclass(val_type, Mapping):
-            if not isinstance(value, Mapping):
-                raise SettingsValueError(_wrong_type_error_msg(value, val_type, self.name) +
-                                         ' Details: "This type can only validate dictionaries."')
-            # go through all keys and values and validate them
-            # __args__ has the two types for the keys and values
             key_type, values_type = val_type.__args__
-            mapping = {self._validate_type_tree(inner_key, key_type,
-                                                rest_len_max, rest_len_min, key=True):
-                       self._validate_type_tree(inner_val, values_type,
-                                                rest_len_max, rest_len_min)
-                       for inner_key, inner_val in value.items()}
-            # check length
-            self._check_seq_len(mapping, cur_len_max, cur_len_min)
-            mapping_type = val_type.__extra__
-            return self._cast_to_type(mapping, mapping_type)
+            key_node = self._compile_type_tree(key_type, rest_len_max, rest_len_min, key=True)
+            value_node = self._compile_type_tree(values_type, rest_len_max, rest_len_min)
+            return _MappingNode(self, val_type, key_node, value_node, cur_len_max, cur_len_min)
 
         # generic iterables such as Lists, Tuple, Sets: validate each item
         elif hasattr(val_type, '__extra__') and issubclass(val_type, Iterable):
-            # first check that lst is of the right type
-            # str behave like lists, so if the user wanted a list and value is a str,
-            # cast_to_type will succeed! So avoid it,
-            # also avoid iterating if value is not iterable
-            if (isinstance(value, str) and not issubclass(val_type, str) or
-                not isinstance(value, Collection)):
-                raise SettingsValueError(_wrong_type_error_msg(value, val_type, self.name))
-
             elements_type = val_type.__args__
             if elements_type is None:
-                msg = 'Invalid requested type ({}), generic types must contain arguments.'
-                raise SettingsTypeError(msg.format(_clean_type_name(val_type)))
-
-            # build sequence from the lower branches,
-            # pass the lower level lengths
-            # if it´s a List, elements_type = (type, ), and it will be changed to
-            # elements_type = (type, type, type, ...) for the length of values.
-            # If it's Tuple, elements_type=(type1, type2, ...).
-            if len(elements_type) != len(value):
-                if type(val_type) == type(Tuple):
-                    msg = (' Details: "Wrong number of values: ' +
-                           '{} instead of {}."'.format(len(value), len(elements_type)))
-                    raise SettingsValueError(_wrong_type_error_msg(value, val_type,
-                                                                   self.name) + msg)
-                else:
-                    elements_type = (elements_type[0], )*len(value)
-            sequence = [self._validate_type_tree(inner_value, inner_type,
-                                                 rest_len_max, rest_len_min)
-                        for inner_type, inner_value in zip(elements_type, value)]
-
-            # check length
-            self._check_seq_len(sequence, cur_len_max, cur_len_min)
-            iterable_type = val_type.__extra__
-            return self._cast_to_type(sequence, iterable_type)
+                elements = None  # type: Optional[List[_Node]]
+            else:
+                elements = [self._compile_type_tree(inner_type, rest_len_max, rest_len_min)
+                            for inner_type in elements_type]
+            node = _SequenceNode(self, val_type, elements, cur_len_max, cur_len_min)
+            if self.array:
+                return self._compile_array(val_type, node, len_max, len_min)
+            return node
 
         # single concrete type (int, str, list, dict, ...): cast to correct type
         # DictValue also ends up here, casting a value to it calls DictValue's own validate method.
         elif not hasattr(val_type, '__extra__'):
-            parsed_value = self._cast_to_type(value, val_type)
-            # don't check if key is True: it's a mapping key
-            if not key:
-                self._check_val_max_min(parsed_value)
-
-            if isinstance(parsed_value, Sized):
-                self._check_seq_len(parsed_value, cur_len_max, cur_len_min)
-            return parsed_value
+            return _ConcreteNode(self, val_type, cur_len_max, cur_len_min, key)
 
         else:
-            raise SettingsTypeError('Type not recognized or supported ({}).'.format(val_type))
+            return _UnsupportedNode(self, val_type)
+
+    def _compile_array(self, val_type: ValType, node: '_SequenceNode',
+                       len_max: Optional[Sequence] = None,
+                       len_min: Optional[Sequence] = None) -> '_Node':
+        '''Return an _ArrayNode if val_type is a (nested) list of ints, floats or complex,
+            otherwise return the node unchanged.'''
+        ndim = 0
+        dtype = val_type
+        while (getattr(dtype, '__extra__', None) is list and dtype.__args__ and
+               len(dtype.__args__) == 1):
+            dtype = dtype.__args__[0]
+            ndim += 1
+        if not ndim or dtype not in (int, float, complex):
+            return node
+        try:
+            import numpy
+        except ImportError as err:
+            msg = 'NumPy is needed to validate {} as an array.'
+            raise SettingsTypeError(msg.format(_clean_type_name(val_type))) from err
+        # length max and min at each level of the array
+        len_max = list(len_max or []) + [None]*ndim
+        len_min = list(len_min or []) + [None]*ndim
+        return _ArrayNode(self, val_type, node, numpy, dtype, ndim,
+                          len_max[:ndim], len_min[:ndim])
 
+    @property
+    def plan(self) -> '_Node':
+        '''The compiled validator of the type tree, built on first use.'''
+        if self._plan is None:
+            self._plan = self._compile_type_tree(self.val_type, self.len_max, self.len_min)
+        return self._plan
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        '''Changing any parameter invalidates the compiled validator.'''
+        if self._frozen and name != '_plan':
+            raise AttributeError('Cannot set "{}", the {} is frozen.'.format(
+                name, self.__class__.__name__))
+        object.__setattr__(self, name, value)
+        if name != '_plan':
+            object.__setattr__(self, '_plan', None)
+            object.__setattr__(self, '_changes', self._changes + 1)
+
+    def freeze(self) -> 'Value':
+        '''Make this Value and the Values in its type immutable, so they can be shared
+            without copying them. Return the Value.'''
+        if not self._frozen:
+            object.__setattr__(self, '_frozen', True)
+            _freeze_type(self.val_type)
+        return self
+
+    @log_exceptions_warnings
     def validate(self, value: T) -> Any:
         '''validates the value from a settings file
             and tries to convert it to this Value's type.'''
-        validated_value =  self._validate_type_tree(value, self.val_type,
-                                                    self.len_max, self.len_min)
+        if profiling.active_profile() is None or profiling.is_nested():
+            validated_value = self.plan.validate(value)
+        else:
+            validated_value = profiling.measure_validation(
+                self.name or _clean_type_name(self.val_type), self._count_nodes,
+                self.plan.validate, value)
 
         if self.fun and not self.fun(validated_value):
             val_type = 'value: {!r}, type: {}'.format(validated_value,
@@ -336,27 +567,415 @@ class Value():
 
         return validated_value
 
+    def _count_nodes(self) -> int:
+        '''Return the number of nodes of the compiled validator.'''
+        return _count_nodes(self.plan)
+
+
+def _count_nodes(node: '_Node') -> int:
+    '''Return the number of nodes of the compiled validator with this root node.'''
+    return 1 + sum(_count_nodes(child) for child in node.children())
+
+
+class _Node():
+    '''A compiled validator for one level of the type tree of a Value.
+        It keeps a reference to the Value for the name, val_max/min, expand_args, etc.'''
+    __slots__ = ['owner', 'val_type']
+
+    def __init__(self, owner: Value, val_type: ValType) -> None:
+        self.owner = owner
+        self.val_type = val_type
+
+    def validate(self, value: T) -> Any:
+        '''Return the validated value or raise SettingsValueError.'''
+        raise NotImplementedError
+
+    def rejects(self, value_type: type) -> bool:  # pylint: disable=W0613,R0201
+        '''Return True if all values of value_type fail validation, without trying them.'''
+        return False
+
+    def streams(self) -> bool:  # pylint: disable=R0201
+        '''Return True if a list can be validated from an iterator of its items,
+            see validate_items.'''
+        return False
+
+    def validate_items(self, items: Iterator) -> Any:
+        '''Return the validated list with the items of the iterator,
+            each item is validated as soon as it's produced (ie: parsed).'''
+        raise NotImplementedError
+
+    def children(self) -> List['_Node']:  # pylint: disable=R0201
+        '''Return the nodes that validate the inner types.'''
+        return []
+
+
+# the types that the builtin numbers can be created from: strings and the types
+# with the special methods that convert to them, see _ConcreteNode.rejects
+_NUMBER_SOURCES = {int: ((str, bytes, bytearray), ('__int__', '__index__', '__trunc__')),
+                   float: ((str, bytes, bytearray), ('__float__', '__index__')),
+                   complex: ((str,), ('__complex__', '__float__', '__index__'))}
+
+class _ConcreteNode(_Node):
+    '''Single concrete type (int, str, list, dict, DictValue, ...): cast to the type.'''
+    __slots__ = ['len_max', 'len_min', 'check_val', 'check_len', 'sources']
+
+    def __init__(self, owner: Value, val_type: ValType,
+                 len_max: Optional[int], len_min: Optional[int], key: bool) -> None:
+        super(_ConcreteNode, self).__init__(owner, val_type)
+        self.len_max = len_max
+        self.len_min = len_min
+        # don't check the value if it's a mapping key
+        self.check_val = not key and (owner.val_max is not None or owner.val_min is not None)
+        self.check_len = len_max is not None or len_min is not None
+        # only the builtin numbers are known to reject types, custom callables can accept any
+        self.sources = (None if owner.expand_args or not isinstance(val_type, type) else
+                        _NUMBER_SOURCES.get(val_type))
+
+    def rejects(self, value_type: type) -> bool:
+        if self.sources is None:
+            return False
+        strings, methods = self.sources
+        return not (issubclass(value_type, strings) or
+                    any(hasattr(value_type, method) for method in methods))
+
+    def validate(self, value: T) -> Any:
+        parsed_value = self.owner._cast_to_type(value, self.val_type)
+        if self.check_val:
+            self.owner._check_val_max_min(parsed_value)
+        if self.check_len and isinstance(parsed_value, Sized):
+            self.owner._check_seq_len(parsed_value, self.len_max, self.len_min)
+        return parsed_value
+
+
+class _UnionNode(_Node):
+    '''Union type, try validating each option in order until one works.
+        The options that reject the type of the value are skipped,
+        they are found once for each type.'''
+    __slots__ = ['options', 'dispatch']
+
+    def __init__(self, owner: Value, val_type: ValType, options: List[_Node]) -> None:
+        super(_UnionNode, self).__init__(owner, val_type)
+        self.options = options
+        # options to try for each type of value
+        self.dispatch = {}  # type: Dict[type, List[_Node]]
+
+    def rejects(self, value_type: type) -> bool:
+        return all(option.rejects(value_type) for option in self.options)
+
+    def _options_for(self, value_type: type) -> List[_Node]:
+        '''Return the options that could validate a value of value_type, in order.
+            The last option is always tried, so a failure has the same error.'''
+        options = [option for option in self.options[:-1] if not option.rejects(value_type)]
+        options.append(self.options[-1])
+        self.dispatch[value_type] = options
+        return options
+
+    def children(self) -> List[_Node]:
+        return self.options
+
+    def validate(self, value: T) -> Any:
+        options = self.dispatch.get(type(value)) or self._options_for(type(value))
+        for option in options:
+            try:
+                parsed_value = option.validate(value)
+            except SettingsValueError as err:
+                # save exception and traceback for later
+                last_err = err
+                tb = sys.exc_info()[2]
+                continue
+            else:
+                # some type in the Union matched
+                return parsed_value
+        # no match, error
+        msg = ('Setting "{!r}" (value: {!r}, type: {}) does not have '
+               'any of the right types ({})')
+        msg = msg.format(self.owner.name or value, value, type(value).__name__,
+                         ', '.join(_clean_type_name(typ) for typ in self.val_type.__args__))
+        raise SettingsValueError(msg + ', because ' + str(last_err)).with_traceback(tb)
+
+
+class _MappingNode(_Node):
+    '''Generic mappings such as Dicts: validate both the keys and the values.'''
+    __slots__ = ['key_node', 'value_node', 'len_max', 'len_min', 'check_len', 'cast']
+
+    def __init__(self, owner: Value, val_type: ValType, key_node: _Node, value_node: _Node,
+                 len_max: Optional[int], len_min: Optional[int]) -> None:
+        super(_MappingNode, self).__init__(owner, val_type)
+        self.key_node = key_node
+        self.value_node = value_node
+        self.len_max = len_max
+        self.len_min = len_min
+        self.check_len = len_max is not None or len_min is not None
+        # the validated mapping is already a dict
+        self.cast = owner.expand_args or val_type.__extra__ is not dict
+
+    def rejects(self, value_type: type) -> bool:
+        return not issubclass(value_type, Mapping)
+
+    def children(self) -> List[_Node]:
+        return [self.key_node, self.value_node]
+
+    def validate(self, value: T) -> Any:
+        if not isinstance(value, Mapping):
+            raise SettingsValueError(_wrong_type_error_msg(value, self.val_type,
+                                                           self.owner.name) +
+                                     ' Details: "This type can only validate dictionaries."')
+        return self.finish(self.validate_entries(value.items()))
+
+    def validate_entries(self, entries: Iterable[Tuple]) -> Dict:
+        '''Return the dictionary with the validated (key, value) entries,
+            without checking its length, see finish.'''
+        key_validate = self.key_node.validate
+        value_validate = self.value_node.validate
+        return {key_validate(inner_key): value_validate(inner_val)
+                for inner_key, inner_val in entries}
+
+    def finish(self, mapping: Dict) -> Any:
+        '''Check the length of the validated dictionary and cast it to the type.'''
+        if self.check_len:
+            self.owner._check_seq_len(mapping, self.len_max, self.len_min)
+        if self.cast:
+            return self.owner._cast_to_type(mapping, self.val_type.__extra__)
+        return mapping
+
+
+class _SequenceNode(_Node):
+    '''Generic iterables such as Lists, Tuple, Sets: validate each item.
+        Lists have only one element node, Tuples have one for each item.'''
+    __slots__ = ['elements', 'is_tuple', 'allow_str',
+                 'len_max', 'len_min', 'check_len', 'cast']
+
+    def __init__(self, owner: Value, val_type: ValType, elements: Optional[List[_Node]],
+                 len_max: Optional[int], len_min: Optional[int]) -> None:
+        super(_SequenceNode, self).__init__(owner, val_type)
+        self.elements = elements
+        self.is_tuple = type(val_type) == type(Tuple)  # pylint: disable=C0123
+        self.allow_str = issubclass(val_type, str)
+        self.len_max = len_max
+        self.len_min = len_min
+        self.check_len = len_max is not None or len_min is not None
+        # the validated sequence is already a list
+        self.cast = owner.expand_args or val_type.__extra__ is not list
+
+    def rejects(self, value_type: type) -> bool:
+        return (issubclass(value_type, str) and not self.allow_str or
+                not issubclass(value_type, Collection))
+
+    def children(self) -> List[_Node]:
+        return self.elements or []
+
+    def streams(self) -> bool:
+        # Lists (not Tuples) have only one element node
+        return self.elements is not None and len(self.elements) == 1 and not self.is_tuple
+
+    def validate_items(self, items: Iterator) -> Any:
+        return self.finish(self.validate_elements(items))
+
+    def validate_elements(self, items: Iterable) -> List:
+        '''Return the list with the validated items, without checking its length.
+            Only for Lists, see streams.'''
+        element_validate = self.children()[0].validate
+        return [element_validate(inner_value) for inner_value in items]
+
+    def finish(self, sequence: List) -> Any:
+        '''Check the length of the validated list and cast it to the type.'''
+        if self.check_len:
+            self.owner._check_seq_len(sequence, self.len_max, self.len_min)
+        if self.cast:
+            return self.owner._cast_to_type(sequence, self.val_type.__extra__)
+        return sequence
+
+    def validate(self, value: T) -> Any:
+        # first check that lst is of the right type
+        # str behave like lists, so if the user wanted a list and value is a str,
+        # cast_to_type will succeed! So avoid it,
+        # also avoid iterating if value is not iterable
+        if (isinstance(value, str) and not self.allow_str or
+                not isinstance(value, Collection)):
+            raise SettingsValueError(_wrong_type_error_msg(value, self.val_type,
+                                                           self.owner.name))
+
+        elements = self.elements
+        if elements is None:
+            msg = 'Invalid requested type ({}), generic types must contain arguments.'
+            raise SettingsTypeError(msg.format(_clean_type_name(self.val_type)))
+
+        # If it's a List, the only element node validates all values.
+        # If it's a Tuple, each element node validates its value.
+        if len(elements) == len(value):
+            sequence = [element.validate(inner_value)
+                        for element, inner_value in zip(elements, value)]
+        elif self.is_tuple:
+            msg = (' Details: "Wrong number of values: ' +
+                   '{} instead of {}."'.format(len(value), len(elements)))
+            raise SettingsValueError(_wrong_type_error_msg(value, self.val_type,
+                                                           self.owner.name) + msg)
+        else:
+            element_validate = elements[0].validate
+            sequence = [element_validate(inner_value) for inner_value in value]
+
+        return self.finish(sequence)
+
+
+class _ArrayNode(_Node):
+    '''(Nested) lists of ints, floats or complex converted and checked at once with NumPy.
+        Values that NumPy cannot convert exactly as the type would (ragged lists,
+        None, complex into floats, etc) are validated element-wise by the sequence node,
+        so the results and error messages are always the same.'''
+    __slots__ = ['sequence_node', 'numpy', 'dtype', 'ndim', 'len_max', 'len_min']
+
+    def __init__(self, owner: Value, val_type: ValType, sequence_node: _SequenceNode,
+                 numpy: Any, dtype: type, ndim: int,
+                 len_max: List[int], len_min: List[int]) -> None:
+        super(_ArrayNode, self).__init__(owner, val_type)
+        self.sequence_node = sequence_node
+        self.numpy = numpy
+        self.dtype = dtype
+        self.ndim = ndim
+        self.len_max = len_max
+        self.len_min = len_min
+
+    def rejects(self, value_type: type) -> bool:
+        return self.sequence_node.rejects(value_type)
+
+    def _to_array(self, value: T, ndim: Optional[int] = None) -> Any:
+        '''Convert the value to an array with ndim dimensions (by default those of the type),
+            return None if NumPy can't do it like the type.'''
+        if isinstance(value, (str, bytes, Mapping)):
+            return None
+        try:
+            array = self.numpy.array(value, dtype=self.dtype)
+        except (ValueError, TypeError, OverflowError):
+            return None
+        if array.ndim != (self.ndim if ndim is None else ndim):
+            return None
+        # NumPy converts None to nan
+        if self.dtype is not int and array.size and self.numpy.isnan(array).any():
+            return None
+        return array
+
+    def children(self) -> List[_Node]:
+        return [self.sequence_node]
+
+    def streams(self) -> bool:
+        return self.sequence_node.streams()
+
+    def validate_items(self, items: Iterator) -> Any:
+        # each row is converted to a small array as soon as it's parsed
+        if self.ndim == 1:
+            return self.validate(list(items))
+        rows = []  # type: List[Any]
+        arrays = True
+        for item in items:
+            row = self._to_array(item, self.ndim - 1) if arrays else None
+            if row is not None and rows and row.shape != rows[0].shape:
+                row = None
+            if row is None and arrays:
+                # ragged or not like the type, validated element-wise as in validate.
+                # The rows already converted are lists of the converted numbers, the results
+                # are the same but the message of a ragged array shows them (1.0 instead of 1)
+                arrays = False
+                rows = [previous.tolist() for previous in rows]
+            rows.append(item if row is None else row)
+        if not arrays or not rows:
+            return self.validate(rows)
+        return self._check(self.numpy.stack(rows))
+
+    def validate(self, value: T) -> Any:
+        array = self._to_array(value)
+        if array is None:
+            sequence = self.sequence_node.validate(value)
+            try:
+                return self.numpy.array(sequence, dtype=self.dtype)
+            except (ValueError, OverflowError) as err:  # ragged, or too large integers
+                msg = 'Setting "{}" (value: {!r}) cannot be converted to an array of {}.'
+                raise SettingsValueError(msg.format(self.owner.name or value, value,
+                                                    _clean_type_name(self.val_type)) +
+                                         ' Details: "' + str(err).capitalize() + '".')
+        return self._check(array)
+
+    def _check(self, array: Any) -> Any:
+        '''Check the lengths and the values of the array.'''
+        owner = self.owner
+        # all lists at the same level have the same length
+        for level, (len_max, len_min) in enumerate(zip(self.len_max, self.len_min)):
+            if (len_max is not None or len_min is not None) and all(array.shape[:level]):
+                owner._check_seq_len(array[(0,)*level], len_max, len_min)
+        # if the extreme values are valid, all are
+        if array.size and (owner.val_max is not None or owner.val_min is not None):
+            owner._check_val_max_min(array.max().item())
+            owner._check_val_max_min(array.min().item())
+        return array
+
+
+class _UnsupportedNode(_Node):
+    '''A type that cannot be validated, it raises SettingsTypeError when used.'''
+    __slots__ = []  # type: List[str]
+
+    def validate(self, value: T) -> Any:
+        raise SettingsTypeError('Type not recognized or supported ({}).'.format(self.val_type))
+
+
+def _value_attribute(attr: str) -> property:
+    '''Property of NamedValue that gets and sets the attribute of its Value.'''
+    def set_attribute(self: 'NamedValue', value: Any) -> None:
+        setattr(self.value, attr, value)
+        self._plan = None
+    return property(attrgetter('value.' + attr), set_attribute, doc=attr)
+
 
 class NamedValue(Value):
     '''Similar to Value, but it has a key (which must be hashable) and
-        it validates a dictionary that contains the key and a value with the type val_type.'''
+        it validates a dictionary that contains the key and a value with the type val_type.
+        The Value with the rest of the parameters is referenced, not copied.'''
+    __slots__ = ['key', 'value', '_value_changes']
+
+    val_type = _value_attribute('val_type')
+    val_max = _value_attribute('val_max')
+    val_min = _value_attribute('val_min')
+    kind = _value_attribute('kind')
+    fun = _value_attribute('fun')
+    len_max = _value_attribute('len_max')
+    len_min = _value_attribute('len_min')
+    expand_args = _value_attribute('expand_args')
+    array = _value_attribute('array')
+
     def __init__(self, key: Hashable, val_type: Union[ValType, Value, 'DictValue'],
                  **kwargs: Any) -> None:
         '''The key must be hashable (often it's a string), val_type can be a Value instance
             (in this case the rest of the arguments are ignored),
             or a type, the rest of the arguments are as for Value.'''
+        object.__setattr__(self, '_frozen', False)
+        object.__setattr__(self, '_changes', 0)
         self.key = key
+        self.name = str(key)
         if isinstance(val_type, Value):
             # use the Value's parameters for this NamedValue
-            value = val_type
-            val_type = value.val_type
-            kwargs = vars(value)
-            del kwargs['val_type']
-            del kwargs['name']
-        super(NamedValue, self).__init__(val_type, name=str(key), **kwargs)
+            self.value = val_type
+        else:
+            self.value = Value(val_type, name=self.name, **kwargs)
+        self._value_changes = -1
 
+    @property
+    def plan(self) -> '_Node':
+        '''The compiled validator of the Value if it has the same name,
+            otherwise one with this name, built again if the Value changes.'''
+        value = self.value
+        if value.name == self.name:
+            return value.plan
+        plan = self._plan
+        if plan is None or self._value_changes != value._changes:
+            plan = self._compile_type_tree(self.val_type, self.len_max, self.len_min)
+            object.__setattr__(self, '_plan', plan)
+            object.__setattr__(self, '_value_changes', value._changes)
+        return plan
+
+    def freeze(self) -> 'NamedValue':
+        '''Make this NamedValue and its Value immutable, see Value.freeze.'''
+        self.value.freeze()
+        super(NamedValue, self).freeze()
+        return self
 
-    @log_exceptions_warnings
     def validate(self, value: T) -> Dict:
         '''Checks that the value is a dictionary where the key is equal to the name
             and the value has type val_type.'''
@@ -367,81 +986,153 @@ class NamedValue(Value):
             msg = 'Setting "{}" not in dictionary {}'.format(self.name, value)
             raise SettingsValueError(msg)
         parsed_key = self.key
+        parsed_value = self._validate_section(self.plan.validate, value[self.key])
+        return {parsed_key: parsed_value}
+
+    def streams(self) -> bool:
+        '''Return True if the value is a list that can be validated item by item
+            as it's parsed, see validate_items.'''
+        return self.plan.streams()
+
+    def validate_items(self, items: Iterator) -> Any:
+        '''Return the validated value from an iterator of the items of the list,
+            each one is validated as soon as it's produced (ie: parsed),
+            so the whole unvalidated list is never built. See streams.'''
+        return self._validate_section(self.plan.validate_items, items)
+
+    def _validate_section(self, validate: Callable[[Any], Any], value: Any) -> Any:
+        '''Validate the value with the function, recording it in the active profile.'''
         try:
-            parsed_value = self._validate_type_tree(value[self.key], self.val_type,
-                                                    self.len_max, self.len_min)
+            if profiling.active_profile() is None:
+                return validate(value)
+            return profiling.measure_validation(self.key, self._count_nodes, validate, value)
         except SettingsValueError as exc:
             msg = 'Error validating section "{}". Details: '.format(self.key)
             raise SettingsValueError(msg + str(exc)) from exc
 
-        return {parsed_key: parsed_value}
-
 
 class DictValue():
-    '''Represents a dictionary of Values, each with a name and type.'''
+    '''Represents a dictionary of Values, each with a name and type.
+        After freeze() the DictValue cannot be changed and it can be shared.'''
     mandatory = Kind.mandatory
     optional = Kind.optional
     exclusive = Kind.exclusive
 
+    __slots__ = ['values_list', 'kind', '_needed_values', '_exclusive_values',
+                 '_optional_values', '__name__', '_frozen', '_fingerprint']
+    if TYPE_CHECKING:  # pragma: no cover
+        # set with object.__setattr__, see __setattr__
+        _frozen = False  # type: bool
+
     @log_exceptions_warnings
     def __init__(self, values: Dict[Hashable, Union[Value, 'DictValue', ValType]],
                  kind: Kind = Kind.mandatory) -> None:
         '''values is a dictionary with the keys hashable
             and the values are simple types, Value instances or dictionaries of either.'''
+        # frozen DictValues cannot be changed, see freeze
+        object.__setattr__(self, '_frozen', False)
+        self._fingerprint = None  # type: Optional[str]
 
         if isinstance(values, Dict):
-            self.values_list = []  # type: List[NamedValue]
+            values_list = []  # type: List[NamedValue]
             for key, value in values.items():
                 if isinstance(value, DictValue):
-                    self.values_list.append(NamedValue(key, value,
-                                                       kind=value.kind))  # type: ignore
+                    values_list.append(NamedValue(key, value,
+                                                  kind=value.kind))  # type: ignore
                 elif isinstance(value, Dict):
-                    self.values_list.append(NamedValue(key, DictValue(value)))
+                    values_list.append(NamedValue(key, DictValue(value)))
                 else:
-                    self.values_list.append(NamedValue(key, value))
+                    values_list.append(NamedValue(key, value))
+            # a tuple once it's frozen
+            self.values_list = values_list  # type: Sequence[NamedValue]
 
         else:
             msg = 'The first argument must be a dictionary.'
             raise SettingsValueError(msg)
         self.kind = kind
 
-        value_names = ', '.join('{}: {}'.format(repr(value.key), _clean_type_name(value.val_type))
-                      for value in self.values_list)
-        self.__name__ =  '{}({})'.format(self.__class__.__name__, value_names)
+        # the keys of each kind are needed at every validation, find them once
+        self._needed_values = frozenset(val.key for val in self.values_list
+                                        if val.kind is Kind.mandatory)
+        self._exclusive_values = frozenset(val.key for val in self.values_list
+                                           if val.kind is Kind.exclusive)
+        self._optional_values = frozenset(val.key for val in self.values_list
+                                          if val.kind is Kind.optional) | self._exclusive_values
 
+        value_names = ', '.join('{}: {}'.format(repr(value.key), _clean_type_name(value.val_type))
+                                for value in self.values_list)
+        self.__name__ = '{}({})'.format(self.__class__.__name__, value_names)
 
     def __repr__(self) -> str:
         return str(self.__name__)
 
+    def __getstate__(self) -> Tuple:
+        '''For pickle and copy.'''
+        return _get_state(self)
+
+    def __setstate__(self, state: Tuple) -> None:
+        '''For pickle and copy, the attributes are set even if the DictValue is frozen.'''
+        _set_state(self, state)
+
     def __call__(self, config_dict: Dict) -> Dict:
         '''Pretend to be a type so typing module doesn't complain'''
         return dict(self.validate(config_dict))
 
-    @log_exceptions_warnings
+    def __setattr__(self, name: str, value: Any) -> None:
+        if self._frozen:
+            raise AttributeError('Cannot set "{}", the {} is frozen.'.format(
+                name, self.__class__.__name__))
+        object.__setattr__(self, name, value)
+
+    def freeze(self) -> 'DictValue':
+        '''Make this DictValue and all its Values immutable, so it can be shared
+            by many Settings without copying it. Return the DictValue.'''
+        if not self._frozen:
+            self.values_list = tuple(value.freeze() for value in self.values_list)
+            object.__setattr__(self, '_frozen', True)
+        return self
+
+    def fingerprint(self) -> str:
+        '''Return a string that identifies this DictValue and all its Values.'''
+        if self._fingerprint is not None:
+            return self._fingerprint
+        values = ', '.join('{!r}: {}'.format(value.key, value.fingerprint())
+                           for value in self.values_list)
+        fingerprint = '{}({{{}}}, kind={})'.format(self.__class__.__name__, values,
+                                                   self.kind.name)
+        if self._frozen:
+            # it cannot change anymore
+            object.__setattr__(self, '_fingerprint', fingerprint)
+        return fingerprint
+
+    def _count_nodes(self) -> int:
+        '''Return the number of nodes of the compiled validators of all the Values.'''
+        return sum(value._count_nodes() for value in self.values_list)
+
     def _check_extra_and_exclusive(self, config_dict: Dict) -> None:
         '''Check that exclusive values are not present at the same time.
             Warn if extra values are present.'''
         present_values = set(config_dict.keys())
 
-        needed_values = set(val.name for val in self.values_list if val.kind is Kind.mandatory)
-        optional_values = set(val.name for val in self.values_list if val.kind is Kind.optional)
-        exclusive_values = set(val.name for val in self.values_list if val.kind is Kind.exclusive)
-        optional_values = optional_values | exclusive_values
+        needed_values = self._needed_values
+        optional_values = self._optional_values
+        exclusive_values = self._exclusive_values
 
         set_extra = present_values - needed_values
         # if there are extra values and they aren't optional
         if set_extra and not set_extra.issubset(optional_values):
             set_not_optional = set_extra - optional_values
-            warnings.warn('Some values or sections should not be present in the file: ' +
-                          str(set_not_optional), SettingsExtraValueWarning)
+            warn('Some values or sections should not be present in the file: ' +
+                 str(set_not_optional), SettingsExtraValueWarning)
         # exclusive values
         if len(exclusive_values) > 1 and exclusive_values.issubset(present_values):
-            raise SettingsValueError('Only one of the values in ' +
-                             '{} can be present at the same time.'.format(exclusive_values))
+            msg = 'Only one of the values in {} can be present at the same time.'
+            raise SettingsValueError(msg.format(set(exclusive_values)))
 
     @log_exceptions_warnings
-    def validate(self, config_dict: Dict) -> Dict:
-        '''Return the validated dictionary'''
+    def validate(self, config_dict: Dict, keys: Optional[AbstractSet] = None) -> Dict:
+        '''Return the validated dictionary.
+            If keys is given, only the values with those keys are validated and returned.'''
         if not isinstance(config_dict, Dict):
             dict_str = repr(self).replace('DictValue', 'dictionary', 1)
             rreplaced = _wrong_type_error_msg(config_dict, list).rsplit('list', 1)
@@ -450,10 +1141,20 @@ class DictValue():
 
         self._check_extra_and_exclusive(config_dict)
 
+        if profiling.active_profile() is None or profiling.is_nested():
+            return self._validate_values(config_dict, keys)
+        return profiling.measure_validation(None, self._count_nodes,
+                                            lambda config: self._validate_values(config, keys),
+                                            config_dict)
+
+    def _validate_values(self, config_dict: Dict, keys: Optional[AbstractSet] = None) -> Dict:
+        '''Return the dictionary with the validated values, see validate.'''
         #  we are given a dictionary to match
         # store validated values
         parsed_dict = {}  # type: Dict
         for val in self.values_list:
+            if keys is not None and val.key not in keys:
+                continue
             # skip optional values that aren't present
             if val.kind is not Value.mandatory and (val.key not in config_dict or
                                                     config_dict[val.key] is None):
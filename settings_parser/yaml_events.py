@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Load YAML documents straight from the parser events.
+
+ruamel.yaml composes the whole document into a graph of nodes before constructing
+the Python objects, for large files the nodes take many times the memory of the data.
+Here each object is constructed as soon as its events are parsed, the nodes are never built.
+Documents with features this doesn't handle (ie: tags of collections) are loaded
+again with ruamel.yaml, so the result is always the same.
+The items of the lists in the root mapping can be given to a function as they are constructed
+(ie: to validate them), so the list of the loaded items is never built, see load.
+
+It's opt-in: files are loaded with ruamel.yaml, this module is only used for the sections
+of the Settings created with stream_lists=True.
+It uses the constructor and the parser returned by YAML.get_constructor_parser, the method
+YAML.load uses, and the event and node classes of ruamel.yaml.
+
+This module is imported only when a YAML file is loaded with stream_lists.
+"""
+import re
+from types import GeneratorType
+from typing import Dict, Any, IO, Union, Iterator, Callable, Hashable, Optional
+
+from ruamel.yaml.composer import ComposerError
+from ruamel.yaml.constructor import SafeConstructor
+from ruamel.yaml.events import (AliasEvent, ScalarEvent, SequenceStartEvent, SequenceEndEvent,
+                                MappingStartEvent, MappingEndEvent, StreamEndEvent)
+from ruamel.yaml.nodes import ScalarNode, SequenceNode, MappingNode
+
+from settings_parser.util import SettingsValueError
+
+_STR_TAG = 'tag:yaml.org,2002:str'
+_SEQ_TAG = 'tag:yaml.org,2002:seq'
+_MAP_TAG = 'tag:yaml.org,2002:map'
+_MERGE_TAG = 'tag:yaml.org,2002:merge'
+_VALUE_TAG = 'tag:yaml.org,2002:value'
+
+# scalars that SafeConstructor constructs the same as these functions, if they match the regex
+# (None matches everything): tag: (constructor, regex, function)
+_FAST_SCALARS = {
+    _STR_TAG: (SafeConstructor.construct_yaml_str, None, str),
+    'tag:yaml.org,2002:int': (SafeConstructor.construct_yaml_int,
+                              re.compile(r'[-+]?(0|[1-9][0-9]*)'), int),
+    'tag:yaml.org,2002:float': (SafeConstructor.construct_yaml_float,
+                                re.compile(r'[-+]?[0-9]*\.[0-9]*([eE][-+]?[0-9]+)?'), float),
+}
+
+
+class _Unsupported(Exception):
+    '''The document has to be loaded by composing the nodes.'''
+    pass
+
+
+class _ItemError(Exception):
+    '''Wraps an error constructing an item given to a stream function,
+        so it's raised as it is and not as an error of the function.'''
+    pass
+
+# functions called with an iterator of the items of a list, by key of the root mapping
+Streams = Dict[Hashable, Callable[[Iterator], Any]]
+
+
+def supports(yaml: Any) -> bool:
+    '''Return True if documents loaded with the ruamel.yaml YAML instance can be constructed
+        from the events: sequences and mappings are constructed as with a no-duplicates
+        SafeConstructor.'''
+    from settings_parser.settings import _no_duplicates_constructor
+    constructors = getattr(yaml.Constructor, 'yaml_constructors', {})
+    return (constructors.get(_MAP_TAG) is _no_duplicates_constructor and
+            constructors.get(_SEQ_TAG) is SafeConstructor.construct_yaml_seq and
+            not getattr(yaml.Resolver, 'yaml_path_resolvers', None))
+
+def load(stream: Union[IO, str], new_yaml: Callable[[], Any],
+         streams: Optional[Streams] = None) -> Any:
+    '''Load the single document in the stream or string with a ruamel.yaml YAML instance
+        returned by new_yaml. It's constructed from the events if the YAML instance
+        and the stream (rewinding it) allow it, otherwise it's loaded with ruamel.yaml.
+        If the root is a mapping, the value of a key in streams that is a list
+        is the result of streams[key] called with an iterator of its items,
+        which are constructed as the function iterates. If the document is loaded
+        with ruamel.yaml the values are the loaded lists, even if the functions were called.'''
+    yaml = new_yaml()
+    position = _tell(stream) if supports(yaml) else None
+    if position is not None:
+        constructor, parser = yaml.get_constructor_parser(stream)
+        try:
+            return _EventConstructor(constructor, parser, streams).single_document()
+        except _Unsupported:
+            if not isinstance(stream, str):
+                stream.seek(position)
+            # the reader and scanner of yaml are in the middle of the stream
+            yaml = new_yaml()
+        finally:
+            parser.dispose()
+    return yaml.load(stream)
+
+def _tell(stream: Union[IO, str]) -> Any:
+    '''Return the position of the stream, 0 for strings or None if it cannot be rewound.'''
+    if isinstance(stream, str):
+        return 0
+    try:
+        return stream.tell()
+    except (AttributeError, OSError):
+        return None
+
+
+class _EventConstructor():
+    '''Construct the objects of the documents from the events of the parser.'''
+
+    def __init__(self, constructor: Any, parser: Any, streams: Optional[Streams] = None) -> None:
+        # the ruamel.yaml constructor, used for the scalars it constructs
+        self.constructor = constructor
+        # functions for the lists of the root mapping, see load
+        self.streams = streams
+        self.get_event = parser.get_event
+        self.resolver = constructor.resolver
+        self.constructors = constructor.yaml_constructors
+        self.fast_scalars = {tag: (regex.fullmatch if regex else None, function)
+                             for tag, (constructor, regex, function) in _FAST_SCALARS.items()
+                             if self.constructors.get(tag) is constructor}
+        self.anchors = {}  # type: Dict[str, Any]
+        # anchors of the mappings being constructed
+        self.open_anchors = set()  # type: set
+
+    def single_document(self) -> Any:
+        '''Return the only document in the stream, None if it's empty.'''
+        self.get_event()  # stream start
+        data = None
+        event = self.get_event()
+        if not isinstance(event, StreamEndEvent):
+            first_event = self.get_event()
+            data = self.document(first_event)
+            event = self.get_event()
+            if not isinstance(event, StreamEndEvent):
+                raise ComposerError('expected a single document in the stream',
+                                    first_event.start_mark,
+                                    'but found another document', event.start_mark)
+        return data
+
+    def document(self, event: Any) -> Any:
+        '''Return the document with this first event, the document start was already parsed.'''
+        self.anchors = {}
+        self.open_anchors = set()
+        if self.streams and isinstance(event, MappingStartEvent):
+            data = self.mapping(event, self.streams)  # type: Any
+        else:
+            data = self.node(event)
+        self.get_event()  # document end
+        return data
+
+    def node(self, event: Any) -> Any:
+        '''Return the object that starts with event.'''
+        if isinstance(event, ScalarEvent):
+            return self.scalar(event, self.scalar_tag(event))
+        if isinstance(event, AliasEvent):
+            return self.alias(event)
+        if event.anchor is not None and (event.anchor in self.anchors or
+                                         event.anchor in self.open_anchors):
+            raise _Unsupported  # ruamel.yaml warns about reused anchors
+        if isinstance(event, SequenceStartEvent):
+            return self.sequence(event)
+        return self.mapping(event)
+
+    def resolve(self, kind: type, value: Any, implicit: Any) -> str:
+        '''Return the tag resolved by ruamel.yaml as a string, newer versions return Tag objects.'''
+        return str(self.resolver.resolve(kind, value, implicit))
+
+    def scalar_tag(self, event: Any) -> str:
+        '''Return the resolved tag of the scalar.'''
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = self.resolve(ScalarNode, event.value, event.implicit)
+        return tag
+
+    def scalar(self, event: Any, tag: str) -> Any:
+        '''Return the scalar with the tag.'''
+        if event.anchor is not None and event.anchor in self.anchors:
+            raise _Unsupported
+        fast = self.fast_scalars.get(tag)
+        if fast is not None and (fast[0] is None or fast[0](event.value)):
+            data = fast[1](event.value)
+        else:
+            constructor = self.constructors.get(tag)
+            if constructor is None:
+                raise _Unsupported
+            data = constructor(self.constructor, ScalarNode(tag, event.value, event.start_mark,
+                                                       event.end_mark, style=event.style))
+            if isinstance(data, GeneratorType):
+                raise _Unsupported
+        if event.anchor is not None:
+            self.anchors[event.anchor] = data
+        return data
+
+    def alias(self, event: Any) -> Any:
+        '''Return the anchored object.'''
+        if event.anchor in self.open_anchors or event.anchor not in self.anchors:
+            raise _Unsupported  # recursive mapping or undefined alias
+        return self.anchors[event.anchor]
+
+    def sequence(self, start_event: Any) -> list:
+        '''Return the list with the items of the sequence.'''
+        tag = start_event.tag
+        if tag is None or tag == '!':
+            tag = self.resolve(SequenceNode, None, start_event.implicit)
+        if tag != _SEQ_TAG:
+            raise _Unsupported
+        data = []  # type: list
+        if start_event.anchor is not None:
+            self.anchors[start_event.anchor] = data
+        get_event, node = self.get_event, self.node
+        event = get_event()
+        while not isinstance(event, SequenceEndEvent):
+            data.append(node(event))
+            event = get_event()
+        return data
+
+    def streamed(self, start_event: Any, stream: Callable[[Iterator], Any]) -> Any:
+        '''Return the result of stream called with an iterator of the items of the sequence,
+            or the constructed object if it's not a list.'''
+        if not isinstance(start_event, SequenceStartEvent) or start_event.anchor is not None:
+            return self.node(start_event)
+        tag = start_event.tag
+        if tag is None or tag == '!':
+            tag = self.resolve(SequenceNode, None, start_event.implicit)
+        if tag != _SEQ_TAG:
+            return self.node(start_event)
+        items = self.items()
+        try:
+            data = stream(items)
+        except _ItemError as exc:
+            raise exc.args[0] from None
+        # the parser must be at the end of the sequence
+        for _ in items:
+            pass
+        return data
+
+    def items(self) -> Iterator[Any]:
+        '''Yield the items of the sequence being parsed as they are constructed.'''
+        get_event, node = self.get_event, self.node
+        event = get_event()
+        while not isinstance(event, SequenceEndEvent):
+            try:
+                item = node(event)
+            except (SettingsValueError, _Unsupported) as exc:
+                raise _ItemError(exc)
+            yield item
+            event = get_event()
+
+    def mapping(self, start_event: Any, streams: Optional[Streams] = None) -> Dict:
+        '''Return the dictionary with the keys of the mapping,
+            raise SettingsValueError if there's a duplicate key.
+            Keys from merged mappings (<<) can be overridden, as in YAML.
+            The lists of the keys in streams are given to those functions, see load.'''
+        tag = start_event.tag
+        if tag is None or tag == '!':
+            tag = self.resolve(MappingNode, None, start_event.implicit)
+        if tag != _MAP_TAG:
+            raise _Unsupported
+        anchor = start_event.anchor
+        if anchor is not None:
+            self.open_anchors.add(anchor)
+
+        merged = None  # type: Optional[Dict]
+        mapping = {}  # type: Dict
+        get_event, node = self.get_event, self.node
+        event = get_event()
+        while not isinstance(event, MappingEndEvent):
+            if isinstance(event, ScalarEvent):
+                tag = self.scalar_tag(event)
+                if tag == _MERGE_TAG:
+                    if merged is not None or event.anchor is not None:
+                        raise _Unsupported  # ruamel.yaml warns about a second <<
+                    merged = self.merge(node(get_event()))
+                    event = get_event()
+                    continue
+                key = self.scalar(event, _STR_TAG if tag == _VALUE_TAG else tag)
+            else:
+                key = node(event)
+            if key in mapping:
+                raise SettingsValueError("Duplicate label {}!".format(key))
+            stream = streams.get(key) if streams else None
+            if stream is None:
+                mapping[key] = node(get_event())
+            else:
+                mapping[key] = self.streamed(get_event(), stream)
+            event = get_event()
+
+        if merged:
+            merged.update(mapping)
+            mapping = merged
+        if anchor is not None:
+            self.open_anchors.discard(anchor)
+            self.anchors[anchor] = mapping
+        return mapping
+
+    @staticmethod
+    def merge(value: Any) -> Dict:
+        '''Return a new dictionary with the merged mapping or list of mappings,
+            the first mappings take precedence.'''
+        if isinstance(value, dict):
+            return dict(value)
+        if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+            raise _Unsupported  # ruamel.yaml raises the error
+        merged = {}  # type: Dict
+        for item in reversed(value):
+            merged.update(item)
+        return merged
@@ -125,9 +125,9 @@ setup(
     # To provide executable scripts, use entry points in preference to the
     # "scripts" keyword. Entry points provide cross-platform support and allow
     # pip to create the appropriate form of executable for the target platform.
-#    entry_points={
-#        'console_scripts': [
-#            'settings_parser = settings_parser.commandline:main',
-#        ],
-#    },
+    entry_points={
+        'console_scripts': [
+            'settings_parser_benchmarks = settings_parser.benchmarks.suite:main',
+        ],
+    },
 )